@@ -0,0 +1,88 @@
+# 更新页面时先创建新页面，旧页面放入归档队列，运行结束时再并发、分批归档。
+# 队列写在磁盘上，程序中断后下次运行会继续归档上次没有归档的页面
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import archive_queue_path
+from console import echo
+
+ARCHIVE_BATCH_SIZE = 50  # 每批并发归档的页面数，每批完成后写盘
+
+
+class ArchiveQueue:
+    """待归档的旧页面 page_id -> 标题"""
+
+    def __init__(self, path):
+        self.path = path
+        self._pages = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._pages is None:
+            self._pages = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._pages = json.load(f)
+                except (OSError, ValueError) as e:
+                    echo(f"⚠️归档队列{self.path}读取失败: {e}")
+        return self._pages
+
+    def _save(self):
+        if not self._pages and not os.path.exists(self.path):
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._pages, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def add(self, page_id, title):
+        with self._lock:
+            self._load()[page_id] = title
+            self._save()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+    def drain(self, api_key, workers=4):
+        """并发归档队列中的所有页面，返回 (成功数, 失败数)，失败的页面留在队列中下次重试"""
+        with self._lock:
+            pending = list(self._load().items())
+        if not pending:
+            return 0, 0
+        # 队列为空时不导入requests，没有需要同步的文件时启动更快
+        from notion_http import get_client
+
+        client = get_client(api_key)
+
+        def archive(item):
+            page_id, title = item
+            response = client.patch(f"/pages/{page_id}", json={"archived": True})
+            # 404表示页面已经被删除或归档，不需要再处理
+            if response.status_code in (200, 404):
+                return True
+            echo(f"❌旧页面《{title}》归档失败: {response.text}")
+            return False
+
+        archived = 0
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for start in range(0, len(pending), ARCHIVE_BATCH_SIZE):
+                batch = pending[start : start + ARCHIVE_BATCH_SIZE]
+                done = [
+                    page_id
+                    for (page_id, _), ok in zip(batch, executor.map(archive, batch))
+                    if ok
+                ]
+                with self._lock:
+                    for page_id in done:
+                        self._pages.pop(page_id, None)
+                    self._save()
+                archived += len(done)
+        failed = len(pending) - archived
+        echo(f"已归档{archived}个旧页面" + (f"，{failed}个失败" if failed else ""))
+        return archived, failed
+
+
+archive_queue = ArchiveQueue(archive_queue_path)
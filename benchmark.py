@@ -0,0 +1,663 @@
+# 性能基准测试
+# python benchmark.py inline             对比行内格式解析的新旧实现
+# python benchmark.py corpus DIR         生成测试用的markdown语料
+# python benchmark.py parse -o out.json  测试解析器各入口的吞吐量和峰值内存，可与基准结果比较
+# python benchmark.py e2e --files 50     用本地模拟的Notion API测试完整同步的吞吐量
+# python benchmark.py startup --target 300  测试没有文件需要同步时main.py的启动耗时
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import threading
+import tracemalloc
+from datetime import datetime
+from urllib.request import urlopen
+from markdown_parser import (
+    iter_blocks,
+    parse_markdown,
+    process_rich_text,
+    process_plain_text,
+    create_text_element,
+)
+
+
+def legacy_process_plain_text(text):
+    """旧版本的实现：每种样式一次正则扫描，作为对比基准"""
+    pieces = []
+    format_patterns = [
+        (r"\*\*(.*?)\*\*", "bold"),
+        (r"\*(.*?)\*", "italic"),
+        (r"~~(.*?)~~", "strikethrough"),
+        (r"`(.*?)`", "code"),
+        (r"<u>(.*?)</u>", "underline"),
+    ]
+    last_end = 0
+    for pattern, style in format_patterns:
+        for match in re.finditer(pattern, text):
+            if match.start() > last_end:
+                pieces.append(
+                    create_text_element(text[last_end : match.start()], False)
+                )
+            pieces.append(create_text_element(match.group(1), True, style))
+            last_end = match.end()
+    if last_end < len(text):
+        pieces.append(create_text_element(text[last_end:], False))
+    return pieces
+
+
+# 行内格式密集的文本和普通文章中偶尔出现格式的文本
+PARAGRAPH_UNITS = {
+    "dense": "普通文本 plain text **粗体** *斜体* ~~删除线~~ `code` <u>下划线</u> ***粗斜体*** ",
+    "prose": "这是一段比较长的普通文字，其中偶尔会出现 **强调** 的内容，"
+    "以及少量的 `inline code` 和 *斜体*，其余都是没有格式的正文。" * 4,
+}
+
+
+def make_paragraph(length, style="dense"):
+    """生成包含各种行内格式的长段落"""
+    unit = PARAGRAPH_UNITS[style]
+    return (unit * (length // len(unit) + 1))[:length]
+
+
+def time_function(func, text, min_time=0.1):
+    """重复调用直到累计时间超过min_time，返回每秒处理的字符数"""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func(text)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return len(text) * calls / elapsed
+
+
+def compare_throughput(funcs, text, rounds=7):
+    """交替测量几个函数，每个函数取各轮中最快的一次，减少机器负载波动对加速比的影响"""
+    best = [0.0] * len(funcs)
+    for _ in range(rounds):
+        for i, func in enumerate(funcs):
+            best[i] = max(best[i], time_function(func, text))
+    return best
+
+
+def bench_inline(args):
+    """对比新旧实现的吞吐量和输出的富文本片段数（旧实现会输出重叠、重复的片段）"""
+    print(
+        f"{'文本':>6} {'长度':>8} {'旧实现MB/s':>10} {'新实现MB/s':>10} {'加速比':>6} "
+        f"{'旧片段数':>8} {'新片段数':>8}"
+    )
+    for style in PARAGRAPH_UNITS:
+        for length in args.lengths:
+            text = make_paragraph(length, style)
+            legacy, current = compare_throughput(
+                (legacy_process_plain_text, process_plain_text), text
+            )
+            print(
+                f"{style:>6} {length:>8} {legacy / 1e6:>10.2f} {current / 1e6:>10.2f} "
+                f"{current / legacy:>6.2f} {len(legacy_process_plain_text(text)):>8} "
+                f"{len(process_plain_text(text)):>8}"
+            )
+
+
+# ---------------------------------------------------------------------------
+# 语料生成：相同的类型、大小和随机种子总是生成完全相同的内容
+
+WORDS = ["markdown", "notion", "sync", "python", "block", "page", "token", "cache"]
+CJK_TEXT = "这是一段用于测试的中文内容，包含常见的汉字和标点符号。笔记同步到数据库以后可以在手机上查看。"
+CODE_LINES = [
+    "def handler(event, context):",
+    "    result = [item * 2 for item in event.get('items', [])]",
+    "    if not result:",
+    "        return None",
+    "    # 注释不应被解析为标题",
+    "    return {'status': 200, 'body': json.dumps(result)}",
+    "",
+]
+
+
+def _words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def _inline_line(rng):
+    parts = []
+    for _ in range(rng.randint(3, 8)):
+        word = _words(rng, rng.randint(1, 4))
+        style = rng.randrange(7)
+        if style == 0:
+            word = f"**{word}**"
+        elif style == 1:
+            word = f"*{word}*"
+        elif style == 2:
+            word = f"`{word}`"
+        elif style == 3:
+            word = f"~~{word}~~"
+        elif style == 4:
+            word = f"<u>{word}</u>"
+        elif style == 5:
+            word = f"***{word}***"
+        parts.append(word)
+    return " ".join(parts)
+
+
+def _heading_section(rng):
+    level = rng.randint(1, 6)
+    lines = ["#" * level + " " + _words(rng, rng.randint(2, 6))]
+    lines += [_words(rng, rng.randint(5, 15)) for _ in range(rng.randint(0, 2))]
+    lines.append("")
+    return lines
+
+
+def _code_section(rng, min_lines=200, max_lines=2000):
+    body = [CODE_LINES[i % len(CODE_LINES)] for i in range(rng.randint(min_lines, max_lines))]
+    return ["```python"] + body + ["```", ""]
+
+
+def _inline_section(rng):
+    return [_inline_line(rng) for _ in range(rng.randint(1, 5))] + [""]
+
+
+def _images_section(rng):
+    n = rng.randint(1, 1000000)
+    lines = [
+        f"![image-{n}](https://img.example.com/blog/image-{n}.png)",
+        f"参考 [文档 {n}](https://example.com/docs/{n}) 和 [链接](http://example.org/{n}?q=1)",
+    ]
+    if rng.random() < 0.2:
+        lines.append(f'<iframe src="//player.bilibili.com/player.html?bvid={n}" ></iframe>')
+    return lines + [""]
+
+
+def _cjk_section(rng):
+    start = rng.randrange(len(CJK_TEXT))
+    line = (CJK_TEXT[start:] + CJK_TEXT * 3)[: rng.randint(20, 200)]
+    prefix = rng.choice(["", "", "- ", "> ", "1. "])
+    return [prefix + line, ""]
+
+
+def _mixed_section(rng):
+    section = rng.choice(list(SECTION_GENERATORS.values())[:-1])
+    if section is _code_section:
+        # 混合语料中的代码块短一些，否则几KB的语料往往只有一个代码块
+        return _code_section(rng, 3, 30)
+    return section(rng)
+
+
+SECTION_GENERATORS = {
+    "headings": _heading_section,
+    "code": _code_section,
+    "inline": _inline_section,
+    "images": _images_section,
+    "cjk": _cjk_section,
+    "mixed": _mixed_section,
+}
+
+
+def generate_corpus(kind, size, seed=0):
+    """生成大约size字节（UTF-8）的指定类型的markdown文本"""
+    rng = random.Random(f"{kind}-{size}-{seed}")
+    section = SECTION_GENERATORS[kind]
+    lines, total = [], 0
+    while total < size:
+        for line in section(rng):
+            lines.append(line)
+            total += len(line.encode("utf-8")) + 1
+    return "\n".join(lines) + "\n"
+
+
+def parse_size(text):
+    """把 1KB、10MB 这样的大小转换为字节数"""
+    units = {"KB": 1024, "MB": 1024**2, "GB": 1024**3, "B": 1}
+    text = text.strip().upper()
+    for unit, factor in units.items():
+        if text.endswith(unit):
+            return int(float(text[: -len(unit)]) * factor)
+    return int(text)
+
+
+def write_corpus(directory, kinds, sizes, seed=0):
+    """把语料写入目录，返回 [(类型, 大小, 文件路径)]"""
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for kind in kinds:
+        for size_text in sizes:
+            path = os.path.join(directory, f"{kind}-{size_text}.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(generate_corpus(kind, parse_size(size_text), seed))
+            files.append((kind, size_text, path))
+    return files
+
+
+def bench_corpus(args):
+    for kind, size, path in write_corpus(args.directory, args.kinds, args.sizes, args.seed):
+        print(f"{path}  {os.path.getsize(path)}字节")
+
+
+# ---------------------------------------------------------------------------
+# 解析器基准测试
+
+
+def _run_parse_markdown(path, lines):
+    return len(parse_markdown(path))
+
+
+def _run_iter_blocks(path, lines):
+    return sum(1 for _ in iter_blocks(path))
+
+
+def _run_process_rich_text(path, lines):
+    return sum(len(process_rich_text(line)) for line in lines)
+
+
+def _run_process_plain_text(path, lines):
+    return sum(len(process_plain_text(line)) for line in lines)
+
+
+# 入口名称 -> 函数，返回生成的块数（或富文本片段数）
+ENTRY_POINTS = {
+    "parse_markdown": _run_parse_markdown,
+    "iter_blocks": _run_iter_blocks,
+    "process_rich_text": _run_process_rich_text,
+    "process_plain_text": _run_process_plain_text,
+}
+
+
+def measure(func, path, lines, repeat=3, memory=True):
+    """运行repeat次取最短耗时，返回耗时、输出数量和峰值内存（字节，不统计时为None）"""
+    elapsed = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func(path, lines)
+        run_time = time.perf_counter() - start
+        elapsed = run_time if elapsed is None else min(elapsed, run_time)
+    peak = None
+    if memory:
+        # 单独运行一次统计内存，避免tracemalloc影响计时
+        tracemalloc.start()
+        func(path, lines)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, count, peak
+
+
+def bench_parse(args):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for kind, size, path in write_corpus(directory, args.kinds, args.sizes, args.seed):
+            with open(path, "r", encoding="utf-8") as f:
+                # 行内格式的入口按行处理，与parse_line传入的内容一致；行数只统计非空行
+                lines = [line.strip() for line in f if line.strip()]
+            for entry in args.entries:
+                elapsed, count, peak = measure(
+                    ENTRY_POINTS[entry], path, lines, args.repeat, not args.no_memory
+                )
+                result = {
+                    "corpus": kind,
+                    "size": size,
+                    "bytes": os.path.getsize(path),
+                    "entry": entry,
+                    "seconds": elapsed,
+                    "lines_per_sec": len(lines) / elapsed if elapsed else None,
+                    "blocks_per_sec": count / elapsed if elapsed else None,
+                    "peak_memory": peak,
+                }
+                results.append(result)
+                memory = f"{peak / 1024 / 1024:8.2f}MB" if peak is not None else "       -"
+                print(
+                    f"{kind:>8} {size:>6} {entry:>18} {result['lines_per_sec']:>12.0f}行/s "
+                    f"{result['blocks_per_sec']:>12.0f}块/s 峰值{memory}"
+                )
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        return compare_with_baseline(results, args.baseline, args.max_regression)
+    return 0
+
+
+def compare_with_baseline(results, baseline_path, max_regression):
+    """与基准结果比较吞吐量，任一项下降超过max_regression时返回1"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {
+            (r["corpus"], r["size"], r["entry"]): r for r in json.load(f)["results"]
+        }
+    regressions = 0
+    for result in results:
+        base = baseline.get((result["corpus"], result["size"], result["entry"]))
+        if not base or not base["lines_per_sec"] or not result["lines_per_sec"]:
+            continue
+        change = result["lines_per_sec"] / base["lines_per_sec"] - 1
+        if change < -max_regression:
+            regressions += 1
+            print(
+                f"❌{result['corpus']}-{result['size']} {result['entry']} "
+                f"吞吐量下降{-change:.0%}"
+            )
+    if regressions:
+        print(f"共{regressions}项性能下降超过{max_regression:.0%}")
+        return 1
+    print("✅与基准结果相比没有明显的性能下降")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# 端到端基准测试：启动本地模拟的Notion API，用子进程运行main.py同步生成的语料
+
+
+def bench_e2e(args):
+    from mock_notion_server import create_server
+
+    server = create_server(
+        port=0,
+        latency=args.latency,
+        rate=args.rate,
+        burst=args.burst,
+        error_rate=args.error_rate,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory() as directory:
+        rng = random.Random(args.seed)
+        size = parse_size(args.size)
+        for i in range(args.files):
+            kind = rng.choice(args.kinds)
+            path = os.path.join(directory, f"{kind}-{i:04d}.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(generate_corpus(kind, size, args.seed + i))
+
+        # 注意：.env.local 中的配置会覆盖这里的环境变量
+        env = dict(
+            os.environ,
+            NOTION_BASE_URL=base_url + "/v1",
+            API_KEY="mock",
+            DATABASE_ID="mock-database",
+            BASE_DIRECTORY=directory,
+            IMAGE_HOST_URL="https://example.com/",
+            LOCAL_IMAGE_PATH="",
+            CHECKPOINT_PATH=os.path.join(directory, ".checkpoints.json"),
+            PARSE_CACHE_DIR=os.path.join(directory, ".parse_cache"),
+            RETRY_BACKOFF="0.1",
+        )
+        command = [sys.executable, "main.py", "--no-manifest", "-j", str(args.workers)]
+        start = time.perf_counter()
+        result = subprocess.run(
+            command + args.extra,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=not args.verbose,
+            text=True,
+        )
+        elapsed = time.perf_counter() - start
+
+    with urlopen(base_url + "/_stats") as response:
+        stats = json.load(response)
+    server.shutdown()
+    server.server_close()
+
+    if result.returncode != 0:
+        print(result.stderr or "")
+        print(f"❌main.py 退出码为{result.returncode}")
+        return 1
+    total = stats.pop("total_requests")
+    print(f"\n{args.files}个文件，每个约{args.size}，{args.workers}个线程")
+    print(f"耗时{elapsed:.1f}秒，{args.files / elapsed * 60:.0f}个文件/分钟")
+    print(
+        f"共{total}个请求，平均每个文件{total / args.files:.1f}个请求，"
+        f"429共{stats['throttled']}次，5xx共{stats['errors']}次，"
+        f"发送{stats['bytes_received'] / 1024:.0f}KB"
+    )
+    for key in sorted(k for k in stats if " " in k):
+        print(f"  {key:<32} {stats[key]}")
+    if args.output:
+        record = {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "files": args.files,
+            "size": args.size,
+            "workers": args.workers,
+            "latency": args.latency,
+            "rate": args.rate,
+            "error_rate": args.error_rate,
+            "elapsed": elapsed,
+            "files_per_minute": args.files / elapsed * 60,
+            "requests_per_file": total / args.files,
+            "requests": dict(stats, total_requests=total),
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# 启动耗时：cron或git hook调用时通常没有文件需要同步，这时的耗时几乎全部是启动和导入模块。
+# 所有文件都已记录在同步清单中，用子进程多次运行main.py，并用 -X importtime 列出最慢的导入
+
+# 只有真正需要同步时才应该导入的模块
+HEAVY_MODULES = ("requests", "obs", "PIL", "markdown_parser", "notion_api")
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 [(模块, 自身耗时微秒, 累计耗时微秒, 嵌套层数)]"""
+    imports = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return imports
+
+
+def time_command(command, env, repeat):
+    """运行repeat次，返回每次的耗时（秒），命令失败时抛出RuntimeError"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            command,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr or f"退出码为{result.returncode}")
+    return times
+
+
+def bench_startup(args):
+    from sync_manifest import SyncManifest, file_snapshot
+
+    with tempfile.TemporaryDirectory() as directory:
+        docs = os.path.join(directory, "docs")
+        os.makedirs(docs)
+        manifest = SyncManifest(os.path.join(directory, "manifest.json"))
+        for i in range(args.files):
+            path = os.path.join(docs, f"note-{i:04d}.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(generate_corpus("mixed", 1024, args.seed + i))
+            manifest.record(path, None, file_snapshot(path))
+        manifest.save()
+
+        # 注意：.env.local 中的配置会覆盖这里的环境变量。
+        # NOTION_BASE_URL指向不存在的服务，意外访问Notion时请求会立即失败
+        env = dict(
+            os.environ,
+            API_KEY="mock",
+            DATABASE_ID="mock-database",
+            BASE_DIRECTORY=docs,
+            MANIFEST_PATH=manifest.path,
+            REPORT_PATH=os.path.join(directory, "report.json"),
+            ARCHIVE_QUEUE_PATH=os.path.join(directory, "archive_queue.json"),
+            NOTION_BASE_URL="http://127.0.0.1:9/v1",
+            IMAGE_HOST_URL="https://example.com/",
+            MAX_RETRIES="0",
+        )
+        command = ["main.py"] + (args.extra or ["sync"])
+        try:
+            interpreter = time_command([sys.executable, "-c", "pass"], env, args.repeat)
+            times = time_command([sys.executable] + command, env, args.repeat)
+        except RuntimeError as e:
+            print(e)
+            print("❌main.py 运行失败")
+            return 1
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime"] + command,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        imports = parse_importtime(result.stderr)
+
+    median = statistics.median(times)
+    baseline = statistics.median(interpreter)
+    print(f"python main.py {' '.join(command[1:])}，{args.files}个未修改的文件，运行{args.repeat}次")
+    print(
+        f"耗时中位数{median * 1000:.0f}ms（最短{min(times) * 1000:.0f}ms），"
+        f"其中Python解释器启动{baseline * 1000:.0f}ms"
+    )
+    top_level = sorted(
+        (i for i in imports if i[3] == 0), key=lambda i: i[2], reverse=True
+    )
+    print(f"导入最慢的{args.top}个模块（累计耗时）：")
+    for name, _, cumulative, _ in top_level[: args.top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+    loaded = sorted({i[0] for i in imports} & set(HEAVY_MODULES))
+    if loaded:
+        print(f"⚠️导入了只有同步时才需要的模块：{'、'.join(loaded)}")
+
+    if args.output:
+        record = {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "command": command[1:],
+            "files": args.files,
+            "times": times,
+            "median": median,
+            "interpreter": baseline,
+            "imports": [
+                {"module": name, "self_us": self_us, "cumulative_us": cumulative}
+                for name, self_us, cumulative, depth in top_level
+            ],
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+    if args.target and median * 1000 > args.target:
+        print(f"❌启动耗时{median * 1000:.0f}ms，超过目标{args.target:.0f}ms")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="md2notion 性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    inline = subparsers.add_parser("inline", help="行内格式解析（process_plain_text）")
+    inline.add_argument(
+        "--lengths",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000, 100000],
+        help="测试的段落长度（字符数）",
+    )
+    inline.set_defaults(func=bench_inline)
+
+    def add_corpus_arguments(sub, default_sizes):
+        sub.add_argument(
+            "--kinds",
+            nargs="+",
+            choices=list(SECTION_GENERATORS),
+            default=list(SECTION_GENERATORS),
+            help="语料类型",
+        )
+        sub.add_argument(
+            "--sizes", nargs="+", default=default_sizes, help="语料大小，例如 1KB 100MB"
+        )
+        sub.add_argument("--seed", type=int, default=0, help="随机种子")
+
+    corpus = subparsers.add_parser("corpus", help="生成测试用的markdown语料")
+    corpus.add_argument("directory", help="输出目录")
+    add_corpus_arguments(corpus, ["1KB", "1MB", "100MB"])
+    corpus.set_defaults(func=bench_corpus)
+
+    parse = subparsers.add_parser("parse", help="解析器各入口的吞吐量和峰值内存")
+    add_corpus_arguments(parse, ["1KB", "100KB", "1MB"])
+    parse.add_argument(
+        "--entries",
+        nargs="+",
+        choices=list(ENTRY_POINTS),
+        default=list(ENTRY_POINTS),
+        help="要测试的解析入口",
+    )
+    parse.add_argument("--repeat", type=int, default=3, help="每项运行的次数，取最快的一次")
+    parse.add_argument("--no-memory", action="store_true", help="不统计峰值内存")
+    parse.add_argument("-o", "--output", help="把结果保存为JSON文件")
+    parse.add_argument("--baseline", help="与之前保存的JSON结果比较")
+    parse.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.1,
+        help="允许的吞吐量下降比例，超过时退出码为1（默认0.1）",
+    )
+    parse.set_defaults(func=bench_parse)
+
+    e2e = subparsers.add_parser("e2e", help="用本地模拟的Notion API测试完整同步")
+    e2e.add_argument("--files", type=int, default=20, help="生成的文件数")
+    e2e.add_argument("--size", default="10KB", help="每个文件的大小")
+    e2e.add_argument(
+        "--kinds",
+        nargs="+",
+        choices=list(SECTION_GENERATORS),
+        default=["headings", "inline", "cjk", "mixed"],
+        help="语料类型",
+    )
+    e2e.add_argument("--seed", type=int, default=0, help="随机种子")
+    e2e.add_argument("-j", "--workers", type=int, default=4, help="main.py 的线程数")
+    e2e.add_argument("--latency", type=float, default=100, help="模拟的响应延迟（毫秒）")
+    e2e.add_argument("--rate", type=float, default=3, help="模拟的限流速率，0为不限流")
+    e2e.add_argument("--burst", type=float, default=3, help="模拟的突发请求数")
+    e2e.add_argument("--error-rate", type=float, default=0, help="随机返回5xx的概率")
+    e2e.add_argument("-v", "--verbose", action="store_true", help="显示main.py的输出")
+    e2e.add_argument("-o", "--output", help="把结果保存为JSON文件")
+    e2e.add_argument("extra", nargs="*", help="传给main.py的其他参数，放在 -- 之后")
+    e2e.set_defaults(func=bench_e2e)
+
+    startup = subparsers.add_parser("startup", help="没有文件需要同步时main.py的启动耗时")
+    startup.add_argument("--files", type=int, default=200, help="生成的文件数")
+    startup.add_argument("--seed", type=int, default=0, help="随机种子")
+    startup.add_argument("--repeat", type=int, default=10, help="运行次数，取中位数")
+    startup.add_argument("--top", type=int, default=10, help="列出导入最慢的模块数")
+    startup.add_argument(
+        "--target",
+        type=float,
+        default=0,
+        help="启动耗时的目标（毫秒），中位数超过时退出码为1，0为不检查",
+    )
+    startup.add_argument("-o", "--output", help="把结果保存为JSON文件")
+    startup.add_argument(
+        "extra", nargs="*", help="main.py的子命令和参数，放在 -- 之后（默认sync）"
+    )
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+
+if __name__ == "__main__":
+    main()
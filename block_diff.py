@@ -0,0 +1,164 @@
+# 增量更新：对比页面现有的块和新解析的块，只发送有变化的块
+from difflib import SequenceMatcher
+from notion_http import get_client
+from payload import iter_batches
+from console import echo
+
+# 可以通过 PATCH /blocks/{id} 原地修改内容的块类型
+UPDATABLE_TYPES = {
+    "paragraph",
+    "heading_1",
+    "heading_2",
+    "heading_3",
+    "bulleted_list_item",
+    "numbered_list_item",
+    "quote",
+    "code",
+    "equation",
+    "embed",
+    "image",
+}
+
+
+def get_page_blocks(api_key, page_id):
+    """分页获取页面的所有顶层块，失败返回None"""
+    blocks = []
+    params = {"page_size": 100}
+    while True:
+        response = get_client(api_key).get(f"/blocks/{page_id}/children", params=params)
+        if response.status_code != 200:
+            echo(f"❌获取页面内容失败: {response.text}")
+            return None
+        data = response.json()
+        blocks.extend(data.get("results", []))
+        if not data.get("has_more"):
+            return blocks
+        params["start_cursor"] = data["next_cursor"]
+
+
+def _rich_text_signature(rich_text):
+    """把富文本归一化为(内容, 链接, 样式, 颜色)的元组，合并样式相同的相邻片段"""
+    spans = []
+    for span in rich_text:
+        text = span.get("text") or {}
+        content = text.get("content", span.get("plain_text", ""))
+        if not content:
+            continue
+        link = (text.get("link") or {}).get("url")
+        annotations = span.get("annotations") or {}
+        flags = tuple(sorted(k for k, v in annotations.items() if v is True))
+        color = annotations.get("color", "default")
+        if spans and spans[-1][1:] == (link, flags, color):
+            spans[-1] = (spans[-1][0] + content, link, flags, color)
+        else:
+            spans.append((content, link, flags, color))
+    return tuple(spans)
+
+
+def block_signature(block):
+    """计算块的内容签名，解析得到的块和从Notion读取的块内容相同时签名相同"""
+    block_type = block["type"]
+    body = block.get(block_type) or {}
+    if "rich_text" in body:
+        return (
+            block_type,
+            _rich_text_signature(body["rich_text"]),
+            body.get("color", "default"),
+            body.get("language"),
+        )
+    if block_type == "equation":
+        return (block_type, body.get("expression"))
+    if block_type in ("embed", "bookmark"):
+        return (block_type, body.get("url"))
+    if block_type == "image":
+        source = body.get(body.get("type"), {})
+        return (block_type, source.get("url"))
+    return (block_type,)
+
+
+def plan_block_changes(old_blocks, new_blocks):
+    """用最长公共子序列对比新旧块，返回按文档顺序排列的操作列表：
+
+    ("keep", old_id) / ("update", old_id, block) / ("delete", old_id) / ("insert", block)
+    """
+    old_sigs = [block_signature(b) for b in old_blocks]
+    new_sigs = [block_signature(b) for b in new_blocks]
+    matcher = SequenceMatcher(None, old_sigs, new_sigs, autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.extend(("keep", old_blocks[i]["id"]) for i in range(i1, i2))
+            continue
+        olds, news = old_blocks[i1:i2], new_blocks[j1:j2]
+        # 同类型的块两两原地修改，其余的删除或插入
+        for old, new in zip(olds, news):
+            if old["type"] == new["type"] and new["type"] in UPDATABLE_TYPES:
+                ops.append(("update", old["id"], new))
+            else:
+                ops.append(("delete", old["id"]))
+                ops.append(("insert", new))
+        ops.extend(("delete", old["id"]) for old in olds[len(news) :])
+        ops.extend(("insert", new) for new in news[len(olds) :])
+    return ops
+
+
+def update_page_blocks(api_key, page_id, new_blocks):
+    """把页面内容增量更新为new_blocks。
+
+    返回发送的修改请求数；无法增量更新时（例如需要在页面最前面插入块）返回None，
+    由调用方改为重建页面。
+    """
+    old_blocks = get_page_blocks(api_key, page_id)
+    if old_blocks is None:
+        return None
+    ops = plan_block_changes(old_blocks, new_blocks)
+
+    # Notion只能在某个块之后插入，不能插入到第一个块之前
+    for op in ops:
+        if op[0] in ("keep", "update"):
+            break
+        if op[0] == "insert":
+            if any(o[0] in ("keep", "update") for o in ops):
+                return None
+            break
+
+    client = get_client(api_key)
+    requests_sent = 0
+    anchor = None  # 最终文档中位于当前位置之前的最后一个块
+    pending = []
+
+    def flush():
+        nonlocal anchor, requests_sent
+        for batch in iter_batches(pending):
+            payload = {"children": batch}
+            if anchor:
+                payload["after"] = anchor
+            response = client.patch(f"/blocks/{page_id}/children", json=payload)
+            requests_sent += 1
+            if response.status_code != 200:
+                raise RuntimeError(f"追加块失败: {response.text}")
+            anchor = response.json()["results"][-1]["id"]
+        pending.clear()
+
+    for op in ops:
+        kind = op[0]
+        if kind == "insert":
+            pending.append(op[1])
+            continue
+        if kind == "delete":
+            response = client.delete(f"/blocks/{op[1]}")
+            requests_sent += 1
+            if response.status_code != 200:
+                raise RuntimeError(f"删除块失败: {response.text}")
+            continue
+        flush()
+        if kind == "update":
+            block = op[2]
+            body = {block["type"]: block[block["type"]]}
+            response = client.patch(f"/blocks/{op[1]}", json=body)
+            requests_sent += 1
+            if response.status_code != 200:
+                raise RuntimeError(f"修改块失败: {response.text}")
+        anchor = op[1]
+    flush()
+    return requests_sent
@@ -0,0 +1,61 @@
+# 长文档分批追加块时的断点记录，上传中断后从上次成功的位置继续
+import json
+import os
+import threading
+from config import checkpoint_path
+
+
+class CheckpointStore:
+    """记录 文件路径 -> (page_id, 已追加到的块序号, 文件hash)，每批追加成功后立即写盘。
+
+    更新页面时还记录被新页面取代的旧页面（replaces），新页面上传完成后才归档旧页面。
+    digest为生成这些块时的解析和拆分配置，配置变化后块序号不再对应
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"⚠️断点文件{self.path}读取失败: {e}")
+        return self._entries
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, file_path):
+        with self._lock:
+            return self._load().get(os.path.abspath(file_path))
+
+    def set(
+        self, file_path, page_id, index, file_hash, action, replaces=None, digest=None
+    ):
+        with self._lock:
+            self._load()[os.path.abspath(file_path)] = {
+                "page_id": page_id,
+                "index": index,
+                "hash": file_hash,
+                "action": action,
+                "replaces": replaces,
+                "digest": digest,
+            }
+            self._save()
+
+    def clear(self, file_path):
+        with self._lock:
+            if self._load().pop(os.path.abspath(file_path), None) is not None:
+                self._save()
+
+
+checkpoints = CheckpointStore(checkpoint_path)
@@ -1,23 +1,106 @@
 # 用户自定义数据
+# 第一次读取配置项时才加载.env文件（导入python-dotenv需要十几毫秒），
+# 只用到解析器等不需要配置的模块时不会加载。用法不变：from config import api_key
 import os
-from dotenv import load_dotenv
+import threading
 
 env_path = os.path.join(os.getcwd(), ".env")
 env_local_path = os.path.join(os.getcwd(), ".env.local")
 
-# 首先加载 .env 文件
-load_dotenv(env_path)
-
-# 然后加载 .env.local 文件，如果存在的话，会覆盖 .env 文件中的同名变量
-# 适用于本地开发环境的配置
-load_dotenv(env_local_path, override=True)
-
-api_key = os.getenv("API_KEY")
-database_id = os.getenv("DATABASE_ID")
-base_directory = os.getenv("BASE_DIRECTORY")
-image_host_url = os.getenv("IMAGE_HOST_URL")
-access_key_id = os.getenv("ACCESS_KEY_ID")
-secret_access_key = os.getenv("SECRET_ACCESS_KEY")
-server = os.getenv("SERVER")
-image_host_path = os.getenv("IMAGE_HOST_PATH")
-local_imgs = os.getenv("LOCAL_IMAGE_PATH")
+_load_lock = threading.Lock()
+_loaded = False
+
+
+def __getattr__(name):
+    """模块中没有的属性：加载配置后再查找一次"""
+    global _loaded
+    if name.startswith("__"):
+        raise AttributeError(name)
+    with _load_lock:
+        if not _loaded:
+            _load_env_files()
+            globals().update(_settings())
+            _loaded = True
+    try:
+        return globals()[name]
+    except KeyError:
+        raise AttributeError(f"module 'config' has no attribute '{name}'") from None
+
+
+def _load_env_files():
+    from dotenv import load_dotenv
+
+    # 首先加载 .env 文件
+    load_dotenv(env_path)
+
+    # 然后加载 .env.local 文件，如果存在的话，会覆盖 .env 文件中的同名变量
+    # 适用于本地开发环境的配置
+    load_dotenv(env_local_path, override=True)
+
+
+def _settings():
+    """读取所有配置项，返回 配置名 -> 值"""
+    api_key = os.getenv("API_KEY")
+    database_id = os.getenv("DATABASE_ID")
+    base_directory = os.getenv("BASE_DIRECTORY")
+    image_host_url = os.getenv("IMAGE_HOST_URL")
+    access_key_id = os.getenv("ACCESS_KEY_ID")
+    secret_access_key = os.getenv("SECRET_ACCESS_KEY")
+    server = os.getenv("SERVER")
+    image_host_path = os.getenv("IMAGE_HOST_PATH") or "blog/"  # 图片在OBS中的目录
+    image_bucket = os.getenv("IMAGE_BUCKET") or "myimgs"  # OBS桶名
+    obs_signature = os.getenv("OBS_SIGNATURE") or "obs"  # 对接S3兼容服务时设为v4
+    obs_path_style = os.getenv("OBS_PATH_STYLE", "").lower() in ("1", "true", "yes")
+    image_upload_workers = int(os.getenv("IMAGE_UPLOAD_WORKERS") or 8)  # 并行上传图片的线程数
+    # 超过该大小（字节）的图片使用分段上传
+    multipart_threshold = int(os.getenv("MULTIPART_THRESHOLD") or 20 * 1024 * 1024)
+    local_imgs = os.getenv("LOCAL_IMAGE_PATH")
+    # 上传前压缩图片（需要安装Pillow）：off 不压缩，webp 转为WebP，jpeg 照片压缩为JPEG，keep 保持原格式重新压缩
+    image_format = (os.getenv("IMAGE_FORMAT") or "off").lower()
+    image_max_width = int(os.getenv("IMAGE_MAX_WIDTH") or 1600)  # 超过该宽度的图片等比缩小，0为不缩小
+    image_quality = int(os.getenv("IMAGE_QUALITY") or 80)  # WebP和JPEG的压缩质量
+    image_cache_dir = os.getenv("IMAGE_CACHE_DIR") or os.path.join(os.getcwd(), ".image_cache")
+    image_optimize_workers = int(os.getenv("IMAGE_OPTIMIZE_WORKERS") or os.cpu_count() or 1)
+
+    # 同步并发配置
+    concurrency = int(os.getenv("CONCURRENCY") or 4)  # 同时上传的文件数
+    notion_rate_limit = float(os.getenv("NOTION_RATE_LIMIT") or 3)  # 每秒请求数
+    http_pool_size = int(os.getenv("HTTP_POOL_SIZE") or 10)  # 复用的HTTP连接数
+    http_timeout = float(os.getenv("HTTP_TIMEOUT") or 30)  # 单个请求的超时时间（秒）
+    # 启动时一次性分页读取数据库建立标题索引，代替每个文件单独查询
+    bulk_index = os.getenv("BULK_INDEX", "").lower() in ("1", "true", "yes")
+    # 本地同步清单，未变化的文件不会再访问Notion
+    manifest_path = os.getenv("MANIFEST_PATH") or os.path.join(
+        os.getcwd(), ".sync_manifest.json"
+    )
+    # 更新页面的方式：recreate 归档旧页面后重新创建，diff 只修改有变化的块
+    update_mode = (os.getenv("UPDATE_MODE") or "recreate").lower()
+    # 长文档分批上传的断点文件
+    checkpoint_path = os.getenv("CHECKPOINT_PATH") or os.path.join(
+        os.getcwd(), ".sync_checkpoints.json"
+    )
+    # 等待归档的旧页面，更新时先创建新页面，运行结束时再统一归档旧页面
+    archive_queue_path = os.getenv("ARCHIVE_QUEUE_PATH") or os.path.join(
+        os.getcwd(), ".sync_archive_queue.json"
+    )
+    max_retries = int(os.getenv("MAX_RETRIES") or 5)  # 429、5xx和网络错误的重试次数
+    retry_backoff = float(os.getenv("RETRY_BACKOFF") or 1)  # 指数退避的初始等待时间（秒）
+    # 请求体的JSON编码器：auto 安装了orjson时使用orjson，json 始终使用标准库
+    json_encoder = (os.getenv("JSON_ENCODER") or "auto").lower()
+    # Notion API地址，离线测试时可以指向 mock_notion_server.py
+    notion_base_url = (os.getenv("NOTION_BASE_URL") or "https://api.notion.com/v1").rstrip("/")
+    # 每次同步结束后写入的JSON运行报告，包括各阶段耗时和请求统计
+    report_path = os.getenv("REPORT_PATH") or os.path.join(os.getcwd(), ".sync_report.json")
+    # 设置后同时写入Prometheus textfile格式的指标，供node_exporter读取
+    prometheus_textfile = os.getenv("PROMETHEUS_TEXTFILE")
+    # 监视模式：文件停止变化多少秒后再同步，以及没有inotify时扫描目录的间隔（秒）
+    watch_debounce = float(os.getenv("WATCH_DEBOUNCE") or 1)
+    watch_poll_interval = float(os.getenv("WATCH_POLL_INTERVAL") or 2)
+    # 并行解析文件的进程数，0表示在上传线程中边解析边上传
+    parse_workers = int(os.getenv("PARSE_WORKERS") or 0)
+    # 解析完成、等待上传的文件数上限，控制解析比上传快时的内存占用
+    parse_queue_size = int(os.getenv("PARSE_QUEUE_SIZE") or 8)
+    # 解析结果的磁盘缓存目录和大小上限（MB），大小设为0时不使用缓存
+    parse_cache_dir = os.getenv("PARSE_CACHE_DIR") or os.path.join(os.getcwd(), ".parse_cache")
+    parse_cache_size = int(float(os.getenv("PARSE_CACHE_SIZE") or 256) * 1024 * 1024)
+    return locals()
@@ -0,0 +1,23 @@
+# 控制台输出：多个线程并发同步文件时，print的内容和换行分两次写出，不同线程的输出会交错。
+# 所有同步过程中的输出都经过echo，整段内容在锁内一次写出，工作线程的输出标明所属的文件
+import os
+import sys
+import threading
+from metrics import metrics
+
+_lock = threading.Lock()
+
+
+def echo(*args, sep=" "):
+    """代替print输出一条消息。
+
+    在工作线程中同步文件时，每行前加上"[文件名] "，交错的逐批进度也能分清是哪个文件的
+    """
+    text = sep.join(str(arg) for arg in args)
+    path = metrics.current_file()
+    if path is not None and threading.current_thread() is not threading.main_thread():
+        prefix = f"[{os.path.basename(path)}] "
+        text = "\n".join(prefix + line if line else line for line in text.split("\n"))
+    with _lock:
+        sys.stdout.write(text + "\n")
+        sys.stdout.flush()
@@ -0,0 +1,120 @@
+# 上传图床前压缩图片：缩小到最大宽度、转换为WebP或重新压缩JPEG/PNG、去掉EXIF等元数据。
+# 需要安装Pillow（pip install Pillow），未安装时图片按原样上传。
+# 压缩结果按原图的内容hash缓存在本地，每张图片只压缩一次
+import hashlib
+import importlib.util
+import os
+import tempfile
+from functools import lru_cache
+from config import image_format, image_max_width, image_quality, image_cache_dir
+from console import echo
+
+# 原图扩展名 -> 各个目标格式下的扩展名，不在表中的格式（SVG、HEIC等）不压缩
+OUTPUT_EXTENSIONS = {
+    ".bmp": {"webp": ".webp", "jpeg": ".jpg", "keep": ".png"},
+    ".gif": {"webp": ".webp", "jpeg": ".gif", "keep": ".gif"},
+    ".jpeg": {"webp": ".webp", "jpeg": ".jpg", "keep": ".jpg"},
+    ".jpg": {"webp": ".webp", "jpeg": ".jpg", "keep": ".jpg"},
+    ".png": {"webp": ".webp", "jpeg": ".png", "keep": ".png"},
+    ".tif": {"webp": ".webp", "jpeg": ".jpg", "keep": ".png"},
+    ".tiff": {"webp": ".webp", "jpeg": ".jpg", "keep": ".png"},
+}
+
+
+@lru_cache(maxsize=None)
+def pillow_installed():
+    # 只检查是否安装，Pillow在压缩图片的进程中才导入，IMAGE_FORMAT=off时不会导入
+    return importlib.util.find_spec("PIL") is not None
+
+
+def optimization_enabled():
+    return image_format != "off" and pillow_installed()
+
+
+def options_tag():
+    """压缩参数的摘要，写在文件名中，修改参数后会重新压缩和上传"""
+    options = f"{image_format}:{image_max_width}:{image_quality}"
+    return hashlib.sha256(options.encode("ascii")).hexdigest()[:8]
+
+
+def _cache_path(digest, ext):
+    return os.path.join(image_cache_dir, f"{digest}-{options_tag()}{ext}")
+
+
+def output_extension(file_path, digest):
+    """返回压缩后的扩展名，不需要压缩或之前压缩时决定使用原图的返回None"""
+    if not optimization_enabled():
+        return None
+    extensions = OUTPUT_EXTENSIONS.get(os.path.splitext(file_path)[1].lower())
+    if extensions is None or os.path.exists(_cache_path(digest, ".orig")):
+        return None
+    return extensions[image_format]
+
+
+def _save(image, path, ext, animated):
+    if ext == ".webp":
+        image.save(path, "WEBP", quality=image_quality, method=4, save_all=animated)
+    elif ext == ".jpg":
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(path, "JPEG", quality=image_quality, optimize=True, progressive=True)
+    elif ext == ".png":
+        image.save(path, "PNG", optimize=True)
+    else:
+        image.save(path, "GIF", optimize=True, save_all=animated)
+
+
+def _keep_original(file_path, digest, before):
+    # 记录使用原图的决定，之后不再尝试压缩这张图片
+    open(_cache_path(digest, ".orig"), "w").close()
+    return file_path, before, before
+
+
+def optimize_image(file_path, digest):
+    """压缩图片，返回 (压缩后的文件路径, 原大小, 压缩后大小)。
+
+    在进程池中运行。无法压缩、压缩失败或压缩后没有变小时返回原图路径。
+    """
+    before = os.path.getsize(file_path)
+    ext = output_extension(file_path, digest)
+    if ext is None:
+        return file_path, before, before
+    output_path = _cache_path(digest, ext)
+    if os.path.exists(output_path):
+        return output_path, before, os.path.getsize(output_path)
+
+    from PIL import Image, ImageOps
+
+    os.makedirs(image_cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=ext, dir=image_cache_dir)
+    os.close(fd)
+    resized = False
+    try:
+        with Image.open(file_path) as image:
+            animated = getattr(image, "is_animated", False)
+            if animated and ext != ".webp" and ext != ".gif":
+                # 动图只能保存为WebP或GIF
+                os.remove(tmp_path)
+                return _keep_original(file_path, digest, before)
+            if not animated:
+                # 按EXIF中的方向旋转，之后保存时不写入EXIF等元数据
+                image = ImageOps.exif_transpose(image)
+                if image_max_width and image.width > image_max_width:
+                    height = round(image.height * image_max_width / image.width)
+                    image = image.resize((image_max_width, height), Image.LANCZOS)
+                    resized = True
+            # 保留ICC色彩配置，去掉EXIF和XMP（拍摄参数、GPS位置等）
+            image.info.pop("exif", None)
+            image.info.pop("xmp", None)
+            _save(image, tmp_path, ext, animated)
+    except Exception as e:
+        echo(f"⚠️图片{os.path.basename(file_path)}压缩失败，按原图上传: {e}")
+        os.remove(tmp_path)
+        return _keep_original(file_path, digest, before)
+
+    after = os.path.getsize(tmp_path)
+    if after >= before and not resized:
+        os.remove(tmp_path)
+        return _keep_original(file_path, digest, before)
+    os.replace(tmp_path, output_path)
+    return output_path, before, after
@@ -1,70 +1,261 @@
 # 使用华为云作为图床，上传图片到OBS
+# 每次同步只遍历一次本地图片目录、只列举一次图床中已有的图片，
+# 图片按内容hash命名，同一张图片无论引用多少次、叫什么名字都只上传一次
+import hashlib
 import os
-from obs import ObsClient
-from config import access_key_id, secret_access_key, server
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from metrics import metrics
+from console import echo
+from image_optimizer import (
+    optimization_enabled,
+    optimize_image,
+    options_tag,
+    output_extension,
+)
+from config import (
+    access_key_id,
+    secret_access_key,
+    server,
+    image_host_url,
+    image_bucket,
+    image_host_path,
+    local_imgs,
+    obs_signature,
+    obs_path_style,
+    image_upload_workers,
+    multipart_threshold,
+    image_optimize_workers,
+    image_cache_dir,
+)
 
+# 支持的文件扩展名列表
+SUPPORTED_EXTENSIONS = {
+    ".bmp",
+    ".gif",
+    ".heic",
+    ".jpeg",
+    ".jpg",
+    ".png",
+    ".svg",
+    ".tif",
+    ".tiff",
+}
 
-def upload_imgs(local_imgs):
+
+def create_obs_client():
     # 初始化华为云OBS客户端
-    obs_client = ObsClient(
+    # 测试时可以把SERVER指向本地的S3兼容服务（例如MinIO），并设置OBS_SIGNATURE=v4、OBS_PATH_STYLE=true
+    # OBS SDK导入较慢，只在确实需要访问图床时导入
+    from obs import ObsClient
+
+    return ObsClient(
         access_key_id=access_key_id,
         secret_access_key=secret_access_key,
         server=server,
+        signature=obs_signature,
+        path_style=obs_path_style,
     )
 
-    bucket_name = "myimgs"
-    base_folder = "blog/"
-
-    def upload_files(directory):
-        # 支持的文件扩展名列表
-        supported_extensions = {
-            ".bmp",
-            ".gif",
-            ".heic",
-            ".jpeg",
-            ".jpg",
-            ".png",
-            ".svg",
-            ".tif",
-            ".tiff",
+
+def content_hash(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def original_key_for(file_path, digest):
+    """按内容hash生成OBS中的文件路径，保留原扩展名"""
+    return image_host_path + digest + os.path.splitext(file_path)[1].lower()
+
+
+def object_key_for(file_path, digest):
+    """图片在OBS中的文件路径，开启图片压缩时文件名中包含压缩参数和压缩后的扩展名"""
+    ext = output_extension(file_path, digest)
+    if ext is None:
+        return original_key_for(file_path, digest)
+    return f"{image_host_path}{digest}-{options_tag()}{ext}"
+
+
+def list_remote_objects(obs_client, bucket, prefix):
+    """分页列举图床中指定前缀下的所有文件"""
+    keys = set()
+    marker = None
+    while True:
+        response = obs_client.listObjects(bucket, prefix=prefix, marker=marker)
+        if response.status >= 300:
+            raise RuntimeError(f"列举图床文件失败，状态码: {response.status}")
+        contents = response.body.contents or []
+        keys.update(content.key for content in contents)
+        if not response.body.is_truncated or not contents:
+            return keys
+        marker = response.body.next_marker or contents[-1].key
+
+
+def find_local_images(directory):
+    """遍历图片目录，返回 文件名 -> 文件路径，同名文件以先找到的为准"""
+    images = {}
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if os.path.splitext(file)[1].lower() in SUPPORTED_EXTENSIONS:
+                images.setdefault(file, os.path.join(root, file))
+    return images
+
+
+def upload_record_path(object_path):
+    """分段上传的断点记录文件，放在图片缓存目录中，不写入本地图片目录"""
+    directory = os.path.join(image_cache_dir, "upload_records")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(object_path) + ".upload_record")
+
+
+def upload_file(obs_client, file_path, object_path):
+    """上传单个文件，超过阈值的大文件使用可断点续传的分段上传。
+
+    返回 (是否成功, 文件大小, 耗时)
+    """
+    size = os.path.getsize(file_path)
+    start = time.monotonic()
+    try:
+        if size > multipart_threshold:
+            response = obs_client.uploadFile(
+                image_bucket,
+                object_path,
+                file_path,
+                partSize=max(5 * 1024 * 1024, multipart_threshold // 2),
+                taskNum=4,
+                enableCheckpoint=True,
+                checkpointFile=upload_record_path(object_path),
+            )
+        else:
+            response = obs_client.putFile(image_bucket, object_path, file_path)
+    except Exception as e:
+        echo(f"图片上传失败: {object_path}, {e}")
+        return False, size, time.monotonic() - start
+    elapsed = time.monotonic() - start
+    if response.status is None or response.status >= 300:
+        echo(f"图片上传失败: {object_path}, 状态码: {response.status}")
+        return False, size, elapsed
+    echo(f"  图片{os.path.basename(file_path)}上传完成，{size / 1024:.0f}KB，耗时{elapsed:.2f}秒")
+    return True, size, elapsed
+
+
+def upload_imgs(local_imgs):
+    """把本地图片目录同步到图床，只上传图床中还没有的图片。
+
+    开启图片压缩时，在进程池中压缩图片，每压缩完一张就开始上传。
+    所有上传线程共用一个ObsClient。返回 文件名 -> OBS中的文件路径，
+    只包含图床中已有或上传成功的图片，上传失败的图片按原文件名生成地址（见get_image_url）
+    """
+    images = find_local_images(local_imgs)
+    digests = {name: content_hash(path) for name, path in images.items()}
+    keys = {name: object_key_for(path, digests[name]) for name, path in images.items()}
+    obs_client = create_obs_client()
+    try:
+        existing = list_remote_objects(obs_client, image_bucket, image_host_path)
+        # 内容相同的图片只上传一次
+        missing = {}
+        for name, object_path in keys.items():
+            if object_path not in existing:
+                missing.setdefault(object_path, (images[name], digests[name]))
+        if not missing:
+            return keys
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=image_upload_workers) as executor:
+            if optimization_enabled():
+                files = optimize_images(missing, keys, existing)
+            else:
+                files = ((object_path, path) for object_path, (path, _) in missing.items())
+            uploads = {
+                executor.submit(upload_file, obs_client, path, object_path): object_path
+                for object_path, path in files
+            }
+            results = {uploads[future]: future.result() for future in uploads}
+        elapsed = time.monotonic() - start
+    finally:
+        obs_client.close()
+
+    uploaded = [size for ok, size, _ in results.values() if ok]
+    total_bytes = sum(uploaded)
+    metrics.count("images_uploaded", len(uploaded))
+    metrics.count("image_bytes_uploaded", total_bytes)
+    echo(
+        f"已上传{len(uploaded)}张新图片到图床，共{total_bytes / 1024 / 1024:.1f}MB，"
+        f"耗时{elapsed:.1f}秒，{total_bytes / 1024 / 1024 / max(elapsed, 1e-6):.2f}MB/s"
+    )
+    failed = {object_path for object_path, (ok, _, _) in results.items() if not ok}
+    if failed:
+        names = sorted(name for name, key in keys.items() if key in failed)
+        echo(
+            f"⚠️{len(names)}张图片上传失败，引用它们的页面暂时使用按原文件名生成的地址: "
+            + ", ".join(names)
+        )
+    return {name: key for name, key in keys.items() if key not in failed}
+
+
+def optimize_images(missing, keys, existing):
+    """在进程池中压缩missing中的图片，逐个生成 (OBS中的文件路径, 要上传的文件)。
+
+    决定使用原图的图片改用原扩展名的文件路径，并更新keys
+    """
+    before_total = after_total = 0
+    with ProcessPoolExecutor(max_workers=image_optimize_workers) as pool:
+        futures = {
+            pool.submit(optimize_image, path, digest): (object_path, path, digest)
+            for object_path, (path, digest) in missing.items()
         }
+        for future in as_completed(futures):
+            object_path, path, digest = futures[future]
+            output_path, before, after = future.result()
+            before_total += before
+            after_total += after
+            if output_path == path:
+                original_key = original_key_for(path, digest)
+                for name, key in keys.items():
+                    if key == object_path:
+                        keys[name] = original_key
+                if original_key in existing:
+                    continue
+                object_path = original_key
+            yield object_path, output_path
+    metrics.count("image_bytes_before", before_total)
+    metrics.count("image_bytes_after", after_total)
+    echo(
+        f"压缩了{len(missing)}张图片：{before_total / 1024 / 1024:.1f}MB → "
+        f"{after_total / 1024 / 1024:.1f}MB"
+    )
+
+
+_image_keys = None
+_image_keys_lock = threading.Lock()
+
+
+def sync_images():
+    """第一个文档引用本地图片时同步一次图片目录，之后直接查找图片地址"""
+    global _image_keys
+    with _image_keys_lock:
+        if _image_keys is None:
+            # 图片同步是独立的阶段，每次运行只列举一次图床、只上传缺少的图片
+            with metrics.stage("images"):
+                _image_keys = upload_imgs(local_imgs) if local_imgs else {}
+        return _image_keys
+
+
+def reset_image_keys():
+    """下次需要图片地址时重新同步图片目录，监视模式在每批变化之前调用，新增的图片才会上传"""
+    global _image_keys
+    with _image_keys_lock:
+        _image_keys = None
+
 
-        # 遍历目录及其子目录
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                if os.path.splitext(file)[1].lower() in supported_extensions:
-                    if contains_chinese(file):
-                        print(f"文件名包含中文，跳过上传: {file}")
-                        continue
-
-                    file_path = os.path.join(root, file)
-                    # 创建OBS中的文件路径，只使用文件名，不保留目录结构
-                    object_path = base_folder + os.path.basename(file_path)
-
-                    # 检查文件是否已存在
-                    if not is_file_exist(bucket_name, object_path):
-                        # 上传图片
-                        response = obs_client.putFile(
-                            bucket_name, object_path, file_path
-                        )
-                        if response.status < 300:
-                            # print(f"图片上传成功: {object_path}")
-                            pass
-                        else:
-                            print(
-                                f"图片上传失败: {object_path}, 状态码: {response.status}"
-                            )
-                    else:
-                        # print(f"图片已存在，跳过上传: {object_path}")
-                        pass
-
-    def is_file_exist(bucket, object_path):
-        response = obs_client.getObjectMetadata(bucket, object_path)
-        return response.status == 200
-
-    def contains_chinese(text):
-        # 检查文本是否包含中文字符
-        return any("\u4e00" <= char <= "\u9fff" for char in text)
-
-    # 希望上传图片的文件夹路径
-    upload_files(local_imgs)
+def get_image_url(filename):
+    """返回本地图片在图床中的地址"""
+    object_path = sync_images().get(filename)
+    if object_path is None:
+        # 不在本地图片目录中的图片，认为已经按原文件名上传到图床
+        return image_host_url + filename
+    return image_host_url + object_path[len(image_host_path) :]
@@ -1,13 +1,501 @@
-from notion_api import upload_markdown_to_notion
+# 命令行入口，子命令：sync（默认）、watch、dry-run、build、push。
+# 同步、解析、图床相关的模块在子命令确实需要时才导入：没有需要同步的文件时
+# 不会导入requests、解析器和OBS SDK，适合cron或git hook频繁调用。
+# 启动耗时可以用 python benchmark.py startup 检查
+import argparse
+import os
+import sys
+import time
+from metrics import metrics
+from console import echo
+from sync_manifest import SyncManifest, file_snapshot
 from utils import find_markdown_files
-from config import api_key, database_id, base_directory
+from config import (
+    api_key,
+    database_id,
+    base_directory,
+    concurrency,
+    bulk_index,
+    manifest_path,
+    update_mode,
+    report_path,
+    prometheus_textfile,
+    watch_debounce,
+    watch_poll_interval,
+    parse_workers,
+    parse_queue_size,
+)
 
+COMMANDS = ("sync", "watch", "dry-run", "build", "push")
 
-def main():
 
+def parse_args(argv=None):
+    # 各子命令共用的参数
+    report = argparse.ArgumentParser(add_help=False)
+    report.add_argument(
+        "--report",
+        default=report_path,
+        help="运行报告的保存路径（默认读取.env中的REPORT_PATH）",
+    )
+    report.add_argument(
+        "--prometheus",
+        default=prometheus_textfile,
+        help="同时把指标写入该Prometheus textfile",
+    )
+
+    manifest = argparse.ArgumentParser(add_help=False)
+    manifest.add_argument(
+        "-u", action="store_true", help="即使文本内容没变化，也强制更新所有页面"
+    )
+    manifest.add_argument(
+        "--no-manifest",
+        action="store_true",
+        help="不使用本地同步清单，逐个向Notion确认文件是否需要更新",
+    )
+
+    upload = argparse.ArgumentParser(add_help=False)
+    upload.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=concurrency,
+        help=f"同时上传的文件数（默认读取.env中的CONCURRENCY，当前为{concurrency}）",
+    )
+    upload.add_argument(
+        "--bulk-index",
+        action="store_true",
+        default=bulk_index,
+        help="启动时分页读取整个数据库建立标题索引，代替每个文件单独查询",
+    )
+
+    parse = argparse.ArgumentParser(add_help=False)
+    parse.add_argument(
+        "-P",
+        "--parse-workers",
+        type=int,
+        default=parse_workers,
+        help="用多少个进程并行解析文件，0表示在上传线程中边解析边上传"
+        f"（默认读取.env中的PARSE_WORKERS，当前为{parse_workers}）",
+    )
+    parse.add_argument(
+        "--no-parse-cache",
+        action="store_true",
+        help="不读取也不写入解析缓存，所有文件重新解析",
+    )
+
+    sync = argparse.ArgumentParser(
+        add_help=False, parents=[report, manifest, upload, parse]
+    )
+    sync.add_argument(
+        "--diff",
+        action="store_true",
+        default=update_mode == "diff",
+        help="更新页面时只修改有变化的块，而不是归档旧页面后重新创建",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="同步本地markdown文件到Notion数据库，不指定子命令时执行sync"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("sync", parents=[sync], help="同步所有新建或修改过的文件")
+
+    watch = subparsers.add_parser(
+        "watch", parents=[sync], help="同步后继续监视目录，文件新建、修改或删除后自动同步"
+    )
+    watch.add_argument(
+        "--debounce",
+        type=float,
+        default=watch_debounce,
+        help=f"文件停止变化多少秒后再同步（默认{watch_debounce}）",
+    )
+    watch.add_argument(
+        "--poll-interval",
+        type=float,
+        default=watch_poll_interval,
+        help="没有inotify时扫描目录的间隔（秒）",
+    )
+    watch.add_argument(
+        "--archive-deleted",
+        action="store_true",
+        help="本地文件被删除时，归档对应的Notion页面",
+    )
+
+    subparsers.add_parser(
+        "dry-run",
+        parents=[manifest, parse],
+        help="列出需要同步的文件并估算请求数，不访问Notion和图床",
+    )
+
+    build = subparsers.add_parser(
+        "build",
+        parents=[report, manifest, parse],
+        help="只解析文件，把要上传的页面写入SPOOL文件，不访问Notion",
+    )
+    build.add_argument("spool", metavar="SPOOL", help="spool文件路径，已存在时追加")
+
+    push = subparsers.add_parser(
+        "push",
+        parents=[report, manifest, upload],
+        help="不解析文件，上传build生成的SPOOL文件，中断后重新运行会从断点继续",
+    )
+    push.add_argument("spool", metavar="SPOOL", help="build生成的spool文件")
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        # 兼容以前的用法：python main.py [-u] [-j 8] ...
+        argv = ["sync"] + list(argv)
+    return parser.parse_args(argv)
+
+
+def sync_file(
+    markdown_file_path,
+    title_index=None,
+    manifest=None,
+    incremental=False,
+    force_update=False,
+    blocks=None,
+    stats=None,
+    parse_seconds=0,
+    parse_error=None,
+    snapshot=None,
+):
+    """上传单个文件，任何异常都记为失败，避免影响其他文件。
+
+    blocks、stats、parse_seconds、parse_error、snapshot为解析进程返回的结果，见pipeline.parse_file。
+    没有snapshot时在上传（边解析边上传）之前获取，上传期间文件的修改不会被当作已经同步
+    """
+    from notion_api import upload_markdown_to_notion
+
+    with metrics.file(markdown_file_path) as record:
+        metrics.add_stage("parse", parse_seconds)
+        try:
+            if parse_error is not None:
+                raise RuntimeError(f"解析失败: {parse_error}")
+            if snapshot is None:
+                snapshot = file_snapshot(markdown_file_path)
+            status, page_id = upload_markdown_to_notion(
+                database_id,
+                api_key,
+                markdown_file_path,
+                title_index=title_index,
+                incremental=incremental,
+                force_update=force_update,
+                blocks=blocks,
+                stats=stats,
+            )
+        except Exception as e:
+            echo(f"❌同步{markdown_file_path}时出错: {e}")
+            status, page_id = "failed", None
+        record["status"] = status
+    if manifest is not None:
+        if status == "failed":
+            manifest.forget(markdown_file_path)
+        else:
+            manifest.record(markdown_file_path, page_id, snapshot)
+    return status
+
+
+def print_summary(results, elapsed, report=None):
+    counts = {"created": 0, "updated": 0, "skipped": 0, "failed": 0}
+    for status in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    echo(
+        f"\n同步完成，共{len(results)}个文件，用时{elapsed:.1f}秒："
+        f"新建{counts['created']}，更新{counts['updated']}，"
+        f"跳过{counts['skipped']}，失败{counts['failed']}"
+        + (f"，删除{counts['deleted']}" if counts.get("deleted") else "")
+        + (f"，构建{counts['built']}" if counts.get("built") else "")
+    )
+    failed = sorted(path for path, status in results.items() if status == "failed")
+    for path in failed:
+        echo(f"  ❌{path}")
+    metrics.print_summary(report)
+
+
+def configure_parsing(args):
+    if args.no_parse_cache:
+        from parse_cache import parse_cache
+
+        parse_cache.enabled = False
+
+
+def reset_image_state():
+    """监视模式中两批变化之间可能新增或修改了图片，丢弃上一批同步图片的结果"""
+    if "img_upload" not in sys.modules:
+        # 还没有文档引用过本地图片，图片也就还没有同步过
+        return
+    from img_upload import reset_image_keys
+
+    reset_image_keys()
+
+
+def sync_pending(pending, args, title_index, manifest, results, force_update=False):
+    """并发同步pending中的文件，结果写入results"""
+    from archive_queue import archive_queue
+
+    if pending:
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from functools import partial
+        from pipeline import run_pipeline
+
+        configure_parsing(args)
+        # 图片目录在第一个引用本地图片的文档上传前才同步，见markdown_parser.resolve_local_images
+        sync = partial(
+            sync_file,
+            title_index=title_index,
+            manifest=manifest,
+            incremental=args.diff,
+            force_update=force_update,
+        )
+        # 所有线程共享 rate_limiter.notion_limiter，总请求速率不会超过Notion的限制
+        if args.parse_workers > 0 and len(pending) > 1:
+            # 进程池解析、线程上传，解析结果通过有界队列传给上传线程
+            upload = lambda path, blocks, stats, seconds, error, snapshot: sync(
+                path,
+                blocks=blocks,
+                stats=stats,
+                parse_seconds=seconds,
+                parse_error=error,
+                snapshot=snapshot,
+            )
+            results.update(
+                run_pipeline(
+                    pending,
+                    upload,
+                    min(args.parse_workers, len(pending)),
+                    args.workers,
+                    parse_queue_size,
+                )
+            )
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+                futures = {executor.submit(sync, path): path for path in pending}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+    # 被新页面取代的旧页面在所有文件同步完成后统一归档，也包括上次运行中断时没有归档的页面
+    with metrics.stage("archive"):
+        archive_queue.drain(api_key, args.workers)
+    if manifest is not None:
+        manifest.save()
+
+
+def finish_run(args, results, start):
+    report = metrics.report()
+    print_summary(results, time.monotonic() - start, report)
+    if args.report:
+        metrics.write_report(args.report, report)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus, report)
+
+
+def collect_pending(args, md_files, results):
+    """用同步清单筛选需要处理的文件，返回 (清单, 需要处理的文件)"""
+    if args.no_manifest:
+        return None, list(md_files)
+    with metrics.stage("manifest"):
+        manifest = SyncManifest(manifest_path)
+        manifest.prune(md_files)
+        if args.u:
+            return manifest, list(md_files)
+        # 只用stat与清单比较，未变化的文件既不解析也不访问Notion
+        pending = []
+        for path in md_files:
+            if manifest.is_unchanged(path):
+                results[path] = "skipped"
+            else:
+                pending.append(path)
+    return manifest, pending
+
+
+def build_title_index(enabled):
+    if not enabled:
+        return None
+    from notion_api import TitleIndex
+
+    title_index = TitleIndex(api_key, database_id)
+    with metrics.stage("title_index"):
+        built = title_index.build()
+    if not built:
+        echo("⚠️标题索引建立失败，改为逐个文件查询")
+        return None
+    return title_index
+
+
+def handle_deleted(path, args, title_index, manifest):
+    """本地文件被删除：从清单中移除，指定--archive-deleted时归档对应的页面"""
+    from utils import archive_page
+
+    entry = manifest.get(path) if manifest is not None else None
+    if manifest is not None:
+        manifest.forget(path)
+    title = os.path.splitext(os.path.basename(path))[0]
+    if not args.archive_deleted:
+        echo(f"🗑️{path}已删除，Notion中的页面保持不变")
+        return
+    page_ids = [entry["page_id"]] if entry and entry.get("page_id") else []
+    if not page_ids and title_index is not None:
+        page_ids = [page_id for page_id, _ in title_index.lookup(title)]
+    for page_id in page_ids:
+        if archive_page(api_key, page_id, title):
+            echo(f"🗑️{path}已删除，已归档页面《{title}》")
+            if title_index is not None:
+                title_index.remove(title, page_id)
+
+
+def run_watch(watcher, args, title_index, manifest):
+    from watcher import watch
+
+    def on_changes(changes):
+        metrics.reset()
+        start = time.monotonic()
+        results = {}
+        pending = []
+        for path, event in sorted(changes.items()):
+            if event == "deleted":
+                handle_deleted(path, args, title_index, manifest)
+                results[path] = "deleted"
+            elif manifest is not None and manifest.is_unchanged(path):
+                results[path] = "skipped"
+            else:
+                pending.append(path)
+        reset_image_state()
+        # 文件内容确实变了，即使与Notion中的修改时间在同一分钟内也要更新
+        sync_pending(pending, args, title_index, manifest, results, force_update=True)
+        finish_run(args, results, start)
+
+    echo(f"\n👀正在监视{base_directory}（{type(watcher).__name__}），按Ctrl+C退出")
+    try:
+        watch(watcher, on_changes, args.debounce)
+    except KeyboardInterrupt:
+        echo("已停止监视")
+    finally:
+        watcher.close()
+
+
+def cmd_sync(args):
+    start = time.monotonic()
+    with metrics.stage("find_files"):
+        md_files = find_markdown_files(base_directory)
+    results = {}
+    manifest, pending = collect_pending(args, md_files, results)
+    title_index = build_title_index(args.bulk_index and pending)
+    sync_pending(pending, args, title_index, manifest, results, force_update=args.u)
+    finish_run(args, results, start)
+
+
+def cmd_watch(args):
+    from watcher import create_watcher
+
+    start = time.monotonic()
+    with metrics.stage("find_files"):
+        # 监视模式在内存中保存目录树的索引，之后不再重新遍历
+        watcher = create_watcher(base_directory, args.poll_interval)
+        md_files = watcher.files()
+    results = {}
+    manifest, pending = collect_pending(args, md_files, results)
+    title_index = build_title_index(args.bulk_index)
+    sync_pending(pending, args, title_index, manifest, results, force_update=args.u)
+    finish_run(args, results, start)
+    run_watch(watcher, args, title_index, manifest)
+
+
+def cmd_dry_run(args):
+    """判断哪些文件需要同步并解析这些文件，不访问Notion和图床，也不修改同步清单"""
+    start = time.monotonic()
     md_files = find_markdown_files(base_directory)
-    for markdown_file_path in md_files:
-        upload_markdown_to_notion(database_id, api_key, markdown_file_path)
+    results = {}
+    manifest, pending = collect_pending(args, md_files, results)
+    totals = {"blocks": 0, "requests": 0, "failed": 0}
+
+    def estimate(path, blocks, stats, seconds, error, snapshot):
+        if error is not None:
+            echo(f"  ❌{path}: 解析失败: {error}")
+            totals["failed"] += 1
+            return "failed"
+        batches = max(1, sum(1 for _ in iter_batches(blocks)))
+        totals["blocks"] += len(blocks)
+        totals["requests"] += batches
+        if manifest is None:
+            label = "待检查"
+        else:
+            label = "新文件" if manifest.get(path) is None else "已修改"
+        echo(f"  {label} {path}：{len(blocks)}个块，{batches}个请求")
+        return label
+
+    if pending:
+        from payload import iter_batches
+        from pipeline import parse_file, run_pipeline
+
+        # parse_file保留本地图片的占位地址，不会同步图片
+        configure_parsing(args)
+        if args.parse_workers > 0 and len(pending) > 1:
+            run_pipeline(
+                pending,
+                estimate,
+                min(args.parse_workers, len(pending)),
+                1,
+                parse_queue_size,
+            )
+        else:
+            for path in sorted(pending):
+                estimate(*parse_file(path))
+    echo(
+        f"\n共{len(md_files)}个文件，需要同步{len(pending)}个，跳过{len(results)}个，"
+        f"共{totals['blocks']}个块，创建页面和追加块至少需要{totals['requests']}个请求，"
+        f"用时{time.monotonic() - start:.1f}秒"
+        + (f"，解析失败{totals['failed']}个" if totals["failed"] else "")
+    )
+
+
+def cmd_build(args):
+    """离线构建：解析文件写入spool，引用的本地图片在构建时上传，不查询Notion，也不记录同步清单"""
+    start = time.monotonic()
+    with metrics.stage("find_files"):
+        md_files = find_markdown_files(base_directory)
+    results = {}
+    _, pending = collect_pending(args, md_files, results)
+    if pending:
+        from spool import build_spool
+
+        configure_parsing(args)
+        results.update(
+            build_spool(pending, args.spool, args.parse_workers, parse_queue_size)
+        )
+    finish_run(args, results, start)
+
+
+def cmd_push(args):
+    from spool import push_spool
+
+    # 上传spool时不遍历目录，要上传的内容已经全部在spool中
+    start = time.monotonic()
+    manifest = None if args.no_manifest else SyncManifest(manifest_path)
+    title_index = build_title_index(args.bulk_index)
+    results = push_spool(
+        database_id,
+        api_key,
+        args.spool,
+        workers=args.workers,
+        title_index=title_index,
+        force_update=args.u,
+        manifest=manifest,
+    )
+    sync_pending([], args, title_index, manifest, results)
+    finish_run(args, results, start)
+
+
+COMMAND_HANDLERS = {
+    "sync": cmd_sync,
+    "watch": cmd_watch,
+    "dry-run": cmd_dry_run,
+    "build": cmd_build,
+    "push": cmd_push,
+}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    COMMAND_HANDLERS[args.command](args)
 
 
 if __name__ == "__main__":
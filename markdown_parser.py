@@ -1,39 +1,57 @@
 import re
 import os
-from config import image_host_url, local_imgs
-from img_upload import upload_imgs
+import config
+
+# 解析结果的格式版本，修改解析逻辑（块的内容或结构会变化）后加1，使解析缓存中的旧结果失效
+PARSER_VERSION = 3
+
+# 本地图片在解析结果中的占位地址，上传前由resolve_local_images换成图床地址。
+# 解析进程和解析缓存中都是占位地址，解析时不需要同步图床
+LOCAL_IMAGE_PREFIX = "local-image:"
+
+# 预编译的正则表达式，避免每行重复编译
+NUMBERED_LIST_PATTERN = re.compile(r"\d+\.")
+DISPLAY_EQUATION_PATTERN = re.compile(r"\$\$(.+?)\$\$")
+INLINE_EQUATION_PATTERN = re.compile(r"\$(.+?)\$")
+EMBED_PATTERN = re.compile(r'<iframe [^>]*//([^"]+)"')
+IMAGE_PATTERN = re.compile(r"!\[(.*?)\]\((.*?)\)")
+LINK_PATTERN = re.compile(r"\[([^\[]+)\]\((http[s]?://[^\)]+)\)")
+
+# "#"的个数 -> 标题设置
+HEADING_LEVELS = {
+    1: ("heading_1", 2),
+    2: ("heading_2", 3),
+    3: ("heading_3", 4),
+    4: ("paragraph", 5, "red", True),
+    5: ("paragraph", 6, "green", True),
+    6: ("paragraph", 7, "blue", True),
+}
 
 
 # 处理标题
 def handle_headings(line):
     """处理从一级到六级的Markdown标题，并返回Notion块结构。"""
-    heading_levels = {
-        "# ": ("heading_1", 2),
-        "## ": ("heading_2", 3),
-        "### ": ("heading_3", 4),
-        "#### ": ("paragraph", 5, "red", True),
-        "##### ": ("paragraph", 6, "green", True),
-        "###### ": ("paragraph", 7, "blue", True),
+    level = len(line) - len(line.lstrip("#"))
+    settings = HEADING_LEVELS.get(level)
+    if not settings or line[level : level + 1] != " ":
+        return None
+    content = line[level + 1 :]  # 移除Markdown标题前缀
+    if len(settings) == 2:
+        heading_type, cut_len = settings
+        color = "default"
+        annotations = None
+    else:
+        heading_type, cut_len, color, bold = settings
+        annotations = {"bold": bold}
+    rich_texts = process_rich_text(content) or [create_text_element("", False)]
+    if annotations:
+        rich_texts[0]["annotations"] = annotations
+
+    return {
+        "object": "block",
+        "type": heading_type,
+        heading_type: {"rich_text": rich_texts, "color": color},
     }
-    for prefix, settings in heading_levels.items():
-        if line.startswith(prefix):
-            content = line[len(prefix) :]  # 移除Markdown标题前缀
-            if len(settings) == 2:
-                heading_type, cut_len = settings
-                color = "default"
-                annotations = None
-            else:
-                heading_type, cut_len, color, bold = settings
-                annotations = {"bold": bold}
-            rich_texts = process_rich_text(content)
-            if annotations:
-                rich_texts[0]["annotations"] = annotations
-
-            return {
-                "object": "block",
-                "type": heading_type,
-                heading_type: {"rich_text": rich_texts, "color": color},
-            }
 
 
 # 处理无序列表项，支持 '-', '+', '*'
@@ -61,7 +79,7 @@ def handle_list(line, leading_spaces):
                     "color": "default",
                 },
             }
-    elif re.match(r"\d+\.", line):
+    elif NUMBERED_LIST_PATTERN.match(line):
         content = line[2:]
         rich_texts = process_rich_text(content)
         list_type = "numbered_list_item"
@@ -98,23 +116,25 @@ def handle_code_block(line, blocks, code_state):
     if line.startswith("```"):
         if code_state["in_code_block"]:
             # 代码块结束，创建代码块并重置状态
+            # 逐行收集后一次拼接，避免大代码块反复拼接字符串
+            content = "".join(code_state["lines"])
             # 移除最后一个换行符
-            if code_state["content"].endswith("\n"):
-                code_state["content"] = code_state["content"][:-1]
+            if content.endswith("\n"):
+                content = content[:-1]
             blocks.append(
                 {
                     "object": "block",
                     "type": "code",
                     "code": {
                         "rich_text": [
-                            {"type": "text", "text": {"content": code_state["content"]}}
+                            {"type": "text", "text": {"content": content}}
                         ],
                         "language": code_state["language"],
                     },
                 }
             )
             code_state["in_code_block"] = False
-            code_state["content"] = ""
+            code_state["lines"] = []
             code_state["language"] = "plain text"  # 重置为默认语言
         else:
             # 代码块开始
@@ -123,7 +143,7 @@ def handle_code_block(line, blocks, code_state):
         return True  # 当前行为代码块开始或结束标记
     elif code_state["in_code_block"]:
         # 直接添加原始行到内容中，保留缩进
-        code_state["content"] += line
+        code_state["lines"].append(line)
         return True  # 当前行为代码块内的内容
     return False  # 当前行不属于代码块
 
@@ -145,8 +165,8 @@ def handle_quote(line):
 def handle_equation(line):
     if "$$" in line:
         # 处理显示模式的 LaTeX 公式，使用 `$$...$$`
-        equation_matches = re.finditer(r"\$\$(.+?)\$\$", line)
-        for match in equation_matches:
+        match = DISPLAY_EQUATION_PATTERN.search(line)
+        if match:
             expression = match.group(1)
             return {
                 "object": "block",
@@ -155,8 +175,8 @@ def handle_equation(line):
             }
     if "$" in line:
         # 处理行内模式的 LaTeX 公式，使用 `$...$`
-        equation_matches = re.finditer(r"\$(.+?)\$", line)
-        for match in equation_matches:
+        match = INLINE_EQUATION_PATTERN.search(line)
+        if match:
             expression = match.group(1)
             return {
                 "object": "block",
@@ -168,7 +188,7 @@ def handle_equation(line):
 def handle_embed(line):
     """处理Markdown中的iframe嵌入内容，并返回Notion块结构。"""
     # 正则表达式匹配iframe中的src属性
-    match = re.search(r'<iframe [^>]*//([^"]+)"', line)
+    match = EMBED_PATTERN.search(line)
     if match:
         # 获取完整URL（添加https:前缀）
         url = f"https://{match.group(1)}&autoplay=0"  # b站视频会自动播放，禁用自动播放
@@ -177,8 +197,7 @@ def handle_embed(line):
 
 
 def handle_image(line):
-    img_pattern = re.compile(r"!\[(.*?)\]\((.*?)\)")
-    match = img_pattern.search(line)
+    match = IMAGE_PATTERN.search(line)
     if match:
         # 找到图片
         alt_text, img_path = match.groups()
@@ -191,81 +210,107 @@ def handle_image(line):
         else:
             # 本地图片，转换为在线 URL，提取文件名并添加 URL 前缀
             filename = os.path.basename(img_path)
-            if image_host_url != "xxx":
-                upload_imgs(local_imgs)
-                image_url = image_host_url + filename
-            else:
-                print("请上传本地图片{filename}到图床。")
+            if config.image_host_url == "xxx":
+                print(f"请上传本地图片{filename}到图床。")
+                return None
             return {
                 "object": "block",
                 "type": "image",
-                "image": {"type": "external", "external": {"url": image_url}},
+                "image": {
+                    "type": "external",
+                    "external": {"url": LOCAL_IMAGE_PREFIX + filename},
+                },
             }
 
 
-def parse_markdown(file_path):
-    with open(file_path, "r", encoding="utf-8") as file:
-        lines = file.readlines()
-    blocks = []
-    # 代码块状态，用于处理多行代码块
-    code_state = {"in_code_block": False, "content": "", "language": "plain text"}
-    for line in lines:
-        # 通过计算前面的空格来计算缩进级别
-        leading_spaces = len(line) - len(line.lstrip(" "))
-        oringin_line = line
-        line = line.strip()
-
-        # 尝试处理代码块
-        if handle_code_block(oringin_line, blocks, code_state):
-            continue
-        # 处理代码块放在“跳过空行”和“处理标题”前面，同时解决了2个bug，1.代码块中的空行。2.不会把注释解析为标题。
-        if not line:
-            # 跳过空行
-            continue
-        # 处理标题
-        block = handle_headings(line)
-        if block:
-            blocks.append(block)
-            continue
-        # 处理列表
-        block = handle_list(line, leading_spaces)
-        if block:
-            blocks.append(block)
-            continue
-        # 处理引用
-        block = handle_quote(line)
+# 行首字符 -> 处理函数，每行只会尝试与行首字符对应的一种前缀语法
+PREFIX_HANDLERS = {
+    "#": lambda line, leading_spaces: handle_headings(line),
+    ">": lambda line, leading_spaces: handle_quote(line),
+}
+for _char in "-+*0123456789":
+    PREFIX_HANDLERS[_char] = handle_list
+
+
+def parse_line(line, leading_spaces):
+    """把去掉首尾空白的非空行转换为Notion块。
+
+    先按行首字符分派到标题、列表或引用，再依次检查可以出现在行中任意位置的
+    公式、嵌入、分隔符和图片，最后作为普通段落处理。
+    """
+    handler = PREFIX_HANDLERS.get(line[0])
+    if handler:
+        block = handler(line, leading_spaces)
         if block:
-            blocks.append(block)
-            continue
-        # 处理公式
+            return block
+    # 处理公式
+    if "$" in line:
         block = handle_equation(line)
         if block:
-            blocks.append(block)
-            continue
-        # 处理嵌入内容
+            return block
+    # 处理嵌入内容
+    if "<iframe " in line:
         block = handle_embed(line)
         if block:
-            blocks.append(block)
-            continue
-        # 处理分隔符
-        if line.startswith("---"):
-            blocks.append({"object": "block", "type": "divider", "divider": {}})
-            continue
-        # 处理图片
+            return block
+    # 处理分隔符
+    if line.startswith("---"):
+        return {"object": "block", "type": "divider", "divider": {}}
+    # 处理图片
+    if "![" in line:
         block = handle_image(line)
         if block:
-            blocks.append(block)
-            continue
-        # 处理富文本
-        rich_texts = process_rich_text(line)
-        blocks.append(
-            {
-                "object": "block",
-                "type": "paragraph",
-                "paragraph": {"rich_text": rich_texts, "color": "default"},
-            }
-        )
-    return blocks
+            return block
+    # 处理富文本
+    return {
+        "object": "block",
+        "type": "paragraph",
+        "paragraph": {"rich_text": process_rich_text(line), "color": "default"},
+    }
+
+
+def iter_blocks(file_path):
+    """逐行读取文件并逐个生成Notion块，内存占用与文件大小无关（单个代码块除外）"""
+    # 代码块状态，用于处理多行代码块
+    code_state = {"in_code_block": False, "lines": [], "language": "plain text"}
+    code_blocks = []
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            # 通过计算前面的空格来计算缩进级别
+            leading_spaces = len(line) - len(line.lstrip(" "))
+            oringin_line = line
+            line = line.strip()
+
+            # 尝试处理代码块
+            if handle_code_block(oringin_line, code_blocks, code_state):
+                if code_blocks:
+                    yield code_blocks.pop()
+                continue
+            # 处理代码块放在“跳过空行”和“处理标题”前面，同时解决了2个bug，1.代码块中的空行。2.不会把注释解析为标题。
+            if not line:
+                # 跳过空行
+                continue
+            yield parse_line(line, leading_spaces)
+
+
+def resolve_local_images(blocks):
+    """把本地图片的占位地址换成图床地址，在主进程中上传之前调用。
+
+    第一次遇到本地图片时才加载图床模块并同步图片目录，没有本地图片的文档不会访问图床
+    """
+    get_image_url = None
+    for block in blocks:
+        if block["type"] == "image":
+            external = block["image"]["external"]
+            if external["url"].startswith(LOCAL_IMAGE_PREFIX):
+                if get_image_url is None:
+                    from img_upload import get_image_url
+                external["url"] = get_image_url(external["url"][len(LOCAL_IMAGE_PREFIX) :])
+        yield block
+
+
+def parse_markdown(file_path):
+    return list(iter_blocks(file_path))
 
 
 def process_rich_text(line):
@@ -274,7 +319,7 @@ def process_rich_text(line):
 
     # 先处理超链接，将文本分割成普通文本和超链接
     current_position = 0
-    for match in re.finditer(r"\[([^\[]+)\]\((http[s]?://[^\)]+)\)", line):
+    for match in LINK_PATTERN.finditer(line):
         # 添加超链接之前的普通文本
         if match.start() > current_position:
             plain_text = line[current_position : match.start()]
@@ -286,14 +331,6 @@ def process_rich_text(line):
             {
                 "type": "text",
                 "text": {"content": link_text, "link": {"url": link_url}},
-                "annotations": {
-                    "bold": False,
-                    "italic": False,
-                    "underline": False,
-                    "strikethrough": False,
-                    "code": False,
-                    "color": "default",
-                },
             }
         )
         current_position = match.end()
@@ -306,62 +343,180 @@ def process_rich_text(line):
     return rich_texts
 
 
+# 行内格式标记 -> 样式位，几种样式的组合用整数位掩码表示
+DELIMITER_BITS = {"**": 1, "*": 2, "~~": 4, "<u>": 8}
+CODE_BIT = 16
+STYLE_BITS = {"bold": 1, "italic": 2, "strikethrough": 4, "underline": 8, "code": CODE_BIT}
+# 位掩码 -> annotations，只包含值为True的样式
+MASK_ANNOTATIONS = [
+    {name: True for name, bit in STYLE_BITS.items() if mask & bit} for mask in range(32)
+]
+# 代码、连续的"*"、连续的"~"和下划线标签。带捕获组，split后奇数下标为标记。
+# 先匹配一个标记字符再用后向断言选择分支，正则引擎可以直接跳过不含标记字符的文本，
+# 比 `[^`]+`|\*+|~{2,}|</?u> 快一倍左右
+INLINE_TOKEN_PATTERN = re.compile(r"([`*~<](?:(?<=`)[^`]+`|(?<=\*)\**|(?<=~)~+|(?<=<)/?u>))")
+
+
+def tokenize_inline(text):
+    """一次扫描把文本切分为普通文本、代码和格式标记，并用分隔符栈配对标记。
+
+    返回 (类型列表, 文本列表)：类型0为普通文本，CODE_BIT为代码，
+    正数为开始标记的样式位，负数为结束标记的样式位。没有配对的标记按普通文本输出。
+    开始标记先按普通文本记录（文本就是标记本身），配对成功时再改为开始标记。
+    """
+    parts = INLINE_TOKEN_PATTERN.split(text)
+    kinds = []
+    texts = []
+    stack = []  # 尚未闭合的开始标记在texts中的下标
+    # 栈中"*"和"**"开始标记的下标，闭合星号时直接取最近的一个，不用逐个向下查找
+    stars = []
+    open_counts = {"**": 0, "*": 0, "~~": 0, "<u>": 0}
+    add_kind = kinds.append
+    add_text = texts.append
+    push = stack.append
+
+    def close(kind):
+        """闭合栈中最近的kind类型的开始标记，它上面未闭合的标记都视为普通文本"""
+        while True:
+            index = stack.pop()
+            opener = texts[index]
+            open_counts[opener] -= 1
+            if opener[0] == "*":
+                stars.pop()
+            if opener == kind:
+                bit = DELIMITER_BITS[kind]
+                kinds[index] = bit
+                add_kind(-bit)
+                add_text("")
+                return
+
+    last = len(parts) - 1
+    for i in range(1, last, 2):
+        before = parts[i - 1]
+        if before:
+            add_kind(0)
+            add_text(before)
+        marker = parts[i]
+        char = marker[0]
+        if char == "`":
+            add_kind(CODE_BIT)
+            add_text(marker[1:-1])
+            continue
+        if char == "<":
+            if marker == "<u>":
+                push(len(texts))
+                open_counts["<u>"] += 1
+                add_kind(0)
+                add_text("<u>")
+            elif open_counts["<u>"]:
+                close("<u>")
+            else:
+                add_kind(0)
+                add_text(marker)
+            continue
+
+        # 连续的"*"或"~"，左边不是空白才能闭合，右边不是空白才能开始。
+        # 左右是另一个标记时不是空白，位于文本开头或结尾时不能闭合或开始
+        after = parts[i + 1]
+        can_close = not before[-1].isspace() if before else i > 1
+        can_open = not after[0].isspace() if after else i + 1 < last
+        remaining = len(marker)
+        if char == "~":
+            if can_close and open_counts["~~"]:
+                close("~~")
+                remaining -= 2
+            if remaining >= 2 and can_open:
+                push(len(texts))
+                open_counts["~~"] += 1
+                add_kind(0)
+                add_text("~~")
+                remaining -= 2
+        else:
+            while can_close and remaining and stars:
+                top = texts[stars[-1]]
+                if top == "**" and remaining < 2:
+                    break
+                close(top)
+                remaining -= len(top)
+            while can_open and remaining:
+                kind = "**" if remaining >= 2 else "*"
+                stars.append(len(texts))
+                push(len(texts))
+                open_counts[kind] += 1
+                add_kind(0)
+                add_text(kind)
+                remaining -= len(kind)
+        if remaining:
+            add_kind(0)
+            add_text(char * remaining)
+    if parts[last]:
+        add_kind(0)
+        add_text(parts[last])
+    return kinds, texts
+
+
 def process_plain_text(text):
-    """处理普通文本中的格式化标记"""
-    pieces = []
-    # 定义正则表达式来匹配Markdown的各种格式化标记
-    format_patterns = [
-        (r"\*\*(.*?)\*\*", "bold"),
-        (r"\*(.*?)\*", "italic"),
-        (r"~~(.*?)~~", "strikethrough"),
-        (r"`(.*?)`", "code"),
-        (r"<u>(.*?)</u>", "underline"),
-    ]
-
-    last_end = 0
-    # 遍历所有格式化模式并应用它们
-    for pattern, style in format_patterns:
-        for match in re.finditer(pattern, text):
-            # 添加前一个格式和当前格式之间的文本
-            if match.start() > last_end:
-                pieces.append(
-                    create_text_element(text[last_end : match.start()], False)
-                )
-            # 添加格式化的文本
-            pieces.append(create_text_element(match.group(1), True, style))
-            last_end = match.end()
-
-    # 添加最后一段普通文本
-    if last_end < len(text):
-        pieces.append(create_text_element(text[last_end:], False))
-
-    return pieces
+    """处理普通文本中的格式化标记，支持嵌套（例如粗斜体、加粗的代码），线性时间"""
+    kinds, texts = tokenize_inline(text)
+    # 末尾的哨兵使最后一段也在循环中输出
+    kinds.append(None)
+    texts.append("")
+    elements = []
+    add = elements.append
+    levels = [0] * (CODE_BIT + 1)  # 样式位 -> 嵌套层数
+    mask = 0  # 当前生效的样式
+    current = None  # 正在合并的片段的样式和文本
+    content = ""
+    for kind, piece in zip(kinds, texts):
+        if kind == 0:
+            style = mask
+        elif kind is None:
+            style = -1
+        elif kind == CODE_BIT:
+            style = mask | CODE_BIT
+        elif kind > 0:
+            levels[kind] += 1
+            mask |= kind
+            continue
+        else:
+            levels[-kind] -= 1
+            if not levels[-kind]:
+                mask &= ~-kind
+            continue
+        # 与前一段样式相同时合并
+        if style == current:
+            content += piece
+            continue
+        if current:
+            add(
+                {
+                    "type": "text",
+                    "text": {"content": content},
+                    "annotations": dict(MASK_ANNOTATIONS[current]),
+                }
+            )
+        elif current is not None:
+            add({"type": "text", "text": {"content": content}})
+        current, content = style, piece
+    if not elements and text:
+        # 只有空的格式标记（例如"<u></u>"）时输出一个空的片段，调用方总能拿到至少一个片段
+        add({"type": "text", "text": {"content": ""}})
+    return elements
+
+
+# 支持的行内样式
+ANNOTATION_NAMES = frozenset(("bold", "italic", "underline", "strikethrough", "code"))
 
 
 def create_text_element(text, formatted, style=None):
-    """创建富文本元素，可以包括各种格式"""
-    element = {
-        "type": "text",
-        "text": {"content": text},
-        "annotations": {
-            "bold": False,
-            "italic": False,
-            "underline": False,
-            "strikethrough": False,
-            "code": False,
-            "color": "default",
-        },
-    }
-    if formatted:
-        if style == "bold":
-            element["annotations"]["bold"] = True
-        elif style == "italic":
-            element["annotations"]["italic"] = True
-        elif style == "underline":
-            element["annotations"]["underline"] = True
-        elif style == "strikethrough":
-            element["annotations"]["strikethrough"] = True
-        elif style == "code":
-            element["annotations"]["code"] = True
+    """创建富文本元素，style可以是单个样式或样式的集合。
 
+    Notion中没有设置的样式默认为False，所以只附带值为True的样式，没有格式时不带annotations。
+    """
+    element = {"type": "text", "text": {"content": text}}
+    if formatted:
+        styles = (style,) if isinstance(style, str) else style or ()
+        annotations = {name: True for name in styles if name in ANNOTATION_NAMES}
+        if annotations:
+            element["annotations"] = annotations
     return element
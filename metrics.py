@@ -0,0 +1,272 @@
+# 同步过程的计时和请求统计：每个文件各阶段的耗时、按接口和状态码统计的HTTP请求，
+# 运行结束后输出汇总，并写入JSON报告（可选写入Prometheus textfile）
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+# 路径中的页面、块、数据库id替换为{id}，相同接口的请求合并统计
+ID_PATTERN = re.compile(r"/[0-9a-fA-F]{8}-?(?:[0-9a-fA-F]{4}-?){3}[0-9a-fA-F]{12}(?=/|$)")
+SLOWEST_FILES = 5
+
+
+def endpoint_name(method, path):
+    return f"{method} {ID_PATTERN.sub('/{id}', path.split('?')[0])}"
+
+
+def percentile(values, q):
+    """最近秩法计算百分位数，values为空时返回0"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class Metrics:
+    """线程安全的统计数据，所有线程共用全局的metrics。
+
+    阶段可以嵌套，每个阶段只记录自身的耗时（不含嵌套的子阶段），
+    因此各阶段的耗时相加不会重复计算。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self._start = time.monotonic()
+        self.files = []
+        self.run_stages = defaultdict(float)  # 不属于任何文件的阶段，例如图片同步
+        self.requests = Counter()  # (接口, 状态码) -> 次数
+        self.request_times = []
+        self.retries = 0
+        self.bytes_sent = 0
+        self.counters = Counter()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name):
+        """记录with块内的耗时，当前线程正在同步文件时记到该文件上"""
+        frame = [name, time.monotonic(), 0.0]
+        stack = self._stack()
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.monotonic() - frame[1]
+            if stack:
+                stack[-1][2] += elapsed
+            self.add_stage(name, elapsed - frame[2])
+
+    def add_stage(self, name, seconds):
+        """直接记录一段耗时，例如在其他进程中解析文件的耗时"""
+        record = getattr(self._local, "file", None)
+        if record is not None:
+            stages = record["stages"]
+            stages[name] = stages.get(name, 0.0) + seconds
+        else:
+            with self._lock:
+                self.run_stages[name] += seconds
+
+    def timed_iter(self, name, iterable):
+        """包装生成器，把每次取下一个元素的耗时记为name阶段（例如边解析边上传时的解析耗时）"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    @contextmanager
+    def file(self, path):
+        """同步单个文件，返回的字典中可以写入status"""
+        record = {"path": path, "status": None, "stages": {}, "requests": 0}
+        self._local.file = record
+        start = time.monotonic()
+        try:
+            with self.stage("other"):
+                yield record
+        finally:
+            self._local.file = None
+            record["elapsed"] = time.monotonic() - start
+            with self._lock:
+                self.files.append(record)
+
+    def current_file(self):
+        """当前线程正在同步的文件路径，不在metrics.file()中时返回None"""
+        record = getattr(self._local, "file", None)
+        return record["path"] if record is not None else None
+
+    def record_request(self, method, path, status, seconds, bytes_sent, retry=False):
+        """记录一次HTTP请求（包括重试），status为状态码，网络错误时为"error" """
+        record = getattr(self._local, "file", None)
+        if record is not None:
+            record["requests"] += 1
+        with self._lock:
+            self.requests[(endpoint_name(method, path), str(status))] += 1
+            self.request_times.append(seconds)
+            self.bytes_sent += bytes_sent
+            if retry:
+                self.retries += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def add_counters(self, stats):
+        """合并请求体精简和拆分的统计（bytes_saved、split_spans等）"""
+        with self._lock:
+            self.counters.update({k: v for k, v in stats.items() if v})
+
+    def stage_totals(self):
+        totals = defaultdict(list)
+        for record in self.files:
+            for name, seconds in record["stages"].items():
+                totals[name].append(seconds)
+        return totals
+
+    def report(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._start
+            file_times = [r["elapsed"] for r in self.files]
+            stages = {}
+            for name, values in self.stage_totals().items():
+                stages[name] = {
+                    "total": sum(values),
+                    "files": len(values),
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                }
+            for name, seconds in self.run_stages.items():
+                stages.setdefault(name, {"total": 0.0, "files": 0, "p50": 0.0, "p95": 0.0})
+                stages[name]["total"] += seconds
+            by_endpoint = defaultdict(dict)
+            for (endpoint, status), n in sorted(self.requests.items()):
+                by_endpoint[endpoint][status] = n
+            slowest = sorted(self.files, key=lambda r: r["elapsed"], reverse=True)
+            return {
+                "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "elapsed": elapsed,
+                "files": dict(Counter(r["status"] for r in self.files)),
+                "file_latency": {
+                    "p50": percentile(file_times, 50),
+                    "p95": percentile(file_times, 95),
+                    "max": max(file_times, default=0.0),
+                },
+                "stages": stages,
+                "http": {
+                    "requests": sum(self.requests.values()),
+                    "retries": self.retries,
+                    "bytes_sent": self.bytes_sent,
+                    "latency": {
+                        "p50": percentile(self.request_times, 50),
+                        "p95": percentile(self.request_times, 95),
+                    },
+                    "by_endpoint": by_endpoint,
+                },
+                "counters": dict(self.counters),
+                "slowest": [
+                    {"path": r["path"], "elapsed": r["elapsed"], "requests": r["requests"]}
+                    for r in slowest[:SLOWEST_FILES]
+                ],
+                "per_file": self.files,
+            }
+
+    def print_summary(self, report=None):
+        report = report or self.report()
+        http = report["http"]
+        latency = report["file_latency"]
+        if report["per_file"]:
+            print(
+                f"每个文件耗时 p50 {latency['p50']:.2f}秒，p95 {latency['p95']:.2f}秒，"
+                f"最长{latency['max']:.2f}秒"
+            )
+        print(
+            f"HTTP请求{http['requests']}个（重试{http['retries']}次），"
+            f"发送{http['bytes_sent'] / 1024:.0f}KB，"
+            f"请求耗时 p50 {http['latency']['p50'] * 1000:.0f}ms，"
+            f"p95 {http['latency']['p95'] * 1000:.0f}ms"
+        )
+        counters = report["counters"]
+        if counters.get("image_bytes_before"):
+            print(
+                f"图片压缩 {counters['image_bytes_before'] / 1024 / 1024:.1f}MB → "
+                f"{counters.get('image_bytes_after', 0) / 1024 / 1024:.1f}MB"
+            )
+        stages = sorted(report["stages"].items(), key=lambda x: x[1]["total"], reverse=True)
+        for name, s in stages:
+            print(
+                f"  {name:<16} 共{s['total']:7.2f}秒  "
+                f"p50 {s['p50']:6.2f}秒  p95 {s['p95']:6.2f}秒"
+            )
+        for endpoint, statuses in report["http"]["by_endpoint"].items():
+            counts = "，".join(f"{status}: {n}" for status, n in statuses.items())
+            print(f"  {endpoint:<40} {counts}")
+        if report["slowest"]:
+            print("最慢的文件：")
+            for r in report["slowest"]:
+                print(f"  {r['elapsed']:6.2f}秒  {r['requests']:3}个请求  {r['path']}")
+
+    def write_report(self, path, report=None):
+        report = report or self.report()
+        _write_atomic(path, json.dumps(report, ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path, report=None):
+        """写入node_exporter textfile collector可以读取的指标文件"""
+        report = report or self.report()
+        lines = [
+            "# TYPE md2notion_run_duration_seconds gauge",
+            f"md2notion_run_duration_seconds {report['elapsed']:.3f}",
+            "# TYPE md2notion_last_run_timestamp_seconds gauge",
+            f"md2notion_last_run_timestamp_seconds {time.time():.0f}",
+            "# TYPE md2notion_files gauge",
+        ]
+        for status, n in report["files"].items():
+            lines.append(f'md2notion_files{{status="{status}"}} {n}')
+        lines.append("# TYPE md2notion_file_duration_seconds gauge")
+        for q in ("p50", "p95"):
+            quantile = int(q[1:]) / 100
+            value = report["file_latency"][q]
+            lines.append(f'md2notion_file_duration_seconds{{quantile="{quantile}"}} {value:.3f}')
+        lines.append("# TYPE md2notion_stage_seconds gauge")
+        for name, s in report["stages"].items():
+            lines.append(f'md2notion_stage_seconds{{stage="{name}"}} {s["total"]:.3f}')
+        lines.append("# TYPE md2notion_http_requests gauge")
+        for endpoint, statuses in report["http"]["by_endpoint"].items():
+            for status, n in statuses.items():
+                lines.append(
+                    f'md2notion_http_requests{{endpoint="{endpoint}",status="{status}"}} {n}'
+                )
+        lines += [
+            "# TYPE md2notion_http_retries gauge",
+            f"md2notion_http_retries {report['http']['retries']}",
+            "# TYPE md2notion_http_bytes_sent gauge",
+            f"md2notion_http_bytes_sent {report['http']['bytes_sent']}",
+        ]
+        for name, n in sorted(report["counters"].items()):
+            lines.append(f"# TYPE md2notion_{name} gauge")
+            lines.append(f"md2notion_{name} {n}")
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _write_atomic(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+metrics = Metrics()
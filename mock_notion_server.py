@@ -0,0 +1,467 @@
+# 本地模拟的Notion API，用于离线测试同步的吞吐量和延迟，不会访问真正的Notion
+# 用法：python mock_notion_server.py --port 8787 --latency 200 --rate 3 --error-rate 0.01
+# --applied-error-rate 模拟请求已经执行、但响应丢失（返回502/504）的情况，用于测试重试时不会重复创建
+# 然后在 .env.local 中设置 NOTION_BASE_URL = http://127.0.0.1:8787/v1
+# GET /_stats 返回按接口和状态码统计的请求数，POST /_reset 清空数据和统计
+# 测试中可以用 server.inject_fault() 让指定接口的下一次请求返回给定的状态码
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAX_CHILDREN = 100
+MAX_TEXT_LENGTH = 2000
+MAX_BODY_BYTES = 500 * 1024
+
+
+class NotionError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+class MockNotion:
+    """内存中的数据库、页面和块，只实现本项目用到的接口"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.databases = {}
+        self.pages = {}
+        self.blocks = {}
+        self.children = {}  # 页面或块id -> 子块id列表
+
+    def database(self, database_id):
+        if database_id not in self.databases:
+            self.databases[database_id] = {
+                "object": "database",
+                "id": database_id,
+                "properties": {"title": {"id": "title", "name": "title", "type": "title", "title": {}}},
+            }
+        return self.databases[database_id]
+
+    def update_database(self, database_id, body):
+        database = self.database(database_id)
+        for name, prop in body.get("properties", {}).items():
+            prop_type = next(iter(prop))
+            database["properties"][name] = {
+                "id": uuid.uuid4().hex[:4],
+                "name": name,
+                "type": prop_type,
+                prop_type: prop[prop_type],
+            }
+        return database
+
+    def page_response(self, page):
+        """补全Notion返回的字段（属性类型、plain_text）"""
+        schema = self.database(page["parent"]["database_id"])["properties"]
+        properties = {}
+        for name, value in page["properties"].items():
+            value = dict(value)
+            prop_type = schema.get(name, {}).get("type") or next(
+                k for k in value if k not in ("id", "type")
+            )
+            value["type"] = prop_type
+            if prop_type in ("title", "rich_text"):
+                value[prop_type] = [with_plain_text(t) for t in value[prop_type]]
+            properties[name] = value
+        return dict(page, properties=properties)
+
+    def query(self, database_id, body):
+        self.database(database_id)
+        title = (body.get("filter") or {}).get("title", {}).get("equals")
+        pages = [
+            p
+            for p in self.pages.values()
+            if p["parent"]["database_id"] == database_id
+            and not p["archived"]
+            and (title is None or page_title(p) == title)
+        ]
+        start = int(body.get("start_cursor") or 0)
+        size = min(int(body.get("page_size") or 100), 100)
+        results = pages[start : start + size]
+        has_more = start + size < len(pages)
+        return {
+            "object": "list",
+            "results": [self.page_response(p) for p in results],
+            "has_more": has_more,
+            "next_cursor": str(start + size) if has_more else None,
+        }
+
+    def create_blocks(self, parent_id, blocks, after=None):
+        if len(blocks) > MAX_CHILDREN:
+            raise NotionError(400, "validation_error", "children.length should be ≤ 100")
+        created = []
+        for block in blocks:
+            validate_block(block)
+            block = dict(block, id=str(uuid.uuid4()), has_children=False, archived=False)
+            self.blocks[block["id"]] = block
+            created.append(block)
+        ids = self.children.setdefault(parent_id, [])
+        position = ids.index(after) + 1 if after in ids else len(ids)
+        ids[position:position] = [b["id"] for b in created]
+        return created
+
+    def create_page(self, body):
+        page = {
+            "object": "page",
+            "id": str(uuid.uuid4()),
+            "parent": body["parent"],
+            "properties": body.get("properties", {}),
+            "cover": body.get("cover"),
+            "archived": False,
+        }
+        self.database(page["parent"]["database_id"])
+        self.create_blocks(page["id"], body.get("children", []))
+        self.pages[page["id"]] = page
+        return self.page_response(page)
+
+    def get_page(self, page_id):
+        if page_id not in self.pages:
+            raise NotionError(404, "object_not_found", f"Could not find page {page_id}")
+        return self.page_response(self.pages[page_id])
+
+    def update_page(self, page_id, body):
+        page = self.pages.get(page_id)
+        if page is None:
+            raise NotionError(404, "object_not_found", f"Could not find page {page_id}")
+        if "archived" in body:
+            page["archived"] = body["archived"]
+        page["properties"].update(body.get("properties", {}))
+        return self.page_response(page)
+
+    def list_children(self, block_id, query):
+        ids = self.children.get(block_id, [])
+        start = int(query.get("start_cursor", ["0"])[0])
+        size = min(int(query.get("page_size", ["100"])[0]), 100)
+        has_more = start + size < len(ids)
+        return {
+            "object": "list",
+            "results": [self.blocks[i] for i in ids[start : start + size]],
+            "has_more": has_more,
+            "next_cursor": str(start + size) if has_more else None,
+        }
+
+    def update_block(self, block_id, body):
+        block = self.blocks.get(block_id)
+        if block is None:
+            raise NotionError(404, "object_not_found", f"Could not find block {block_id}")
+        block[block["type"]] = body.get(block["type"], block[block["type"]])
+        validate_block(block)
+        return block
+
+    def delete_block(self, block_id):
+        block = self.blocks.pop(block_id, None)
+        if block is None:
+            raise NotionError(404, "object_not_found", f"Could not find block {block_id}")
+        for ids in self.children.values():
+            if block_id in ids:
+                ids.remove(block_id)
+        return dict(block, archived=True)
+
+
+def with_plain_text(span):
+    span = dict(span)
+    span["plain_text"] = span.get("text", {}).get("content", "")
+    return span
+
+
+def page_title(page):
+    for value in page["properties"].values():
+        if "title" in value and isinstance(value["title"], list):
+            return "".join(t.get("text", {}).get("content", "") for t in value["title"])
+    return ""
+
+
+def validate_block(block):
+    body = block.get(block.get("type"), {})
+    for span in body.get("rich_text", []):
+        if len(span.get("text", {}).get("content", "")) > MAX_TEXT_LENGTH:
+            raise NotionError(
+                400, "validation_error", "rich_text.text.content.length should be ≤ 2000"
+            )
+    if len(body.get("rich_text", [])) > 100:
+        raise NotionError(400, "validation_error", "rich_text.length should be ≤ 100")
+
+
+# (方法, 路径正则, 接口名称)
+ROUTES = [
+    ("GET", r"/v1/databases/([^/]+)", "databases.retrieve"),
+    ("PATCH", r"/v1/databases/([^/]+)", "databases.update"),
+    ("POST", r"/v1/databases/([^/]+)/query", "databases.query"),
+    ("POST", r"/v1/pages", "pages.create"),
+    ("GET", r"/v1/pages/([^/]+)", "pages.retrieve"),
+    ("PATCH", r"/v1/pages/([^/]+)", "pages.update"),
+    ("GET", r"/v1/blocks/([^/]+)/children", "blocks.children.list"),
+    ("PATCH", r"/v1/blocks/([^/]+)/children", "blocks.children.append"),
+    ("PATCH", r"/v1/blocks/([^/]+)", "blocks.update"),
+    ("DELETE", r"/v1/blocks/([^/]+)", "blocks.delete"),
+]
+
+
+class RateLimiter:
+    """服务端的令牌桶，超过速率时返回429和Retry-After"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """取得令牌返回None，否则返回需要等待的秒数"""
+        if not self.rate:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / self.rate
+
+
+class FaultQueue:
+    """按顺序注入的故障，每个只生效一次，用于在测试中确定地复现限流和5xx"""
+
+    def __init__(self):
+        self.faults = []
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, status, applied=False, retry_after=None):
+        with self.lock:
+            self.faults.append(
+                {
+                    "endpoint": endpoint,
+                    "status": status,
+                    "applied": applied,
+                    "retry_after": retry_after,
+                }
+            )
+
+    def take(self, endpoint):
+        """取出第一个匹配该接口的故障，没有时返回None"""
+        with self.lock:
+            for index, fault in enumerate(self.faults):
+                if fault["endpoint"] == endpoint:
+                    return self.faults.pop(index)
+        return None
+
+
+def make_handler(notion, options, stats, faults):
+    limiter = RateLimiter(options.rate, options.burst)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            if options.verbose:
+                super().log_message(format, *args)
+
+        def send_json(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def handle_request(self, method):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            stats["bytes_received"] += len(raw)
+
+            if url.path == "/_stats":
+                return self.send_json(200, dict(stats["counts"], **summarize(stats)))
+            if url.path == "/_reset" and method == "POST":
+                with notion.lock:
+                    notion.__init__()
+                stats["counts"].clear()
+                stats["bytes_received"] = 0
+                stats["started"] = time.monotonic()
+                return self.send_json(200, {"ok": True})
+
+            for route_method, pattern, name in ROUTES:
+                match = re.fullmatch(pattern, url.path)
+                if route_method == method and match:
+                    break
+            else:
+                name, match = None, None
+            endpoint = name or f"{method} {url.path}"
+
+            def respond(status, body, headers=None):
+                stats["counts"][f"{endpoint} {status}"] += 1
+                self.send_json(status, body, headers)
+
+            def respond_fault(fault):
+                headers = None
+                if fault["retry_after"] is not None:
+                    headers = {"Retry-After": str(fault["retry_after"])}
+                if fault["status"] == 429:
+                    code = "rate_limited"
+                elif fault["status"] >= 500:
+                    code = "internal_server_error"
+                else:
+                    code = "validation_error"
+                respond(fault["status"], error_body(code, "Injected fault"), headers)
+
+            if options.latency:
+                delay = random.gauss(options.latency, options.latency * options.jitter)
+                time.sleep(max(0, delay) / 1000)
+            wait = limiter.try_acquire()
+            if wait is not None:
+                return respond(
+                    429,
+                    error_body("rate_limited", "Rate limited"),
+                    {"Retry-After": str(math.ceil(wait))},
+                )
+            fault = faults.take(endpoint)
+            if fault is not None and not fault["applied"]:
+                return respond_fault(fault)
+            if random.random() < options.error_rate:
+                status = random.choice([500, 502, 503])
+                return respond(status, error_body("internal_server_error", "Injected error"))
+            if name is None:
+                return respond(404, error_body("invalid_request_url", "Invalid request URL"))
+            if len(raw) > MAX_BODY_BYTES:
+                return respond(413, error_body("payload_too_large", "Payload too large"))
+
+            body = json.loads(raw) if raw else {}
+            args = match.groups()
+            try:
+                with notion.lock:
+                    result = dispatch(notion, name, args, body, parse_qs(url.query))
+            except NotionError as e:
+                return respond(e.status, error_body(e.code, str(e)))
+            if fault is not None:
+                return respond_fault(fault)
+            if method != "GET" and random.random() < options.applied_error_rate:
+                status = random.choice([502, 504])
+                return respond(status, error_body("gateway_timeout", "Injected error after write"))
+            respond(200, result)
+
+        def do_GET(self):
+            self.handle_request("GET")
+
+        def do_POST(self):
+            self.handle_request("POST")
+
+        def do_PATCH(self):
+            self.handle_request("PATCH")
+
+        def do_DELETE(self):
+            self.handle_request("DELETE")
+
+    return Handler
+
+
+def dispatch(notion, name, args, body, query):
+    if name == "databases.retrieve":
+        return notion.database(args[0])
+    if name == "databases.update":
+        return notion.update_database(args[0], body)
+    if name == "databases.query":
+        return notion.query(args[0], body)
+    if name == "pages.create":
+        return notion.create_page(body)
+    if name == "pages.retrieve":
+        return notion.get_page(args[0])
+    if name == "pages.update":
+        return notion.update_page(args[0], body)
+    if name == "blocks.children.list":
+        return notion.list_children(args[0], query)
+    if name == "blocks.children.append":
+        results = notion.create_blocks(args[0], body.get("children", []), body.get("after"))
+        return {"object": "list", "results": results, "has_more": False}
+    if name == "blocks.update":
+        return notion.update_block(args[0], body)
+    if name == "blocks.delete":
+        return notion.delete_block(args[0])
+    raise NotionError(404, "invalid_request_url", "Invalid request URL")
+
+
+def error_body(code, message):
+    return {"object": "error", "status": 0, "code": code, "message": message}
+
+
+def summarize(stats):
+    counts = stats["counts"]
+    return {
+        "total_requests": sum(counts.values()),
+        "throttled": sum(v for k, v in counts.items() if k.endswith(" 429")),
+        "errors": sum(v for k, v in counts.items() if k[-3:] >= "500"),
+        "bytes_received": stats["bytes_received"],
+        "elapsed": time.monotonic() - stats["started"],
+    }
+
+
+def create_server(host="127.0.0.1", port=8787, **kwargs):
+    """创建模拟服务器，kwargs与命令行参数相同；port为0时自动选择端口"""
+    options = argparse.Namespace(
+        latency=0,
+        jitter=0.2,
+        rate=0,
+        burst=3,
+        error_rate=0,
+        applied_error_rate=0,
+        verbose=False,
+    )
+    vars(options).update(kwargs)
+    stats = {"counts": Counter(), "bytes_received": 0, "started": time.monotonic()}
+    faults = FaultQueue()
+    notion = MockNotion()
+    server = ThreadingHTTPServer((host, port), make_handler(notion, options, stats, faults))
+    server.daemon_threads = True
+    server.stats = stats
+    server.notion = notion
+    # endpoint为ROUTES中的接口名，例如"pages.create"；applied为True时先执行请求再返回错误
+    server.inject_fault = faults.add
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的Notion API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0, help="平均响应延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟的相对标准差")
+    parser.add_argument("--rate", type=float, default=0, help="每秒允许的请求数，0为不限流")
+    parser.add_argument("--burst", type=float, default=3, help="允许的突发请求数")
+    parser.add_argument("--error-rate", type=float, default=0, help="随机返回5xx的概率")
+    parser.add_argument(
+        "--applied-error-rate",
+        type=float,
+        default=0,
+        help="写请求执行后仍返回5xx的概率",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印每个请求")
+    args = parser.parse_args()
+
+    server = create_server(**vars(args))
+    print(f"模拟Notion API已启动: http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        stats = server.stats
+        for key, value in sorted(stats["counts"].items()):
+            print(f"{key:>40} {value}")
+        print(json.dumps(summarize(stats), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,184 +1,681 @@
-import requests
+import hashlib
 import os
-import sys
+import threading
+import time
+from concurrent.futures import Future
+from itertools import chain, islice
 from datetime import datetime, timedelta
+import requests
+from config import max_retries
 from utils import get_file_last_modified, get_unique_cover_url, archive_page
-from markdown_parser import parse_markdown
+from parse_cache import parse_cache
+from markdown_parser import resolve_local_images
+from notion_http import RETRY_STATUS, backoff_delay, get_client, never_sent
+from block_diff import get_page_blocks, update_page_blocks
+from checkpoints import checkpoints
+from archive_queue import archive_queue
+from sync_manifest import file_hash
+from payload import (
+    SPLIT_LIMITS,
+    compact,
+    compact_blocks,
+    normalize_blocks,
+    iter_batches,
+)
+from metrics import metrics
+from console import echo
 
 
 def get_page_properties(database_id, api_key, page_id):
-    url = f"https://api.notion.com/v1/pages/{page_id}"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28",
-    }
-    response = requests.get(url, headers=headers)
+    response = get_client(api_key).get(f"/pages/{page_id}")
     if response.status_code == 200:
         data = response.json()
         properties = data["properties"]
         cover = data.get("cover", None)  # 如果封面存在，就获取该封面
         return properties, cover
     else:
-        print(f"❌获取页面属性失败: {response.text}")
+        echo(f"❌获取页面属性失败: {response.text}")
         return None, None
 
 
 # 获取数据库的属性
 def get_database_properties(api_key, database_id):
-    url = f"https://api.notion.com/v1/databases/{database_id}"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Notion-Version": "2022-06-28",
-        "Content-Type": "application/json",
-    }
-    response = requests.get(url, headers=headers)
+    response = get_client(api_key).get(f"/databases/{database_id}")
     if response.status_code == 200:
         return response.json()["properties"]
     else:
-        print("错误:", response.text)
+        echo("错误:", response.text)
         return None
 
 
-def upload_blocks_to_page(page_id, blocks, headers):
-    """向指定页面追加块"""
-    url = f"https://api.notion.com/v1/blocks/{page_id}/children"
-    payload = {"children": blocks}
-    response = requests.patch(url, json=payload, headers=headers)
-    if response.status_code in [200, 201]:
-        pass
+def prepare_blocks(markdown_file_path, stats=None, resolve_images=True):
+    """边解析边处理：去掉默认值，并按Notion的大小限制拆分超长的文本和块。
+
+    内容没变的文件直接从解析缓存中读取。resolve_images为False时保留本地图片的占位地址，
+    用于解析进程，由主进程上传前调用resolve_local_images
+    """
+    blocks = parse_cache.iter_blocks(markdown_file_path)
+    blocks = normalize_blocks(compact_blocks(blocks, stats), stats)
+    blocks = metrics.timed_iter("parse", blocks)
+    if resolve_images:
+        blocks = resolve_local_images(blocks)
+    return blocks
+
+
+def blocks_digest():
+    """解析器、图床和拆分限制的摘要，记录在断点中：任何一项变化后，同一个文件拆分出的块不再相同"""
+    parts = [parse_cache.config_digest(), SPLIT_LIMITS]
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+def report_payload_stats(stats):
+    splits = stats.get("split_spans", 0) + stats.get("split_blocks", 0)
+    converted = stats.get("converted_blocks", 0) + stats.get("dropped_links", 0)
+    message = f"  请求体精简了{stats.get('bytes_saved', 0) / 1024:.1f}KB"
+    if splits or converted:
+        message += (
+            f"，为满足Notion的限制拆分了{stats.get('split_spans', 0)}个文本片段、"
+            f"{stats.get('split_blocks', 0)}个块，转换了{converted}个超长的公式或链接"
+        )
+    echo(message)
+
+
+def send_unless_applied(send, applied, description):
+    """发送非幂等的请求（创建页面、追加块），返回 (是否成功, 响应)。
+
+    NotionClient不会重试这类请求的超时和5xx，因为Notion可能已经执行了请求。
+    这里等待一段时间后先调用applied()确认请求是否已经生效：已经生效就不再发送，
+    返回 (True, None)；确实没有生效才重新发送。applied()无法确认时返回None，直接失败
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            response = send()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if never_sent(e):
+                # 连接阶段的错误NotionClient已经重试过，请求没有发出
+                raise
+            reason = f"网络错误: {e}"
+        else:
+            if response.status_code in [200, 201] or response.status_code not in RETRY_STATUS:
+                return response.status_code in [200, 201], response
+            reason = f"返回{response.status_code}"
+        delay = backoff_delay(attempt)
+        echo(f"⚠️{description}{reason}，{delay:.1f}秒后确认是否已经生效")
+        with metrics.stage("retry_wait"):
+            time.sleep(delay)
+        done = applied()
+        if done:
+            echo(f"  {description}实际已经生效，不再重复发送")
+            return True, None
+        if done is None:
+            break
+    echo(f"❌{description}失败: {reason}")
+    return False, None
+
+
+def append_chunk(api_key, page_id, chunk, start):
+    """向已有start个块的页面追加一批块，成功返回True"""
+    description = f"追加第{start + 1}~{start + len(chunk)}块"
+
+    def applied():
+        blocks = get_page_blocks(api_key, page_id)
+        if blocks is None:
+            return None
+        if len(blocks) == start + len(chunk):
+            return True
+        if len(blocks) != start:
+            echo(f"❌页面中有{len(blocks)}个块，应为{start}或{start + len(chunk)}个")
+            return None
+        return False
+
+    ok, response = send_unless_applied(
+        lambda: get_client(api_key).patch(
+            f"/blocks/{page_id}/children", json={"children": chunk}
+        ),
+        applied,
+        description,
+    )
+    if not ok and response is not None:
+        echo(f"❌长文本添加失败（第{start + 1}~{start + len(chunk)}块）: {response.text}")
+    return ok
+
+
+def find_created_page(database_id, api_key, title, last_modified, replaces=None):
+    """在数据库中查找已经创建的页面：标题和last modified相同，且不是被它取代的旧页面。
+
+    Notion的接口不支持幂等键，创建页面的结果不确定时只能这样查找。
+    返回页面id，没有找到返回None，查询失败抛出RuntimeError
+    """
+    payload = {"filter": {"property": "title", "title": {"equals": title}}}
+    response = get_client(api_key).post(f"/databases/{database_id}/query", json=payload)
+    if response.status_code != 200:
+        raise RuntimeError(f"查询《{title}》失败: {response.text}")
+    for page in response.json().get("results", []):
+        if page["id"] != replaces and same_minute(
+            get_page_last_modified(page), last_modified
+        ):
+            return page["id"]
+    return None
+
+
+def create_page(database_id, api_key, payload, title, last_modified, replaces=None):
+    """创建页面，返回新页面的id，失败返回None。
+
+    请求超时或返回5xx时，先在数据库中查找是否已经创建了这个页面，没有才重新创建
+    """
+    created = {}
+
+    def send():
+        response = get_client(api_key).post("/pages", json=payload)
+        if response.status_code in [200, 201]:
+            created["id"] = response.json()["id"]
+        return response
+
+    def applied():
+        try:
+            created["id"] = find_created_page(
+                database_id, api_key, title, last_modified, replaces
+            )
+        except RuntimeError as e:
+            echo(f"❌{e}")
+            return None
+        return created["id"] is not None
+
+    ok, response = send_unless_applied(send, applied, f"创建页面《{title}》")
+    if ok:
+        return created["id"]
+    if response is not None:
+        echo(f"❌页面《{title}》创建/更新失败", response.text)
+    return None
+
+
+def upload_blocks_to_page(api_key, page_id, batches, start=0, on_chunk=None):
+    """按顺序向页面追加iter_batches生成的一批批块（边解析边上传）。
+
+    start为第一批中第一个块在整个文档中的序号，也就是页面中已有的块数，
+    每批成功后调用on_chunk(下一个待追加的块序号)，用于记录断点。
+    """
+    chunk_end = start
+    for chunk in batches:
+        chunk_start, chunk_end = chunk_end, chunk_end + len(chunk)
+        begin = time.monotonic()
+        if not append_chunk(api_key, page_id, chunk, chunk_start):
+            return False
+        elapsed = time.monotonic() - begin
+        echo(f"  追加第{chunk_start + 1}~{chunk_end}块，耗时{elapsed * 1000:.0f}ms")
+        if on_chunk:
+            on_chunk(chunk_end)
+    return True
+
+
+def resume_upload(
+    api_key, markdown_file_path, title, checkpoint, blocks=None, title_index=None
+):
+    """从断点继续追加上次没有完成的块，blocks为已经解析好的块。
+
+    从页面中实际已有的块数继续，而不是断点中记录的序号：最后一批可能已经追加成功但没来得及记录。
+    文件在中断后被修改过，或者解析、拆分的配置变了（块序号不再对应）时，
+    归档没有上传完的页面并返回None，按正常流程重新判断是否需要更新。
+    """
+    page_id = checkpoint["page_id"]
+    replaces = checkpoint.get("replaces")
+    digest = blocks_digest()
+    if file_hash(markdown_file_path) != checkpoint["hash"]:
+        reason = "文件已修改"
+    elif checkpoint.get("digest") != digest:
+        reason = "解析或拆分配置已变化"
     else:
-        print(f"❌长文本添加失败: {response.text}")
+        reason = None
+    if reason:
+        # 旧页面（replaces）还在，按正常流程重新上传
+        echo(f"页面《{title}》的断点已失效（{reason}），归档没有上传完的页面")
+        archive_page(api_key, page_id, title)
+        if title_index is not None:
+            title_index.remove(title, page_id)
+        checkpoints.clear(markdown_file_path)
+        return None
 
+    with metrics.stage("append"):
+        existing = get_page_blocks(api_key, page_id)
+    if existing is None:
+        return "failed", page_id
+    start = len(existing)
+    if start != checkpoint["index"]:
+        echo(f"⚠️页面《{title}》实际有{start}块，断点记录为{checkpoint['index']}块")
+    echo(f"页面《{title}》从第{start + 1}块继续上传")
 
-# 检查是否存在指定的属性，如果不存在则创建
-def check_and_create_property(api_key, database_id, property_name, property_type):
-    properties = get_database_properties(api_key, database_id)
-    if properties and property_name not in properties:
-        url = f"https://api.notion.com/v1/databases/{database_id}"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Notion-Version": "2022-06-28",
-            "Content-Type": "application/json",
+    def save_checkpoint(index):
+        checkpoints.set(
+            markdown_file_path,
+            page_id,
+            index,
+            checkpoint["hash"],
+            checkpoint["action"],
+            replaces,
+            digest,
+        )
+
+    if blocks is None:
+        blocks = prepare_blocks(markdown_file_path)
+    blocks = islice(blocks, start, None)
+    with metrics.stage("append"):
+        appended = upload_blocks_to_page(
+            api_key, page_id, iter_batches(blocks), start, save_checkpoint
+        )
+    if not appended:
+        return "failed", page_id
+    checkpoints.clear(markdown_file_path)
+    if replaces:
+        archive_queue.add(replaces, title)
+    return ("created" if checkpoint["action"] == "create" else "updated"), page_id
+
+
+# 同步时数据库必须具备的属性及其类型
+REQUIRED_PROPERTIES = {
+    "last modified": "date",
+    "category": "select",
+    "date": "date",
+    "status": "select",
+    "type": "select",
+}
+
+
+# 获取或创建属性失败后，这段时间内（秒）直接返回失败，不让每个文件都再等一轮重试
+SCHEMA_RETRY_INTERVAL = 60
+
+
+class DatabaseSchemaCache:
+    """缓存数据库的属性，一次同步过程中每个数据库只获取一次。
+
+    只有在创建了新属性（数据库结构确实发生变化）时才会刷新缓存。
+    访问Notion时不持有锁：同一组属性只有一个线程去检查，其他线程等待它的结果。
+    """
+
+    def __init__(self):
+        self._properties = {}
+        # (数据库id, 属性名...) -> 检查结果的Future，失败时记录失败的时间
+        self._ensured = {}
+        self._failed_at = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key, database_id, refresh=False):
+        with self._lock:
+            properties = None if refresh else self._properties.get(database_id)
+        if properties is None:
+            properties = get_database_properties(api_key, database_id)
+            if properties is not None:
+                with self._lock:
+                    self._properties[database_id] = properties
+        return properties
+
+    def invalidate(self, database_id):
+        with self._lock:
+            self._properties.pop(database_id, None)
+            for key in [key for key in self._ensured if key[0] == database_id]:
+                del self._ensured[key]
+                self._failed_at.pop(key, None)
+
+    def ensure_properties(self, api_key, database_id, required):
+        """检查required中的属性（名称->类型）是否存在，缺失的用一次PATCH全部创建"""
+        key = (database_id, *sorted(required))
+        with self._lock:
+            future = self._ensured.get(key)
+            owner = future is None or (
+                key in self._failed_at
+                and time.monotonic() - self._failed_at[key] > SCHEMA_RETRY_INTERVAL
+            )
+            if owner:
+                future = self._ensured[key] = Future()
+                self._failed_at.pop(key, None)
+        if not owner:
+            return future.result()
+        try:
+            ok = self._ensure_properties(api_key, database_id, required)
+        except Exception as e:
+            self._finish(key, future, False)
+            future.set_exception(e)
+            raise
+        self._finish(key, future, ok)
+        future.set_result(ok)
+        return ok
+
+    def _finish(self, key, future, ok):
+        if not ok:
+            with self._lock:
+                if self._ensured.get(key) is future:
+                    self._failed_at[key] = time.monotonic()
+
+    def _ensure_properties(self, api_key, database_id, required):
+        properties = self.get(api_key, database_id)
+        if properties is None:
+            return False
+        missing = {
+            name: {prop_type: {}}
+            for name, prop_type in required.items()
+            if name not in properties
         }
-        data = {"properties": {property_name: {property_type: {}}}}
-        response = requests.patch(url, headers=headers, json=data)
+        if not missing:
+            return True
+        response = get_client(api_key).patch(
+            f"/databases/{database_id}", json={"properties": missing}
+        )
         if response.status_code in [200, 201]:
-            print(f"属性 '{property_name}' 已成功创建")
-        else:
-            print("创建属性失败:", response.text)
-    elif properties:
-        pass
+            # 返回的是更新后的数据库对象，直接用它刷新缓存
+            with self._lock:
+                self._properties[database_id] = response.json()["properties"]
+            for name in missing:
+                echo(f"属性 '{name}' 已成功创建")
+            return True
+        echo("创建属性失败:", response.text)
+        # 可能是其他客户端修改了数据库结构，下次重新获取
+        with self._lock:
+            self._properties.pop(database_id, None)
+        return False
+
+
+schema_cache = DatabaseSchemaCache()
+
+
+# 检查是否存在指定的属性，如果不存在则创建
+def check_and_create_property(api_key, database_id, property_name, property_type):
+    return schema_cache.ensure_properties(
+        api_key, database_id, {property_name: property_type}
+    )
+
+
+def get_page_title(page):
+    """从查询结果中的页面对象取出标题文本"""
+    for prop in page["properties"].values():
+        if prop["type"] == "title":
+            return "".join(t["plain_text"] for t in prop["title"])
+    return ""
+
+
+def get_page_last_modified(page):
+    prop = page["properties"].get("last modified") or {}
+    return (prop.get("date") or {}).get("start")
+
+
+class TitleIndex:
+    """标题 -> [(page_id, last modified)] 的内存索引。
+
+    启动时用分页查询一次性读取整个数据库，之后每个文件的新建/更新/跳过判断都在本地完成。
+    """
+
+    def __init__(self, api_key, database_id):
+        self.api_key = api_key
+        self.database_id = database_id
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def build(self):
+        """分页读取数据库中的所有页面，成功返回True"""
+        pages = {}
+        payload = {"page_size": 100}
+        while True:
+            response = get_client(self.api_key).post(
+                f"/databases/{self.database_id}/query", json=payload
+            )
+            if response.status_code != 200:
+                echo(f"❌读取数据库页面失败: {response.text}")
+                return False
+            data = response.json()
+            for page in data.get("results", []):
+                entry = (page["id"], get_page_last_modified(page))
+                pages.setdefault(get_page_title(page), []).append(entry)
+            if not data.get("has_more"):
+                break
+            payload["start_cursor"] = data["next_cursor"]
+
+        for title, entries in pages.items():
+            if len(entries) > 1:
+                echo(f"⚠️数据库中存在{len(entries)}个标题为《{title}》的页面")
+        with self._lock:
+            self._pages = pages
+        return True
+
+    def lookup(self, title):
+        with self._lock:
+            return list(self._pages.get(title, []))
+
+    def set(self, title, page_id, last_modified, replaces=None):
+        """记录新建的页面，replaces为被它取代（已归档）的旧页面id"""
+        with self._lock:
+            entries = [e for e in self._pages.get(title, []) if e[0] != replaces]
+            entries.append((page_id, last_modified))
+            self._pages[title] = entries
+
+    def remove(self, title, page_id):
+        """移除已归档的页面"""
+        with self._lock:
+            entries = [e for e in self._pages.get(title, []) if e[0] != page_id]
+            self._pages[title] = entries
+
+
+def same_minute(notion_last_modified, last_modified):
+    """Notion中的last modified与本地的修改时间是否相同，精确到分钟"""
+    if not notion_last_modified:
+        return False
+    notion_time = datetime.fromisoformat(notion_last_modified).replace(tzinfo=None)
+    local_time = datetime.fromisoformat(last_modified).replace(tzinfo=None)
+    return notion_time.strftime("%Y-%m-%d %H:%M") == local_time.strftime("%Y-%m-%d %H:%M")
+
+
+def decide_action(title, entries, last_modified, force_update=False):
+    """根据已有页面的(page_id, last modified)列表决定新建、更新还是跳过"""
+    if not entries:
+        return "create", None  # No existing entry found, need to create a new one.
+    if len(entries) > 1:
+        # 标题重复时以最近修改的页面为准
+        entries = sorted(entries, key=lambda e: e[1] or "", reverse=True)
+        echo(f"⚠️《{title}》有{len(entries)}个同名页面，使用最近修改的页面")
+    page_id, notion_last_modified = entries[0]
+    if force_update or not notion_last_modified:
+        return "update", page_id
+    if not same_minute(notion_last_modified, last_modified):
+        return "update", page_id  # Existing entry is outdated, needs update.
+    return "skip", page_id  # Entry exists and is up-to-date.
 
 
 def check_if_exists_and_updated(
-    database_id, api_key, title, last_modified, force_update=False
+    database_id, api_key, title, last_modified, force_update=False, title_index=None
 ):
-    # 检查并创建Date类型的"last modified"属性
-    check_and_create_property(api_key, database_id, "last modified", "date")
-    check_and_create_property(api_key, database_id, "category", "select")
-    check_and_create_property(api_key, database_id, "date", "date")
-    check_and_create_property(api_key, database_id, "status", "select")
-    check_and_create_property(api_key, database_id, "type", "select")
-    url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28",
-    }
-    payload = {"filter": {"property": "title", "title": {"equals": title}}}
-    response = requests.post(url, json=payload, headers=headers)
+    # 检查并创建"last modified"等属性，数据库结构在整个同步过程中只获取一次
+    with metrics.stage("schema"):
+        ok = schema_cache.ensure_properties(api_key, database_id, REQUIRED_PROPERTIES)
+    if not ok:
+        # 缺少属性时创建页面也会失败，不再查询和上传
+        return "error", f"数据库缺少属性且无法创建: {', '.join(REQUIRED_PROPERTIES)}"
+    if title_index is not None:
+        entries = title_index.lookup(title)
+    else:
+        payload = {"filter": {"property": "title", "title": {"equals": title}}}
+        response = get_client(api_key).post(
+            f"/databases/{database_id}/query", json=payload
+        )
+        if response.status_code != 200:
+            return "error", response.text
+        entries = [
+            (result["id"], get_page_last_modified(result))
+            for result in response.json().get("results", [])
+        ]
+    return decide_action(title, entries, last_modified, force_update)
+
+
+def update_page_incrementally(api_key, page_id, title, blocks, last_modified):
+    """原地更新页面内容和last modified，返回True表示成功，None表示需要改为重建页面"""
+    try:
+        requests_sent = update_page_blocks(api_key, page_id, blocks)
+    except RuntimeError as e:
+        echo(f"❌页面《{title}》增量更新失败: {e}")
+        return False
+    if requests_sent is None:
+        return None
+    properties = {"last modified": {"date": {"start": last_modified}}}
+    response = get_client(api_key).patch(
+        f"/pages/{page_id}", json={"properties": properties}
+    )
     if response.status_code != 200:
-        return "error", response.text
+        echo(f"❌页面《{title}》更新last modified失败: {response.text}")
+        return False
+    echo(f"✅页面《{title}》增量更新成功，修改请求{requests_sent}个")
+    return True
 
-    results = response.json().get("results", [])
-    if not results:
-        return "create", None  # No existing entry found, need to create a new one.
-    # 检查命令行参数，如果有参数'-u'，则将force_update设为True
-    # 即使文本内容没变化，也可以强制更新
-    if "-u" in sys.argv:
-        force_update = True
 
-    for result in results:
-        if force_update:
-            return "update", result["id"]
-        notion_last_modified = datetime.fromisoformat(
-            result["properties"]["last modified"]["date"]["start"]
-        ).replace(tzinfo=None)
-        local_last_modified = datetime.fromisoformat(last_modified).replace(tzinfo=None)
+def new_page_properties(title, current_time, last_modified):
+    """新建页面时的属性"""
+    return {
+        "title": {"title": [{"text": {"content": title}}]},
+        "category": {"select": {"name": "未分类"}},
+        "date": {"date": {"start": current_time}},
+        "status": {"select": {"name": "Published"}},
+        "type": {"select": {"name": "Post"}},
+        "last modified": {"date": {"start": last_modified}},
+    }
 
-        # Compare dates to the minute precision
-        if notion_last_modified.strftime(
-            "%Y-%m-%d %H:%M"
-        ) != local_last_modified.strftime("%Y-%m-%d %H:%M"):
-            return "update", result["id"]  # Existing entry is outdated, needs update.
 
-    return "skip", None  # Entry exists and is up-to-date.
+def new_page_cover():
+    return {"type": "external", "external": {"url": get_unique_cover_url()}}
 
 
-def upload_markdown_to_notion(database_id, api_key, markdown_file_path):
+def upload_markdown_to_notion(
+    database_id,
+    api_key,
+    markdown_file_path,
+    title_index=None,
+    incremental=False,
+    force_update=False,
+    blocks=None,
+    stats=None,
+):
+    """同步单个markdown文件，返回(处理结果, page_id)，处理结果为created/updated/skipped/failed。
+
+    force_update为True时，即使修改时间与Notion中的相同（精确到分钟）也更新页面。
+    blocks和stats为在其他进程中解析好的块及其统计，为None时边解析边上传。
+    """
+    if blocks is not None:
+        # 解析进程中没有同步图床，本地图片还是占位地址
+        blocks = list(resolve_local_images(blocks))
     title = os.path.splitext(os.path.basename(markdown_file_path))[0]
     current_time = (datetime.now() - timedelta(hours=8)).isoformat()
     last_modified = get_file_last_modified(markdown_file_path)
-    blocks = parse_markdown(markdown_file_path)
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28",
-    }
-    action, page_id = check_if_exists_and_updated(
-        database_id, api_key, title, last_modified
-    )
+    # 上次上传中断的长文档，直接从断点继续
+    checkpoint = checkpoints.get(markdown_file_path)
+    if checkpoint:
+        result = resume_upload(
+            api_key, markdown_file_path, title, checkpoint, blocks, title_index
+        )
+        if result is not None:
+            return result
+
+    with metrics.stage("check"):
+        action, page_id = check_if_exists_and_updated(
+            database_id,
+            api_key,
+            title,
+            last_modified,
+            force_update=force_update,
+            title_index=title_index,
+        )
+    if action == "error":
+        echo(f"❌检查《{title}》失败: {page_id}")
+        return "failed", None
+
+    if action == "update" and incremental:
+        new_blocks = blocks
+        if new_blocks is None:
+            new_blocks = list(prepare_blocks(markdown_file_path))
+        with metrics.stage("diff"):
+            updated = update_page_incrementally(
+                api_key, page_id, title, new_blocks, last_modified
+            )
+        if updated is not None:
+            if updated and title_index is not None:
+                title_index.set(title, page_id, last_modified, page_id)
+            return ("updated" if updated else "failed"), page_id
+        echo(f"页面《{title}》无法增量更新，改为重建页面")
 
     if action == "update":
-        old_properties, old_cover = get_page_properties(database_id, api_key, page_id)
+        with metrics.stage("properties"):
+            old_properties, old_cover = get_page_properties(
+                database_id, api_key, page_id
+            )
         if not old_properties:
-            print("❌获取旧属性失败，停止更新。")
-            return
-        if archive_page(api_key, page_id, title):
-            # 保留除了last modified外的所有旧属性，更新last modified
-            old_properties["last modified"] = {"date": {"start": last_modified}}
-        else:
-            print("❌归档旧页面失败，停止更新。")
-            return
-
-    cover_image_url = get_unique_cover_url()
+            echo("❌获取旧属性失败，停止更新。")
+            return "failed", None
+        # 保留除了last modified外的所有旧属性，更新last modified
+        # 旧页面等新页面上传完成后再归档，上传失败时旧页面的内容不会丢失
+        old_properties["last modified"] = {"date": {"start": last_modified}}
 
     if action in ["create", "update"]:
+        # 边解析边上传：第一批块随页面一起创建，其余的块解析出来后分批追加
+        if blocks is None:
+            stats = {}
+            blocks = prepare_blocks(markdown_file_path, stats)
+        else:
+            stats = dict(stats or {})
+        batches = iter_batches(blocks)
+        first_blocks = next(batches, [])
         # 创建新页面或更新页面时使用old_properties
         payload = {
             "parent": {"database_id": database_id},
             "properties": (
                 old_properties
                 if action == "update"
-                else {
-                    "title": {"title": [{"text": {"content": title}}]},
-                    "category": {"select": {"name": "未分类"}},
-                    "date": {"date": {"start": current_time}},
-                    "status": {"select": {"name": "Published"}},
-                    "type": {"select": {"name": "Post"}},
-                    "last modified": {"date": {"start": last_modified}},
-                }
+                else new_page_properties(title, current_time, last_modified)
             ),
-            "cover": (
-                old_cover
-                if action == "update"
-                else {"type": "external", "external": {"url": cover_image_url}}
-            ),
-            "children": blocks[:100],  # 只取前100个块来创建页面
+            "cover": old_cover if action == "update" else new_page_cover(),
+            "children": first_blocks,  # 只取第一批（最多100个）块来创建页面
         }
-        response = requests.post(
-            f"https://api.notion.com/v1/pages", headers=headers, json=payload
-        )
-        if response.status_code in [200, 201]:
-            new_page_id = response.json()["id"]
-            print(f"✅页面《{title}》创建成功")
+        compact(payload["properties"], stats)
+        replaces = page_id if action == "update" else None
+        with metrics.stage("create_page"):
+            new_page_id = create_page(
+                database_id, api_key, payload, title, last_modified, replaces
+            )
+        if new_page_id is not None:
+            echo(f"✅页面《{title}》创建成功")
+            if title_index is not None:
+                title_index.set(title, new_page_id, last_modified, replaces)
+
+            # 如果有更多块需要追加，每批成功后记录断点
+            next_batch = next(batches, None)
+            if next_batch is not None:
+                content_hash = file_hash(markdown_file_path)
+                digest = blocks_digest()
+
+                def save_checkpoint(index):
+                    checkpoints.set(
+                        markdown_file_path,
+                        new_page_id,
+                        index,
+                        content_hash,
+                        action,
+                        replaces,
+                        digest,
+                    )
 
-            # 如果有更多块需要追加
-            if len(blocks) > 100:
-                upload_blocks_to_page(new_page_id, blocks[100:], headers)
+                save_checkpoint(len(first_blocks))
+                with metrics.stage("append"):
+                    appended = upload_blocks_to_page(
+                        api_key,
+                        new_page_id,
+                        chain([next_batch], batches),
+                        len(first_blocks),
+                        save_checkpoint,
+                    )
+                if not appended:
+                    return "failed", new_page_id
+                checkpoints.clear(markdown_file_path)
+            if replaces:
+                # 新页面已经完整上传，旧页面放入队列，运行结束时统一归档
+                archive_queue.add(replaces, title)
+            report_payload_stats(stats)
+            metrics.add_counters(stats)
+            return ("created" if action == "create" else "updated"), new_page_id
         else:
-            print(f"❌页面《{title}》创建/更新失败", response.text)
+            return "failed", None
     else:
-        print(f"⛔无需对《{title}》内容进行更改 。")
+        echo(f"⛔无需对《{title}》内容进行更改 。")
+        return "skipped", page_id
@@ -0,0 +1,177 @@
+# 复用连接的Notion HTTP客户端，所有对Notion API的请求都经过这里
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from config import (
+    http_pool_size,
+    http_timeout,
+    max_retries,
+    retry_backoff,
+    notion_base_url,
+)
+from rate_limiter import notion_limiter
+from payload import encode_json
+from metrics import metrics
+from console import echo
+
+NOTION_API_URL = notion_base_url
+NOTION_VERSION = "2022-06-28"
+# 这些状态码表示服务端暂时不可用，可以重试
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 非幂等请求只在这些状态码时重试：请求被限流拒绝，Notion没有执行
+SAFE_RETRY_STATUS = {429}
+MAX_BACKOFF = 60
+
+
+def backoff_delay(attempt, base=retry_backoff):
+    """带随机抖动的指数退避时间"""
+    return random.uniform(0, min(MAX_BACKOFF, base * 2**attempt))
+
+
+def parse_retry_after(response):
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_idempotent(method, path):
+    """重复发送不会产生副作用的请求。
+
+    创建页面（POST /pages）和追加块（PATCH /blocks/{id}/children）重复执行会产生
+    重复的页面或块；数据库查询虽然是POST，但只读取数据
+    """
+    if method in ("GET", "DELETE"):
+        return True
+    if method == "POST":
+        return path.endswith("/query") or path == "/search"
+    return not path.endswith("/children")
+
+
+def never_sent(error):
+    """网络错误发生在建立连接阶段，请求没有发出"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class NotionClient:
+    """持有一个keep-alive的requests.Session，统一设置请求头、超时、限流和重试。
+
+    :param api_key: Notion集成的密钥
+    :param pool_size: 连接池大小，建议不小于并发上传的线程数
+    :param timeout: 单个请求的超时时间（秒）
+    :param max_retries: 429、5xx和网络错误时最多重试的次数
+    """
+
+    def __init__(
+        self,
+        api_key,
+        pool_size=http_pool_size,
+        timeout=http_timeout,
+        max_retries=max_retries,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+                "Notion-Version": NOTION_VERSION,
+            }
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, path, **kwargs):
+        """发送请求，path为相对于API根地址的路径，例如"/pages"。
+
+        429时严格按照Retry-After等待，并降低所有线程共享的请求速率；
+        5xx和网络错误按指数退避重试，重试次数用完后返回最后一次的响应或抛出异常。
+        非幂等的请求可能已经被Notion执行，只重试429和连接阶段的错误，
+        其他失败直接交给调用方，由notion_api.send_unless_applied确认请求没有生效后再重试。
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if "json" in kwargs:
+            # 紧凑编码，中文不转义，比requests默认的编码小很多
+            kwargs["data"] = encode_json(kwargs.pop("json"))
+        url = NOTION_API_URL + path
+        bytes_sent = len(kwargs.get("data") or b"")
+        idempotent = is_idempotent(method, path)
+        retry_status = RETRY_STATUS if idempotent else SAFE_RETRY_STATUS
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            with metrics.stage("rate_limit_wait"):
+                notion_limiter.acquire()
+            begin = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.record_request(
+                    method, path, "error", time.monotonic() - begin, bytes_sent, attempt > 0
+                )
+                if last_attempt or not (idempotent or never_sent(e)):
+                    raise
+                delay = backoff_delay(attempt)
+                echo(f"⚠️{method} {path} 网络错误，{delay:.1f}秒后重试: {e}")
+                with metrics.stage("retry_wait"):
+                    time.sleep(delay)
+                continue
+            metrics.record_request(
+                method,
+                path,
+                response.status_code,
+                time.monotonic() - begin,
+                bytes_sent,
+                attempt > 0,
+            )
+
+            if response.status_code not in retry_status:
+                notion_limiter.recover()
+                return response
+            if last_attempt:
+                return response
+            retry_after = parse_retry_after(response)
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            if response.status_code == 429:
+                # 暂停令牌桶，所有线程一起等待，而不是各自继续撞限流
+                notion_limiter.throttle(delay)
+            else:
+                with metrics.stage("retry_wait"):
+                    time.sleep(delay)
+            echo(f"⚠️{method} {path} 返回{response.status_code}，{delay:.1f}秒后重试")
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key):
+    """返回该api_key共享的客户端，一次同步过程中所有线程复用同一个连接池"""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = NotionClient(api_key)
+        return client
@@ -0,0 +1,171 @@
+# 解析结果的磁盘缓存：按 文件内容hash + 解析器版本 + 影响解析结果的配置 保存解析出的块。
+# 内容没变的文件（例如使用-u强制更新，或Notion中的页面被重置后）直接读取缓存，不再解析。
+# 每个块用marshal序列化，每100个一组写入，读写都是流式的，大文件也不需要一次载入内存
+import hashlib
+import marshal
+import os
+import struct
+import sys
+import threading
+from config import image_host_url, parse_cache_dir, parse_cache_size
+from markdown_parser import PARSER_VERSION, iter_blocks
+from sync_manifest import file_hash
+from console import echo
+
+CHUNK_SIZE = 100
+# 每组块之前写入其序列化后的长度；最后写入长度0，读到它才说明缓存文件是完整的
+LENGTH = struct.Struct("<I")
+
+
+class ParseCache:
+    """目录中每个缓存文件对应一个解析结果，总大小超过max_bytes时删除最久没有使用的文件"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = max_bytes > 0
+        self._size = None
+        self._config_digest = None
+        self._lock = threading.Lock()
+
+    def config_digest(self):
+        """解析器版本、marshal格式和是否设置了图床，任何一项变化都会使所有缓存失效。
+
+        缓存中的本地图片是占位地址（见markdown_parser.resolve_local_images），与图床中的文件无关
+        """
+        if self._config_digest is None:
+            sha = hashlib.sha256()
+            parts = [
+                PARSER_VERSION,
+                marshal.version,
+                sys.version_info[:2],
+                image_host_url == "xxx",
+            ]
+            sha.update(repr(parts).encode("utf-8"))
+            self._config_digest = sha.hexdigest()
+        return self._config_digest
+
+    def key(self, file_path):
+        sha = hashlib.sha256()
+        sha.update(self.config_digest().encode("ascii"))
+        sha.update(file_hash(file_path).encode("ascii"))
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".bin")
+
+    def iter_blocks(self, file_path):
+        """与markdown_parser.iter_blocks相同，命中缓存时从缓存读取，否则边解析边写入缓存"""
+        if not self.enabled:
+            return iter_blocks(file_path)
+        path = self._path(self.key(file_path))
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return self._parse_and_store(file_path, path)
+        # 更新修改时间，淘汰时按修改时间判断最近是否使用过
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return self._load(f, file_path, path)
+
+    def _load(self, f, file_path, path):
+        count = 0
+        with f:
+            while True:
+                header = f.read(LENGTH.size)
+                if len(header) < LENGTH.size:
+                    break
+                (size,) = LENGTH.unpack(header)
+                if size == 0:
+                    return
+                try:
+                    chunk = marshal.loads(f.read(size))
+                except (EOFError, ValueError, TypeError):
+                    break
+                for data in chunk:
+                    count += 1
+                    yield marshal.loads(data)
+        # 缓存文件损坏：删除后跳过已经返回的块，重新解析
+        echo(f"⚠️解析缓存{path}已损坏，重新解析{file_path}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        for i, block in enumerate(iter_blocks(file_path)):
+            if i >= count:
+                yield block
+
+    def _parse_and_store(self, file_path, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        completed = False
+
+        def write_chunk(f, chunk):
+            data = marshal.dumps(chunk)
+            f.write(LENGTH.pack(len(data)))
+            f.write(data)
+
+        try:
+            with open(tmp_path, "wb") as f:
+                chunk = []
+                for block in iter_blocks(file_path):
+                    # 在交给调用方之前序列化，调用方之后修改块（例如去掉默认值）不影响缓存
+                    if len(chunk) == CHUNK_SIZE:
+                        write_chunk(f, chunk)
+                        chunk = []
+                    chunk.append(marshal.dumps(block))
+                    yield block
+                if chunk:
+                    write_chunk(f, chunk)
+                f.write(LENGTH.pack(0))
+            os.replace(tmp_path, path)
+            completed = True
+            self._added(os.path.getsize(path))
+        finally:
+            # 调用方没有读完（例如上传失败）时不保留不完整的缓存
+            if not completed:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _entries(self):
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".bin"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _added(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """删除最久没有使用的缓存，直到总大小低于上限的90%"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+
+parse_cache = ParseCache(parse_cache_dir, parse_cache_size)
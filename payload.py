@@ -0,0 +1,217 @@
+# 请求体的压缩和编码：去掉与Notion默认值相同的字段，减少每个页面发送的字节数
+import json
+from config import json_encoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Notion中富文本的默认样式，与之相同的字段可以省略
+DEFAULT_ANNOTATIONS = {
+    "bold": False,
+    "italic": False,
+    "underline": False,
+    "strikethrough": False,
+    "code": False,
+    "color": "default",
+}
+
+
+def _field_size(key, value):
+    """字段在紧凑JSON中占用的字节数（包括冒号和逗号）"""
+    return len(encode_json({key: value})) - 1
+
+
+def compact(obj, stats=None):
+    """原地去掉富文本中默认的annotations字段和"color": "default"，返回obj。
+
+    stats为字典时，把与完整写出默认值相比节省的字节数累加到stats["bytes_saved"]。
+    """
+    saved = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            stack.extend(item)
+            continue
+        if not isinstance(item, dict):
+            continue
+        if item.get("type") == "text" and "text" in item:
+            annotations = item.get("annotations") or {}
+            for key in [
+                k
+                for k, v in annotations.items()
+                if k in DEFAULT_ANNOTATIONS and v == DEFAULT_ANNOTATIONS[k]
+            ]:
+                del annotations[key]
+            if annotations:
+                saved += FULL_ANNOTATIONS_SIZE - _field_size("annotations", annotations)
+            else:
+                saved += FULL_ANNOTATIONS_SIZE
+                item.pop("annotations", None)
+        if item.get("color") == "default":
+            saved += COLOR_DEFAULT_SIZE
+            del item["color"]
+        stack.extend(v for v in item.values() if isinstance(v, (dict, list)))
+    if stats is not None:
+        stats["bytes_saved"] = stats.get("bytes_saved", 0) + saved
+    return obj
+
+
+def compact_blocks(blocks, stats=None):
+    """逐个压缩块，可以直接包装iter_blocks生成器"""
+    for block in blocks:
+        yield compact(block, stats)
+
+
+def encode_json(obj):
+    """编码为紧凑的UTF-8 JSON，中文不转义为\\uXXXX；安装了orjson时使用orjson"""
+    if orjson is not None and json_encoder != "json":
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# 完整写出默认annotations和默认颜色时占用的字节数
+FULL_ANNOTATIONS_SIZE = _field_size("annotations", DEFAULT_ANNOTATIONS)
+COLOR_DEFAULT_SIZE = _field_size("color", "default")
+
+
+# Notion API 的请求限制
+MAX_BLOCKS_PER_REQUEST = 100  # 每次请求最多创建的块数
+MAX_REQUEST_BYTES = 450 * 1024  # 请求体上限为500KB，留出余量给页面属性等字段
+MAX_TEXT_LENGTH = 2000  # 单个富文本片段的最大长度
+MAX_RICH_TEXT_ITEMS = 100  # 单个块中富文本片段的最大个数
+MAX_EQUATION_LENGTH = 1000  # 公式的最大长度
+MAX_URL_LENGTH = 2000  # 链接的最大长度
+# 单个块中所有富文本的字节数上限，保证任何一个块都能单独放进一个请求
+MAX_BLOCK_TEXT_BYTES = 300 * 1024
+# 拆分文本和块时用到的限制，任何一项变化都会改变文档拆分后每个块的序号
+SPLIT_LIMITS = (
+    MAX_TEXT_LENGTH,
+    MAX_RICH_TEXT_ITEMS,
+    MAX_EQUATION_LENGTH,
+    MAX_URL_LENGTH,
+    MAX_BLOCK_TEXT_BYTES,
+)
+
+
+def _utf16_length(text):
+    # Notion按UTF-16计算长度，emoji等字符占2个长度
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_text(text, limit=MAX_TEXT_LENGTH):
+    """把文本切分为长度不超过limit的若干段"""
+    pieces = []
+    start = 0
+    while start < len(text):
+        size = limit
+        piece = text[start : start + size]
+        extra = _utf16_length(piece) - limit
+        while extra > 0:
+            size -= extra
+            piece = text[start : start + size]
+            extra = _utf16_length(piece) - limit
+        pieces.append(piece)
+        start += size
+    return pieces
+
+
+def _count(stats, key, n=1):
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + n
+
+
+def _split_spans(rich_text, stats):
+    """拆分超长的富文本片段，去掉超长的链接"""
+    spans = []
+    for span in rich_text:
+        text = span.get("text")
+        if span.get("type") != "text" or not text:
+            spans.append(span)
+            continue
+        link = text.get("link")
+        if link and len(link.get("url", "")) > MAX_URL_LENGTH:
+            text = {"content": text["content"]}
+            span = dict(span, text=text)
+            _count(stats, "dropped_links")
+        content = text["content"]
+        if len(content) <= MAX_TEXT_LENGTH // 2 or _utf16_length(content) <= MAX_TEXT_LENGTH:
+            spans.append(span)
+            continue
+        pieces = split_text(content)
+        _count(stats, "split_spans", len(pieces) - 1)
+        for piece in pieces:
+            spans.append(dict(span, text=dict(text, content=piece)))
+    return spans
+
+
+def _group_spans(spans):
+    """把富文本片段分组，每组不超过100个片段，且文本总字节数不超过单个块的上限"""
+    group, group_bytes = [], 0
+    for span in spans:
+        size = len((span.get("text") or {}).get("content", "").encode("utf-8"))
+        if group and (
+            len(group) >= MAX_RICH_TEXT_ITEMS or group_bytes + size > MAX_BLOCK_TEXT_BYTES
+        ):
+            yield group
+            group, group_bytes = [], 0
+        group.append(span)
+        group_bytes += size
+    yield group
+
+
+def _text_block(block_type, text):
+    return {
+        "object": "block",
+        "type": block_type,
+        block_type: {"rich_text": [{"type": "text", "text": {"content": text}}]},
+    }
+
+
+def normalize_block(block, stats=None):
+    """检查块是否满足Notion的大小限制，返回满足限制的一个或多个块"""
+    block_type = block["type"]
+    body = block.get(block_type) or {}
+    if "rich_text" in body:
+        spans = _split_spans(body["rich_text"], stats)
+        groups = list(_group_spans(spans))
+        if len(groups) == 1:
+            body["rich_text"] = spans
+            return [block]
+        _count(stats, "split_blocks", len(groups) - 1)
+        return [dict(block, **{block_type: dict(body, rich_text=g)}) for g in groups]
+    if block_type == "equation" and len(body.get("expression", "")) > MAX_EQUATION_LENGTH:
+        # 超长公式改为LaTeX代码块
+        _count(stats, "converted_blocks")
+        code = _text_block("code", body["expression"])
+        code["code"]["language"] = "latex"
+        return normalize_block(code, stats)
+    if block_type in ("image", "embed", "bookmark"):
+        url = (body.get(body.get("type")) or body).get("url", "")
+        if len(url) > MAX_URL_LENGTH:
+            # 链接过长无法创建，改为显示链接文本
+            _count(stats, "converted_blocks")
+            return normalize_block(_text_block("paragraph", url), stats)
+    return [block]
+
+
+def normalize_blocks(blocks, stats=None):
+    """逐个检查并拆分块，可以直接包装iter_blocks生成器"""
+    for block in blocks:
+        yield from normalize_block(block, stats)
+
+
+def iter_batches(blocks, max_blocks=MAX_BLOCKS_PER_REQUEST, max_bytes=MAX_REQUEST_BYTES):
+    """把块分成一批批请求，每批不超过max_blocks个块、编码后不超过max_bytes字节"""
+    batch, batch_bytes = [], 0
+    for block in blocks:
+        size = len(encode_json(block)) + 1
+        if batch and (len(batch) >= max_blocks or batch_bytes + size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(block)
+        batch_bytes += size
+    if batch:
+        yield batch
@@ -0,0 +1,91 @@
+# 解析和上传分开的两段流水线：进程池并行解析文件（占满多个CPU核心），
+# 上传线程从有界队列中取出解析结果上传（受Notion限流约束）。
+# 队列满时暂停提交解析任务，解析比上传快时内存占用也不会无限增长
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from notion_api import prepare_blocks
+from parse_cache import parse_cache
+from sync_manifest import file_snapshot
+from console import echo
+
+_DONE = object()
+
+
+def init_parse_worker(use_parse_cache=True):
+    """解析进程的初始化函数：与主进程一样使用或跳过解析缓存"""
+    parse_cache.enabled = parse_cache.enabled and use_parse_cache
+
+
+def parse_file(path):
+    """在子进程中解析文件，返回 (路径, 块列表, 统计, 耗时, 错误信息, 解析前的文件状态)。
+
+    文件状态见sync_manifest.file_snapshot，在解析之前获取，同步成功后记入清单
+    """
+    start = time.monotonic()
+    stats = {}
+    try:
+        snapshot = file_snapshot(path)
+        # 本地图片保留占位地址，由主进程上传前换成图床地址，解析进程不访问图床
+        blocks = list(prepare_blocks(path, stats, resolve_images=False))
+    except Exception as e:
+        return path, None, None, time.monotonic() - start, str(e), None
+    return path, blocks, stats, time.monotonic() - start, None, snapshot
+
+
+def run_pipeline(paths, upload, parse_workers, upload_workers, queue_size):
+    """解析并上传paths中的文件，返回 {路径: 处理结果}。
+
+    upload(*parse_file的返回值) 在上传线程中调用，返回处理结果
+    """
+    parsed = queue.Queue(maxsize=max(1, queue_size))
+    results = {}
+    results_lock = threading.Lock()
+
+    def upload_worker():
+        while True:
+            item = parsed.get()
+            if item is _DONE:
+                return
+            try:
+                status = upload(*item)
+            except Exception as e:
+                # 一个文件出错不能让线程退出，否则队列无人消费，解析进程会在put处一直等待
+                echo(f"❌处理{item[0]}时出错: {e}")
+                status = "failed"
+            with results_lock:
+                results[item[0]] = status
+
+    workers = [
+        threading.Thread(target=upload_worker, daemon=True)
+        for _ in range(max(1, upload_workers))
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=parse_workers,
+            initializer=init_parse_worker,
+            initargs=(parse_cache.enabled,),
+        ) as pool:
+            remaining = iter(paths)
+            running = set()
+            while True:
+                # 同时最多解析parse_workers个文件，解析完的结果放入队列，队列满时在put处等待
+                for path in remaining:
+                    running.add(pool.submit(parse_file, path))
+                    if len(running) >= parse_workers:
+                        break
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    parsed.put(future.result())
+    finally:
+        for _ in workers:
+            parsed.put(_DONE)
+        for worker in workers:
+            worker.join()
+    return results
@@ -0,0 +1,67 @@
+# 令牌桶限流器，所有线程共享同一个桶，保证对Notion API的总请求速率不超过限制
+import threading
+import time
+from config import notion_rate_limit
+
+
+class TokenBucket:
+    """线程安全的令牌桶。
+
+    被限流（429）时速率减半并暂停发放令牌，之后每次成功请求逐步恢复到初始速率，
+    这样吞吐量能稳定在限制附近，而不是在突发请求和失败之间来回摆动。
+
+    :param rate: 每秒补充的令牌数
+    :param capacity: 桶的容量，即允许的最大突发请求数
+    :param min_rate: 被限流后速率的下限，默认为初始速率的十分之一
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=None):
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate if min_rate is not None else rate / 10)
+        self.rate = self.max_rate
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last) * self.rate
+        )
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """阻塞直到取得指定数量的令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill()
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        return
+                    wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self, pause=0):
+        """收到429后调用：速率减半，并让所有线程暂停pause秒"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            # 暂停结束时恰好允许一个请求，之后按降低后的速率发放
+            self._tokens = min(1.0, self.capacity)
+            self._last = self._paused_until
+
+    def recover(self):
+        """请求成功后调用：速率按初始速率的5%逐步恢复"""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+# Notion API 的平均速率限制约为每秒3个请求
+notion_limiter = TokenBucket(rate=notion_rate_limit, capacity=notion_rate_limit)
@@ -0,0 +1,349 @@
+# 离线构建和回放：build 把解析好的页面（属性、封面、分批的块）追加写入NDJSON文件，
+# push 读取该文件并发上传到Notion，每个条目的进度记录在状态文件中，中断后从断点继续。
+# 可以在一台机器上构建，再在网络好的机器上上传，网络故障时不需要重新解析
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from notion_api import (
+    check_if_exists_and_updated,
+    create_page,
+    find_created_page,
+    get_page_properties,
+    new_page_cover,
+    new_page_properties,
+    upload_blocks_to_page,
+)
+from block_diff import get_page_blocks
+from archive_queue import archive_queue
+from markdown_parser import PARSER_VERSION, resolve_local_images
+from payload import compact, encode_json, iter_batches
+from sync_manifest import file_snapshot
+from utils import get_file_last_modified
+from metrics import metrics
+from console import echo
+from pipeline import parse_file, run_pipeline
+
+SPOOL_VERSION = 1
+
+
+def entry_id(file_hash, title, last_modified):
+    """条目的幂等键：内容、标题、修改时间和格式版本都相同的条目只会上传一次"""
+    key = f"{SPOOL_VERSION}:{PARSER_VERSION}:{file_hash}:{title}:{last_modified}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def build_entry(path, blocks, stats, snapshot):
+    """把一个文件的解析结果组成spool中的一行，snapshot为解析之前的文件状态"""
+    title = os.path.splitext(os.path.basename(path))[0]
+    last_modified = get_file_last_modified(path)
+    digest = snapshot["hash"]
+    current_time = (datetime.now() - timedelta(hours=8)).isoformat()
+    properties = compact(new_page_properties(title, current_time, last_modified), stats)
+    return {
+        "id": entry_id(digest, title, last_modified),
+        "version": SPOOL_VERSION,
+        "file": os.path.abspath(path),
+        "title": title,
+        "hash": digest,
+        "last_modified": last_modified,
+        "properties": properties,
+        "cover": new_page_cover(),
+        "chunks": list(iter_batches(blocks)),
+        "stats": stats,
+    }
+
+
+class SpoolWriter:
+    """追加写入spool文件，每个条目一行，写完立即刷新到磁盘"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.count = 0
+        self.bytes = 0
+
+    def write(self, entry):
+        line = encode_json(entry) + b"\n"
+        with self._lock:
+            with open(self.path, "ab") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.count += 1
+            self.bytes += len(line)
+
+
+def read_spool(path):
+    """读取spool的索引，同一个文件只保留最后构建的条目，返回 [(条目id, 行的偏移量)]"""
+    latest = {}
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            start, offset = offset, offset + len(line)
+            if not line.endswith(b"\n"):
+                # 构建中断时最后一行可能不完整
+                echo(f"⚠️{path}的最后一行不完整，已忽略")
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                echo(f"⚠️{path}中偏移量{start}处的条目无法解析，已忽略")
+                continue
+            latest[entry["file"]] = (entry["id"], start)
+    return list(latest.values())
+
+
+def load_entry(path, offset):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+
+class PushStatus:
+    """push的进度：条目id -> 状态。
+
+    created/updated/skipped为已完成，creating为正在创建页面，pending为正在追加块
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                echo(f"⚠️状态文件{path}读取失败，所有条目将重新上传: {e}")
+
+    def get(self, entry_id):
+        with self._lock:
+            return self._entries.get(entry_id)
+
+    def set(self, entry_id, **status):
+        with self._lock:
+            self._entries[entry_id] = dict(status, updated_at=datetime.now().isoformat())
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+def recover_created_page(database_id, api_key, entry, state):
+    """上次在创建页面时中断：页面已经创建时返回其id，否则返回None。
+
+    Notion的接口不支持幂等键，这里用标题和修改时间在数据库中查找是否已有新页面
+    """
+    return find_created_page(
+        database_id,
+        api_key,
+        entry["title"],
+        entry["last_modified"],
+        state.get("replaces"),
+    )
+
+
+def count_uploaded_chunks(api_key, page_id, chunks):
+    """根据页面中已有的块数计算已经上传了几批，无法对应到整批时返回None。
+
+    中断时正在发送的请求可能已经被Notion执行，只按状态文件继续会重复追加这一批
+    """
+    blocks = get_page_blocks(api_key, page_id)
+    if blocks is None:
+        return None
+    uploaded = 0
+    for index, chunk in enumerate(chunks):
+        if uploaded == len(blocks):
+            return index
+        uploaded += len(chunk)
+    return len(chunks) if uploaded == len(blocks) else None
+
+
+def push_entry(database_id, api_key, entry, status, title_index=None, force_update=False):
+    """上传spool中的一个条目，返回处理结果 created/updated/skipped/failed"""
+    state = status.get(entry["id"])
+    if state and state["state"] in ("created", "updated", "skipped"):
+        return "skipped"
+    title = entry["title"]
+    chunks = entry["chunks"]
+
+    def save(state, page_id, chunks_done=0):
+        status.set(
+            entry["id"],
+            state=state,
+            page_id=page_id,
+            action=action,
+            replaces=replaces,
+            chunks=chunks_done,
+        )
+
+    page_id = None
+    if state and state["state"] in ("creating", "pending"):
+        action, replaces = state["action"], state.get("replaces")
+        if state["state"] == "pending":
+            page_id, done = state["page_id"], state["chunks"]
+        else:
+            with metrics.stage("check"):
+                page_id = recover_created_page(database_id, api_key, entry, state)
+            done = 1
+        if page_id is not None:
+            # 上次上传到一半，以页面中实际的块数为准继续追加剩下的块
+            with metrics.stage("check"):
+                uploaded = count_uploaded_chunks(api_key, page_id, chunks)
+            if uploaded is not None:
+                done = uploaded
+            else:
+                echo(f"⚠️页面《{title}》的块数与spool不一致，按状态文件继续上传")
+            echo(f"页面《{title}》从第{done + 1}批继续上传")
+
+    if page_id is None:
+        with metrics.stage("check"):
+            action, page_id = check_if_exists_and_updated(
+                database_id,
+                api_key,
+                title,
+                entry["last_modified"],
+                force_update=force_update,
+                title_index=title_index,
+            )
+        if action == "error":
+            echo(f"❌检查《{title}》失败: {page_id}")
+            return "failed"
+        if action == "skip":
+            status.set(entry["id"], state="skipped", page_id=page_id)
+            echo(f"⛔无需对《{title}》内容进行更改 。")
+            return "skipped"
+
+        properties, cover, replaces = entry["properties"], entry["cover"], None
+        if action == "update":
+            with metrics.stage("properties"):
+                properties, cover = get_page_properties(database_id, api_key, page_id)
+            if not properties:
+                echo("❌获取旧属性失败，停止更新。")
+                return "failed"
+            properties["last modified"] = {"date": {"start": entry["last_modified"]}}
+            replaces = page_id
+        payload = {
+            "parent": {"database_id": database_id},
+            "properties": properties,
+            "cover": cover,
+            "children": chunks[0] if chunks else [],
+        }
+        # 先记录正在创建，创建成功但来不及记录page_id就中断时，下次可以找回这个页面
+        save("creating", None)
+        with metrics.stage("create_page"):
+            page_id = create_page(
+                database_id, api_key, payload, title, entry["last_modified"], replaces
+            )
+        if page_id is None:
+            return "failed"
+        echo(f"✅页面《{title}》创建成功")
+        if title_index is not None:
+            title_index.set(title, page_id, entry["last_modified"], replaces)
+        done = 1
+        save("pending", page_id, done)
+
+    # upload_blocks_to_page回调的是块序号，这里记录的是已完成的批数
+    progress = {"chunks": done}
+
+    def on_chunk(_):
+        progress["chunks"] += 1
+        save("pending", page_id, progress["chunks"])
+
+    start = sum(len(chunk) for chunk in chunks[:done])
+    with metrics.stage("append"):
+        appended = upload_blocks_to_page(
+            api_key, page_id, iter(chunks[done:]), start, on_chunk
+        )
+    if not appended:
+        return "failed"
+    result = "created" if action == "create" else "updated"
+    status.set(entry["id"], state=result, page_id=page_id)
+    if replaces:
+        archive_queue.add(replaces, title)
+    metrics.add_counters(entry.get("stats") or {})
+    return result
+
+
+def push_spool(
+    database_id,
+    api_key,
+    spool_path,
+    status_path=None,
+    workers=4,
+    title_index=None,
+    force_update=False,
+    manifest=None,
+):
+    """并发上传spool中每个文件最新的条目，返回 {文件路径: 处理结果}。
+
+    本地文件在构建后没有再修改时，上传成功的条目会记入同步清单manifest
+    """
+    status = PushStatus(status_path or spool_path + ".status.json")
+    entries = read_spool(spool_path)
+    results = {}
+
+    def push(offset):
+        entry = load_entry(spool_path, offset)
+        with metrics.file(entry["file"]) as record:
+            try:
+                result = push_entry(
+                    database_id, api_key, entry, status, title_index, force_update
+                )
+            except Exception as e:
+                echo(f"❌上传{entry['file']}时出错: {e}")
+                result = "failed"
+            record["status"] = result
+        if manifest is not None and result != "failed":
+            try:
+                snapshot = file_snapshot(entry["file"])
+            except OSError:
+                snapshot = None
+            if snapshot is not None and snapshot["hash"] == entry["hash"]:
+                manifest.record(
+                    entry["file"], status.get(entry["id"])["page_id"], snapshot
+                )
+        return entry["file"], result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(push, offset) for _, offset in entries]
+        for future in as_completed(futures):
+            path, result = future.result()
+            results[path] = result
+    return results
+
+
+def build_spool(paths, spool_path, parse_workers=0, queue_size=8):
+    """解析paths中的文件并追加写入spool，返回 {路径: built/failed}。
+
+    spool中保存的是图床地址，文件引用的本地图片在写入前同步到图床
+    """
+    writer = SpoolWriter(spool_path)
+    start = time.monotonic()
+
+    def write(path, blocks, stats, seconds, error, snapshot):
+        metrics.add_stage("parse", seconds)
+        if error is not None:
+            echo(f"❌解析{path}失败: {error}")
+            return "failed"
+        blocks = list(resolve_local_images(blocks))
+        with metrics.stage("spool"):
+            writer.write(build_entry(path, blocks, stats, snapshot))
+        return "built"
+
+    if parse_workers > 0 and len(paths) > 1:
+        # 只有一个线程写入spool，条目的顺序与解析完成的顺序一致
+        results = run_pipeline(
+            paths, write, min(parse_workers, len(paths)), 1, queue_size
+        )
+    else:
+        results = {path: write(*parse_file(path)) for path in paths}
+    echo(
+        f"已构建{writer.count}个页面，写入{spool_path}（{writer.bytes / 1024 / 1024:.1f}MB），"
+        f"用时{time.monotonic() - start:.1f}秒"
+    )
+    return results
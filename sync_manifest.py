@@ -0,0 +1,96 @@
+# 本地同步清单，记录每个文件上次同步时的状态，未变化的文件不再解析也不访问Notion
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+
+def file_hash(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_snapshot(file_path):
+    """在解析之前记录文件的mtime、size和内容hash，同步成功后原样记入清单。
+
+    先stat再计算hash，解析和上传期间的修改会使清单与文件不一致，下次运行时重新同步
+    """
+    stat = os.stat(file_path)
+    return {"mtime": stat.st_mtime, "size": stat.st_size, "hash": file_hash(file_path)}
+
+
+class SyncManifest:
+    """保存在JSON文件中的同步清单。
+
+    每个文件记录 mtime、size、内容hash、Notion page_id 和上次同步时间。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._files = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == self.VERSION:
+                    self._files = data.get("files", {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️同步清单{path}读取失败，将重新同步所有文件: {e}")
+
+    def get(self, file_path):
+        with self._lock:
+            return self._files.get(os.path.abspath(file_path))
+
+    def is_unchanged(self, file_path):
+        """只用stat判断文件是否与上次同步时相同，mtime变了但内容没变时只读取文件计算hash"""
+        entry = self.get(file_path)
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime == entry["mtime"]:
+            return True
+        if file_hash(file_path) != entry["hash"]:
+            return False
+        # 内容没变（例如被touch或重新检出），更新mtime，下次直接用stat判断
+        with self._lock:
+            entry["mtime"] = stat.st_mtime
+        return True
+
+    def record(self, file_path, page_id, snapshot):
+        """记录文件同步成功，snapshot为解析之前用file_snapshot取得的状态"""
+        entry = dict(snapshot, page_id=page_id, synced_at=datetime.now().isoformat())
+        with self._lock:
+            self._files[os.path.abspath(file_path)] = entry
+
+    def forget(self, file_path):
+        with self._lock:
+            self._files.pop(os.path.abspath(file_path), None)
+
+    def prune(self, existing_paths):
+        """移除已不存在的文件的记录"""
+        keep = {os.path.abspath(p) for p in existing_paths}
+        with self._lock:
+            for path in list(self._files):
+                if path not in keep:
+                    del self._files[path]
+
+    def save(self):
+        """先写临时文件再替换，避免中断时清单损坏"""
+        with self._lock:
+            data = {"version": self.VERSION, "files": dict(self._files)}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,37 @@
+# 测试直接导入仓库根目录下的模块
+import functools
+import os
+import sys
+import threading
+import uuid
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def notion_server(monkeypatch):
+    """启动本地的模拟Notion API，并让notion_http的请求都发到这里。
+
+    客户端的令牌桶换成不限流的新桶，重试的退避时间缩短到毫秒级
+    """
+    import notion_api
+    import notion_http
+    from mock_notion_server import create_server
+    from rate_limiter import TokenBucket
+
+    server = create_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    monkeypatch.setattr(
+        notion_http, "NOTION_API_URL", f"http://127.0.0.1:{server.server_address[1]}/v1"
+    )
+    monkeypatch.setattr(notion_http, "notion_limiter", TokenBucket(rate=1000))
+    fast_backoff = functools.partial(notion_http.backoff_delay, base=0.001)
+    monkeypatch.setattr(notion_http, "backoff_delay", fast_backoff)
+    monkeypatch.setattr(notion_api, "backoff_delay", fast_backoff)
+    # 数据库结构按数据库id缓存，每个测试用新的数据库
+    server.database_id = uuid.uuid4().hex
+    yield server
+    server.shutdown()
+    server.server_close()
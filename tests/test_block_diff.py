@@ -0,0 +1,208 @@
+# 增量更新的测试：plan_block_changes对比Notion中已有的块和新解析的块，生成保留、修改、删除和插入操作
+from block_diff import plan_block_changes
+
+
+def parsed(block_type, *contents, **annotations):
+    """解析得到的块：只带值为True的annotations，没有id"""
+    spans = []
+    for content in contents:
+        span = {"type": "text", "text": {"content": content}}
+        if annotations:
+            span["annotations"] = dict(annotations)
+        spans.append(span)
+    return {"object": "block", "type": block_type, block_type: {"rich_text": spans}}
+
+
+def remote(block_id, block_type, *contents, **annotations):
+    """从Notion读取的块：带id、plain_text和完整的annotations"""
+    full = {
+        "bold": False,
+        "italic": False,
+        "strikethrough": False,
+        "underline": False,
+        "code": False,
+        "color": "default",
+    }
+    full.update(annotations)
+    spans = [
+        {
+            "type": "text",
+            "text": {"content": content, "link": None},
+            "annotations": full,
+            "plain_text": content,
+        }
+        for content in contents
+    ]
+    return {
+        "object": "block",
+        "id": block_id,
+        "type": block_type,
+        block_type: {"rich_text": spans, "color": "default"},
+    }
+
+
+def image(url, block_id=None):
+    block = {"type": "image", "image": {"type": "external", "external": {"url": url}}}
+    if block_id:
+        block["id"] = block_id
+    return block
+
+
+def bookmark(url, block_id=None):
+    block = {"type": "bookmark", "bookmark": {"url": url}}
+    if block_id:
+        block["id"] = block_id
+    return block
+
+
+def kinds(ops):
+    return [(op[0], op[1] if op[0] != "insert" else None) for op in ops]
+
+
+OLD = [
+    remote("a", "heading_1", "标题"),
+    remote("b", "paragraph", "第一段"),
+    remote("c", "paragraph", "第二段"),
+    remote("d", "bulleted_list_item", "列表"),
+]
+NEW = [
+    parsed("heading_1", "标题"),
+    parsed("paragraph", "第一段"),
+    parsed("paragraph", "第二段"),
+    parsed("bulleted_list_item", "列表"),
+]
+
+
+def test_unchanged_blocks_are_kept():
+    assert plan_block_changes(OLD, NEW) == [("keep", i) for i in "abcd"]
+
+
+def test_same_content_with_different_spans_is_kept():
+    # Notion可能把相邻的同样式片段合并或拆开，只要内容和样式相同就不修改
+    old = [remote("a", "paragraph", "粗体", "文本", bold=True)]
+    new = [parsed("paragraph", "粗体文本", bold=True)]
+    assert plan_block_changes(old, new) == [("keep", "a")]
+
+
+def test_changed_annotations_are_updated():
+    old = [remote("a", "paragraph", "文本")]
+    new = [parsed("paragraph", "文本", italic=True)]
+    assert plan_block_changes(old, new) == [("update", "a", new[0])]
+
+
+def test_insert_in_the_middle():
+    new = NEW[:2] + [parsed("quote", "新的引用")] + NEW[2:]
+    ops = plan_block_changes(OLD, new)
+    assert kinds(ops) == [
+        ("keep", "a"),
+        ("keep", "b"),
+        ("insert", None),
+        ("keep", "c"),
+        ("keep", "d"),
+    ]
+    assert ops[2][1] is new[2]
+
+
+def test_insert_at_both_ends():
+    new = [parsed("paragraph", "开头")] + NEW + [parsed("paragraph", "结尾")]
+    ops = plan_block_changes(OLD, new)
+    assert kinds(ops) == [("insert", None)] + [("keep", i) for i in "abcd"] + [
+        ("insert", None)
+    ]
+
+
+def test_delete():
+    new = [NEW[0], NEW[3]]
+    assert plan_block_changes(OLD, new) == [
+        ("keep", "a"),
+        ("delete", "b"),
+        ("delete", "c"),
+        ("keep", "d"),
+    ]
+
+
+def test_delete_everything():
+    assert plan_block_changes(OLD, []) == [("delete", i) for i in "abcd"]
+
+
+def test_replace_same_type_is_updated_in_place():
+    new = NEW[:1] + [parsed("paragraph", "改过的第一段")] + NEW[2:]
+    assert plan_block_changes(OLD, new) == [
+        ("keep", "a"),
+        ("update", "b", new[1]),
+        ("keep", "c"),
+        ("keep", "d"),
+    ]
+
+
+def test_replace_different_type_is_deleted_and_inserted():
+    new = NEW[:1] + [parsed("quote", "第一段")] + NEW[2:]
+    assert plan_block_changes(OLD, new) == [
+        ("keep", "a"),
+        ("delete", "b"),
+        ("insert", new[1]),
+        ("keep", "c"),
+        ("keep", "d"),
+    ]
+
+
+def test_replace_runs_of_different_lengths():
+    # 两个旧块换成三个新块：前两个原地修改，多出的一个插入
+    new = NEW[:1] + [parsed("paragraph", f"新{i}") for i in range(3)] + NEW[3:]
+    assert plan_block_changes(OLD, new) == [
+        ("keep", "a"),
+        ("update", "b", new[1]),
+        ("update", "c", new[2]),
+        ("insert", new[3]),
+        ("keep", "d"),
+    ]
+    # 反过来，两个旧块换成一个新块：修改一个，删除一个
+    new = NEW[:1] + [parsed("paragraph", "合并")] + NEW[3:]
+    assert plan_block_changes(OLD, new) == [
+        ("keep", "a"),
+        ("update", "b", new[1]),
+        ("delete", "c"),
+        ("keep", "d"),
+    ]
+
+
+def test_changed_image_url_is_updated():
+    # 外部图片的地址可以原地修改，内容相同时保留
+    old = [remote("a", "paragraph", "图"), image("https://img/1.png", "b")]
+    new = [parsed("paragraph", "图"), image("https://img/2.png")]
+    assert plan_block_changes(old, new) == [("keep", "a"), ("update", "b", new[1])]
+    new = [parsed("paragraph", "图"), image("https://img/1.png")]
+    assert plan_block_changes(old, new) == [("keep", "a"), ("keep", "b")]
+
+
+def test_block_that_cannot_be_updated_is_replaced():
+    # 书签不能原地修改，即使类型相同也要删除后重新插入
+    old = [remote("a", "paragraph", "上"), bookmark("https://a.example", "b")]
+    new = [parsed("paragraph", "上"), bookmark("https://b.example")]
+    assert plan_block_changes(old, new) == [
+        ("keep", "a"),
+        ("delete", "b"),
+        ("insert", new[1]),
+    ]
+
+
+def test_mixed_changes_keep_document_order():
+    old = [remote(str(i), "paragraph", f"段落{i}") for i in range(6)]
+    new = [
+        parsed("paragraph", "段落0"),
+        parsed("paragraph", "段落2"),
+        parsed("paragraph", "新段落"),
+        parsed("paragraph", "段落3"),
+        parsed("heading_2", "段落4"),
+        parsed("paragraph", "段落5"),
+    ]
+    assert kinds(plan_block_changes(old, new)) == [
+        ("keep", "0"),
+        ("delete", "1"),
+        ("keep", "2"),
+        ("insert", None),
+        ("keep", "3"),
+        ("delete", "4"),
+        ("insert", None),
+        ("keep", "5"),
+    ]
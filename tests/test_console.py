@@ -0,0 +1,31 @@
+# 控制台输出的测试：多个线程同时输出时每行完整，工作线程中的行标明所属的文件
+import threading
+from console import echo
+from metrics import metrics
+
+
+def test_lines_from_threads_are_not_interleaved(capsys):
+    def worker(n):
+        with metrics.file(f"/docs/{n}.md"):
+            for i in range(50):
+                echo(f"第{i}行", "x" * 200 + "\n  第二行")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 8 * 50 * 2
+    for line in lines:
+        name, _, text = line.partition("] ")
+        assert name[0] == "[" and name[1:-3].isdigit() and name.endswith(".md")
+        assert text == "  第二行" or text.endswith(" " + "x" * 200)
+
+
+def test_main_thread_output_has_no_prefix(capsys):
+    with metrics.file("/docs/a.md"):
+        echo("消息", 1)
+    echo("汇总")
+    assert capsys.readouterr().out == "消息 1\n汇总\n"
@@ -0,0 +1,211 @@
+# 图床同步的测试：用本地的S3兼容服务代替OBS（OBS_SIGNATURE=v4、OBS_PATH_STYLE=true时的请求格式），
+# 只实现img_upload用到的接口：列举文件、上传文件和分段上传
+import os
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+import pytest
+import img_upload
+
+BUCKET = "test-bucket"
+PAGE_SIZE = 2  # 每页返回的文件数，让列举也走到分页
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}  # 文件路径 -> 内容
+        self.uploads = {}  # uploadId -> {序号: 内容}
+        self.fail_keys = set()  # 上传这些文件时返回500
+        self.fail_complete = False  # 完成分段上传时返回500，分段上传的断点记录会保留
+        self.lock = threading.Lock()
+
+
+def make_handler(s3):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _parse(self):
+            parts = urlsplit(self.path)
+            bucket, _, key = parts.path.lstrip("/").partition("/")
+            query = {name: values[0] for name, values in parse_qs(parts.query, True).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            return bucket, key, query, body
+
+        def _reply(self, status, body=b"", headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _xml(self, body):
+            data = ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode("utf-8")
+            self._reply(200, data, {"Content-Type": "application/xml"})
+
+        def do_GET(self):
+            bucket, key, query, _ = self._parse()
+            if bucket != BUCKET or key:
+                return self._reply(404)
+            prefix = query.get("prefix", "")
+            marker = query.get("marker", "")
+            with s3.lock:
+                keys = sorted(k for k in s3.objects if k.startswith(prefix) and k > marker)
+            page = keys[:PAGE_SIZE]
+            truncated = len(keys) > PAGE_SIZE
+            contents = "".join(
+                f"<Contents><Key>{escape(k)}</Key><Size>{len(s3.objects[k])}</Size>"
+                '<ETag>"0"</ETag><LastModified>2024-01-01T00:00:00.000Z</LastModified>'
+                "</Contents>"
+                for k in page
+            )
+            self._xml(
+                f"<ListBucketResult><Name>{BUCKET}</Name><Prefix>{escape(prefix)}</Prefix>"
+                f"<Marker>{escape(marker)}</Marker><MaxKeys>{PAGE_SIZE}</MaxKeys>"
+                f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+                + (f"<NextMarker>{escape(page[-1])}</NextMarker>" if truncated else "")
+                + contents
+                + "</ListBucketResult>"
+            )
+
+        def do_HEAD(self):
+            bucket, key, _, _ = self._parse()
+            exists = bucket == BUCKET and (not key or key in s3.objects)
+            self.send_response(200 if exists else 404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_PUT(self):
+            bucket, key, query, body = self._parse()
+            if key in s3.fail_keys:
+                return self._reply(500)
+            with s3.lock:
+                if "uploadId" in query:
+                    s3.uploads[query["uploadId"]][int(query["partNumber"])] = body
+                else:
+                    s3.objects[key] = body
+            self._reply(200, headers={"ETag": '"0"'})
+
+        def do_POST(self):
+            bucket, key, query, _ = self._parse()
+            if key in s3.fail_keys:
+                return self._reply(500)
+            with s3.lock:
+                if "uploads" in query:
+                    upload_id = uuid.uuid4().hex
+                    s3.uploads[upload_id] = {}
+                    return self._xml(
+                        f"<InitiateMultipartUploadResult><Bucket>{BUCKET}</Bucket>"
+                        f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+                        "</InitiateMultipartUploadResult>"
+                    )
+                if s3.fail_complete:
+                    return self._reply(500)
+                parts = s3.uploads.pop(query["uploadId"])
+                s3.objects[key] = b"".join(parts[n] for n in sorted(parts))
+            self._xml(
+                f"<CompleteMultipartUploadResult><Bucket>{BUCKET}</Bucket>"
+                f"<Key>{escape(key)}</Key><ETag>\"0\"</ETag></CompleteMultipartUploadResult>"
+            )
+
+        def do_DELETE(self):
+            _, _, query, _ = self._parse()
+            with s3.lock:
+                s3.uploads.pop(query.get("uploadId"), None)
+            self._reply(204)
+
+    return Handler
+
+
+@pytest.fixture
+def s3(monkeypatch, tmp_path):
+    fake = FakeS3()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(fake))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    for name, value in {
+        "server": f"http://127.0.0.1:{server.server_address[1]}",
+        "access_key_id": "test",
+        "secret_access_key": "test",
+        "obs_signature": "v4",
+        "obs_path_style": True,
+        "image_bucket": BUCKET,
+        "image_host_path": "blog/",
+        "image_cache_dir": str(tmp_path / "cache"),
+    }.items():
+        monkeypatch.setattr(img_upload, name, value)
+    monkeypatch.setattr(img_upload, "optimization_enabled", lambda: False)
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+def write_images(directory, contents):
+    directory.mkdir(exist_ok=True)
+    for name, data in contents.items():
+        (directory / name).write_bytes(data)
+    return str(directory)
+
+
+def key_of(data, ext):
+    return "blog/" + img_upload.hashlib.sha256(data).hexdigest() + ext
+
+
+def key_of_file(directory, name):
+    with open(os.path.join(directory, name), "rb") as f:
+        return key_of(f.read(), os.path.splitext(name)[1])
+
+
+def test_uploads_only_missing_images(s3, tmp_path):
+    images = {"a.png": b"a" * 10, "same-as-a.png": b"a" * 10, "b.jpg": b"b" * 10}
+    s3.objects[key_of(b"b" * 10, ".jpg")] = b"b" * 10
+    s3.objects["blog/unrelated.png"] = b"x"
+    s3.objects["other/a.png"] = b"x"
+    local = write_images(tmp_path / "imgs", images)
+
+    keys = img_upload.upload_imgs(local)
+
+    assert keys == {
+        name: key_of(data, os.path.splitext(name)[1]) for name, data in images.items()
+    }
+    assert s3.objects[key_of(b"a" * 10, ".png")] == b"a" * 10
+    assert len(s3.objects) == 4
+
+
+def test_failed_uploads_are_not_returned(s3, tmp_path):
+    local = write_images(tmp_path / "imgs", {"ok.png": b"ok", "bad.png": b"bad"})
+    s3.fail_keys.add(key_of(b"bad", ".png"))
+
+    keys = img_upload.upload_imgs(local)
+
+    assert keys == {"ok.png": key_of(b"ok", ".png")}
+    assert key_of(b"bad", ".png") not in s3.objects
+
+
+def test_multipart_upload(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(img_upload, "multipart_threshold", 1024)
+    data = os.urandom(4096)
+    local = write_images(tmp_path / "imgs", {"big.png": data})
+
+    keys = img_upload.upload_imgs(local)
+
+    assert s3.objects[keys["big.png"]] == data
+    assert not s3.uploads
+
+
+def test_multipart_record_is_kept_out_of_image_dir(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(img_upload, "multipart_threshold", 1024)
+    local = write_images(tmp_path / "imgs", {"big.png": os.urandom(4096)})
+    s3.fail_complete = True
+
+    assert img_upload.upload_imgs(local) == {}
+
+    # 上传失败时保留断点记录，下次继续上传；记录在图片缓存目录中，不会被当作图片或污染图片目录
+    assert os.listdir(local) == ["big.png"]
+    records = os.listdir(tmp_path / "cache" / "upload_records")
+    assert records == [os.path.basename(key_of_file(local, "big.png")) + ".upload_record"]
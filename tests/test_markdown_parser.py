@@ -0,0 +1,130 @@
+# markdown解析器的回归测试：把benchmark生成的语料和一组边界情况的解析结果与golden文件比较。
+# golden/corpus_*.json和golden/edge_cases.json是重写之前的解析器（baseline版本）的输出，
+# 行内格式解析重写后有意改变的富文本单独记录在golden/inline_changes.json中，
+# 除了其中列出的富文本，其余的块必须与旧解析器完全相同。
+# 重新生成见 tests/update_golden.py
+import json
+import os
+import pytest
+from benchmark import SECTION_GENERATORS, generate_corpus
+from markdown_parser import parse_markdown, process_plain_text
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+CORPUS_SIZE = 4096
+CORPUS_SEED = 0
+
+EDGE_CASES = [
+    "#### <u></u>",
+    "# **** ",
+    "<u></u>",
+    "**粗体** *斜体* ~~删除线~~ <u>下划线</u> `代码`",
+    "***粗斜体***",
+    "**粗体 *嵌套斜体* 粗体**",
+    "*斜体 **嵌套粗体** 斜体*",
+    "<u>**下划线粗体**</u>",
+    "**未闭合的粗体",
+    "未打开的粗体**",
+    "*未闭合 **的** 斜体",
+    "** 两侧有空格 **",
+    "2 * 3 * 4",
+    "~单个波浪线~ 和 ~~~三个~~~",
+    "`代码中的 **星号** 不解析`",
+    "`未闭合的代码",
+    "``",
+    "</u>未打开的下划线<u>",
+    "**交叉 ~~嵌套** 的~~ 标记",
+    "- 列表 **粗体**",
+    "  - 缩进列表",
+    "1. 有序列表 *斜体*",
+    "> 引用 `代码`",
+    "$$E = mc^2$$",
+    "---",
+    "![图片](https://img.example.com/a.png)",
+    "[链接](https://example.com) 和 **[粗体链接](https://example.com)**",
+]
+
+
+def normalize(value):
+    """去掉值为False或default的annotations。
+
+    旧解析器每个片段都带完整的annotations，现在只带值为True的样式（Notion的默认值相同），
+    比较前统一为后一种写法；同时经过一次JSON编解码，元组和列表的差别不影响比较
+    """
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key == "annotations":
+                item = {name: v for name, v in item.items() if v and v != "default"}
+                if not item:
+                    continue
+            result[key] = normalize(item)
+        return result
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+def parse_text(text, tmp_dir, parse=parse_markdown):
+    path = os.path.join(tmp_dir, "input.md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return normalize(parse(path))
+
+
+def corpus_text(kind):
+    return generate_corpus(kind, CORPUS_SIZE, CORPUS_SEED)
+
+
+def parse_edge_cases(tmp_dir, parse=parse_markdown):
+    """每个边界情况只有一行，解析为一个块"""
+    return {line: parse_text(line + "\n", tmp_dir, parse)[0] for line in EDGE_CASES}
+
+
+def rich_text_of(block):
+    return block[block["type"]].get("rich_text")
+
+
+def load_golden(name):
+    with open(os.path.join(GOLDEN_DIR, name + ".json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def expected_blocks(baseline, changes):
+    """旧解析器的输出，其中有意改变的块换上记录的新富文本"""
+    expected = json.loads(json.dumps(baseline))
+    for key, rich_text in changes.items():
+        index = int(key) if isinstance(expected, list) else key
+        block = expected[index]
+        assert rich_text_of(block) != rich_text, f"{key}的记录与旧解析器相同，应当删除"
+        block[block["type"]]["rich_text"] = rich_text
+    return expected
+
+
+@pytest.mark.parametrize("kind", list(SECTION_GENERATORS))
+def test_corpus(tmp_path, kind):
+    name = f"corpus_{kind}"
+    changes = load_golden("inline_changes").get(name, {})
+    expected = expected_blocks(load_golden(name), changes)
+    assert parse_text(corpus_text(kind), str(tmp_path)) == expected
+
+
+def test_edge_cases(tmp_path):
+    changes = load_golden("inline_changes").get("edge_cases", {})
+    expected = expected_blocks(load_golden("edge_cases"), changes)
+    assert parse_edge_cases(str(tmp_path)) == expected
+
+
+def test_mixed_corpus_covers_block_types(tmp_path):
+    blocks = parse_text(corpus_text("mixed"), str(tmp_path))
+    assert len({block["type"] for block in blocks}) >= 5
+
+
+def test_empty_marker_pair():
+    assert process_plain_text("<u></u>") == [{"type": "text", "text": {"content": ""}}]
+    assert process_plain_text("") == []
+
+
+def test_empty_heading(tmp_path):
+    (block,) = parse_text("#### <u></u>\n", str(tmp_path))
+    rich_text = rich_text_of(block)
+    assert rich_text[0]["text"]["content"] == ""
@@ -0,0 +1,32 @@
+# 同步前检查的测试：数据库缺少的属性无法创建时，每个文件都直接返回失败，不再查询页面
+from notion_api import check_if_exists_and_updated
+
+API_KEY = "secret_test"
+LAST_MODIFIED = "2024-05-01T10:00:00"
+
+
+def test_missing_properties_are_created(notion_server):
+    action, page_id = check_if_exists_and_updated(
+        notion_server.database_id, API_KEY, "标题", LAST_MODIFIED
+    )
+
+    assert (action, page_id) == ("create", None)
+    properties = notion_server.notion.databases[notion_server.database_id]["properties"]
+    assert properties["last modified"]["type"] == "date"
+
+
+def test_schema_failure_is_reported_and_cached(notion_server):
+    notion_server.inject_fault("databases.update", 400)
+    counts = notion_server.stats["counts"]
+
+    for title in ["a", "b"]:
+        action, message = check_if_exists_and_updated(
+            notion_server.database_id, API_KEY, title, LAST_MODIFIED
+        )
+        assert action == "error"
+        assert "last modified" in message
+
+    # 失败的结果在SCHEMA_RETRY_INTERVAL内被缓存，第二个文件不再尝试创建属性
+    assert counts["databases.update 400"] == 1
+    assert counts["databases.update 200"] == 0
+    assert counts["databases.query 200"] == 0
@@ -0,0 +1,158 @@
+# 请求重试的测试：在模拟Notion API上注入429和5xx，检查幂等请求的重试、非幂等请求只在确认
+# 没有生效后才重新发送（不会重复创建页面或追加块），以及429时按Retry-After等待并降低速率
+import time
+import pytest
+import notion_http
+from notion_api import append_chunk, create_page, new_page_properties
+from notion_http import NotionClient, get_client, is_idempotent
+
+API_KEY = "secret_test"
+LAST_MODIFIED = "2024-05-01T10:00:00"
+
+
+def count(server, endpoint, status):
+    return server.stats["counts"][f"{endpoint} {status}"]
+
+
+def paragraph(text):
+    return {
+        "object": "block",
+        "type": "paragraph",
+        "paragraph": {"rich_text": [{"type": "text", "text": {"content": text}}]},
+    }
+
+
+def new_page(server, title, children=()):
+    return {
+        "parent": {"database_id": server.database_id},
+        "properties": new_page_properties(title, "2024-05-01T02:00:00", LAST_MODIFIED),
+        "children": list(children),
+    }
+
+
+def pages_titled(server, title):
+    return [
+        page
+        for page in server.notion.pages.values()
+        if page["properties"]["title"]["title"][0]["text"]["content"] == title
+    ]
+
+
+@pytest.mark.parametrize(
+    "method, path, expected",
+    [
+        ("GET", "/pages/1", True),
+        ("DELETE", "/blocks/1", True),
+        ("POST", "/databases/1/query", True),
+        ("PATCH", "/pages/1", True),
+        ("PATCH", "/blocks/1", True),
+        ("POST", "/pages", False),
+        ("PATCH", "/blocks/1/children", False),
+    ],
+)
+def test_is_idempotent(method, path, expected):
+    assert is_idempotent(method, path) is expected
+
+
+def test_idempotent_request_is_retried_on_5xx(notion_server):
+    notion_server.inject_fault("databases.retrieve", 500)
+    notion_server.inject_fault("databases.retrieve", 503)
+
+    response = get_client(API_KEY).get(f"/databases/{notion_server.database_id}")
+
+    assert response.status_code == 200
+    assert count(notion_server, "databases.retrieve", 500) == 1
+    assert count(notion_server, "databases.retrieve", 503) == 1
+
+
+def test_retries_are_bounded(notion_server):
+    for _ in range(3):
+        notion_server.inject_fault("databases.retrieve", 502)
+
+    response = NotionClient(API_KEY, max_retries=2).get(
+        f"/databases/{notion_server.database_id}"
+    )
+
+    # 重试次数用完后返回最后一次的响应
+    assert response.status_code == 502
+    assert count(notion_server, "databases.retrieve", 502) == 3
+    assert count(notion_server, "databases.retrieve", 200) == 0
+
+
+def test_non_idempotent_request_is_not_retried_on_5xx(notion_server):
+    notion_server.inject_fault("pages.create", 500)
+
+    response = get_client(API_KEY).post("/pages", json=new_page(notion_server, "a"))
+
+    assert response.status_code == 500
+    assert count(notion_server, "pages.create", 500) == 1
+    assert count(notion_server, "pages.create", 200) == 0
+
+
+def test_non_idempotent_request_is_retried_on_429(notion_server):
+    # 被限流的请求Notion没有执行，可以直接重新发送
+    notion_server.inject_fault("pages.create", 429, retry_after=0)
+
+    response = get_client(API_KEY).post("/pages", json=new_page(notion_server, "a"))
+
+    assert response.status_code == 200
+    assert len(pages_titled(notion_server, "a")) == 1
+
+
+def test_retry_after_pauses_and_halves_the_rate(notion_server):
+    limiter = notion_http.notion_limiter
+    notion_server.inject_fault("databases.retrieve", 429, retry_after=0.3)
+
+    begin = time.monotonic()
+    response = get_client(API_KEY).get(f"/databases/{notion_server.database_id}")
+
+    assert response.status_code == 200
+    assert time.monotonic() - begin >= 0.3
+    # 速率减半，之后每次成功请求恢复初始速率的5%
+    assert limiter.rate == pytest.approx(limiter.max_rate * 0.55)
+    for _ in range(9):
+        get_client(API_KEY).get(f"/databases/{notion_server.database_id}")
+    assert limiter.rate == pytest.approx(limiter.max_rate)
+
+
+@pytest.mark.parametrize("applied", [False, True])
+def test_create_page_is_not_duplicated(notion_server, applied):
+    # applied为True时页面已经创建、但响应是502，应在数据库中找回这个页面而不是再创建一个
+    notion_server.inject_fault("pages.create", 502, applied=applied)
+    payload = new_page(notion_server, "标题", [paragraph("正文")])
+
+    page_id = create_page(
+        notion_server.database_id, API_KEY, payload, "标题", LAST_MODIFIED
+    )
+
+    pages = pages_titled(notion_server, "标题")
+    assert [page["id"] for page in pages] == [page_id]
+    assert len(notion_server.notion.children[page_id]) == 1
+    assert count(notion_server, "pages.create", 200) == (0 if applied else 1)
+
+
+@pytest.mark.parametrize("applied", [False, True])
+def test_append_chunk_is_not_duplicated(notion_server, applied):
+    response = get_client(API_KEY).post(
+        "/pages", json=new_page(notion_server, "a", [paragraph("0")])
+    )
+    page_id = response.json()["id"]
+    notion_server.inject_fault("blocks.children.append", 504, applied=applied)
+
+    assert append_chunk(API_KEY, page_id, [paragraph("1"), paragraph("2")], 1)
+
+    children = notion_server.notion.children[page_id]
+    assert len(children) == 3
+    assert count(notion_server, "blocks.children.append", 200) == (0 if applied else 1)
+
+
+def test_append_chunk_fails_when_page_has_unexpected_blocks(notion_server):
+    # 页面中的块数既不是追加前也不是追加后的数量时，无法确认请求是否生效，不再发送
+    response = get_client(API_KEY).post(
+        "/pages", json=new_page(notion_server, "a", [paragraph("0")])
+    )
+    page_id = response.json()["id"]
+    notion_server.inject_fault("blocks.children.append", 500)
+
+    assert not append_chunk(API_KEY, page_id, [paragraph("1")], 5)
+    assert count(notion_server, "blocks.children.append", 200) == 0
@@ -0,0 +1,191 @@
+# 请求体处理的测试：按Notion的限制拆分文本和块（normalize_block）、分批（iter_batches），
+# 以及处理结果再处理一次不会再变化
+import copy
+import pytest
+from benchmark import SECTION_GENERATORS, generate_corpus
+from markdown_parser import parse_markdown
+from payload import (
+    MAX_BLOCK_TEXT_BYTES,
+    MAX_BLOCKS_PER_REQUEST,
+    MAX_EQUATION_LENGTH,
+    MAX_RICH_TEXT_ITEMS,
+    MAX_TEXT_LENGTH,
+    MAX_URL_LENGTH,
+    _utf16_length,
+    compact,
+    encode_json,
+    iter_batches,
+    normalize_block,
+    normalize_blocks,
+    split_text,
+)
+
+
+def span(content, **annotations):
+    item = {"type": "text", "text": {"content": content}}
+    if annotations:
+        item["annotations"] = annotations
+    return item
+
+
+def paragraph(*spans):
+    return {"object": "block", "type": "paragraph", "paragraph": {"rich_text": list(spans)}}
+
+
+def contents(blocks):
+    return "".join(
+        s["text"]["content"] for b in blocks for s in b[b["type"]]["rich_text"]
+    )
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["", "a", "a" * MAX_TEXT_LENGTH, "a" * (MAX_TEXT_LENGTH + 1), "中" * 4500, "😀" * 1500],
+)
+def test_split_text(text):
+    pieces = split_text(text)
+    assert "".join(pieces) == text
+    assert all(0 < _utf16_length(piece) <= MAX_TEXT_LENGTH for piece in pieces)
+    # 只有最后一段可以不满
+    assert all(_utf16_length(piece) >= MAX_TEXT_LENGTH - 1 for piece in pieces[:-1])
+
+
+def test_split_text_boundaries():
+    assert split_text("a" * MAX_TEXT_LENGTH) == ["a" * MAX_TEXT_LENGTH]
+    assert [len(p) for p in split_text("a" * 4500)] == [2000, 2000, 500]
+    # emoji在UTF-16中占2个长度，每段最多1000个
+    assert [len(p) for p in split_text("😀" * 1500)] == [1000, 500]
+    # 奇数位置上的emoji不会被拆开
+    assert [len(p) for p in split_text("a" + "😀" * 1000)] == [1000, 1]
+
+
+def test_long_span_is_split_with_its_annotations():
+    stats = {}
+    block = paragraph(span("x" * 4500, bold=True), span("tail"))
+    (result,) = normalize_block(block, stats)
+    spans = result["paragraph"]["rich_text"]
+    assert [len(s["text"]["content"]) for s in spans] == [2000, 2000, 500, 4]
+    assert all(s["annotations"] == {"bold": True} for s in spans[:3])
+    assert stats == {"split_spans": 2}
+
+
+def test_too_many_spans_are_split_into_blocks():
+    stats = {}
+    count = MAX_RICH_TEXT_ITEMS * 2 + 1
+    blocks = normalize_block(paragraph(*(span(str(i)) for i in range(count))), stats)
+    assert [len(b["paragraph"]["rich_text"]) for b in blocks] == [100, 100, 1]
+    assert contents(blocks) == "".join(str(i) for i in range(count))
+    assert stats == {"split_blocks": 2}
+
+
+def test_block_text_bytes_limit():
+    # 每段2000个中文字符为6000字节，块的文本总字节数不超过MAX_BLOCK_TEXT_BYTES
+    text = "中" * (MAX_BLOCK_TEXT_BYTES // 3 + MAX_TEXT_LENGTH)
+    blocks = normalize_block(paragraph(span(text)))
+    assert len(blocks) == 2
+    assert all(
+        len(contents([b]).encode("utf-8")) <= MAX_BLOCK_TEXT_BYTES for b in blocks
+    )
+    assert contents(blocks) == text
+
+
+def test_long_link_is_dropped():
+    stats = {}
+    item = span("link")
+    item["text"]["link"] = {"url": "https://example.com/" + "a" * MAX_URL_LENGTH}
+    (result,) = normalize_block(paragraph(item), stats)
+    assert result["paragraph"]["rich_text"] == [span("link")]
+    assert stats == {"dropped_links": 1}
+
+
+def test_long_equation_becomes_code():
+    expression = "x+" * MAX_EQUATION_LENGTH
+    block = {"object": "block", "type": "equation", "equation": {"expression": expression}}
+    (result,) = normalize_block(block)
+    assert result["type"] == "code"
+    assert result["code"]["language"] == "latex"
+    assert contents([result]) == expression
+
+
+def test_long_image_url_becomes_paragraph():
+    url = "https://example.com/" + "a" * MAX_URL_LENGTH
+    block = {
+        "object": "block",
+        "type": "image",
+        "image": {"type": "external", "external": {"url": url}},
+    }
+    (result,) = normalize_block(block)
+    assert result["type"] == "paragraph"
+    assert contents([result]) == url
+
+
+def test_blocks_within_limits_are_unchanged():
+    block = paragraph(span("a" * MAX_TEXT_LENGTH), span("b", italic=True))
+    expected = copy.deepcopy(block)
+    assert normalize_block(block) == [expected]
+
+
+def oversized_blocks():
+    return [
+        paragraph(span("x" * 4500, bold=True), span("😀" * 1500)),
+        paragraph(*(span(str(i)) for i in range(250))),
+        paragraph(span("中" * (MAX_BLOCK_TEXT_BYTES // 3 + 10))),
+        {"object": "block", "type": "equation", "equation": {"expression": "y" * 1500}},
+    ]
+
+
+def corpus_blocks(tmp_path):
+    blocks = []
+    for kind in SECTION_GENERATORS:
+        path = tmp_path / f"{kind}.md"
+        path.write_text(generate_corpus(kind, 4096, 0), encoding="utf-8")
+        blocks.extend(parse_markdown(str(path)))
+    return blocks
+
+
+def test_normalize_is_idempotent(tmp_path):
+    for block in corpus_blocks(tmp_path) + oversized_blocks():
+        once = list(normalize_blocks([compact(block)]))
+        twice = list(normalize_blocks(copy.deepcopy(once)))
+        assert twice == once
+
+
+def test_compact_is_idempotent(tmp_path):
+    blocks = corpus_blocks(tmp_path)
+    compact(blocks)
+    expected = copy.deepcopy(blocks)
+    compact(blocks)
+    assert blocks == expected
+
+
+@pytest.mark.parametrize(
+    "count, sizes",
+    [
+        (0, []),
+        (1, [1]),
+        (MAX_BLOCKS_PER_REQUEST, [100]),
+        (MAX_BLOCKS_PER_REQUEST + 1, [100, 1]),
+        (250, [100, 100, 50]),
+    ],
+)
+def test_batch_block_count(count, sizes):
+    blocks = [paragraph(span(str(i))) for i in range(count)]
+    batches = list(iter_batches(blocks))
+    assert [len(batch) for batch in batches] == sizes
+    assert [b for batch in batches for b in batch] == blocks
+
+
+def test_batch_byte_limit():
+    blocks = [paragraph(span("中" * 1000)) for _ in range(30)]
+    size = len(encode_json(blocks[0])) + 1
+    max_bytes = size * 7 + size // 2
+    batches = list(iter_batches(blocks, max_bytes=max_bytes))
+    assert [len(batch) for batch in batches] == [7, 7, 7, 7, 2]
+    assert all(sum(len(encode_json(b)) + 1 for b in batch) <= max_bytes for batch in batches)
+
+
+def test_oversized_block_gets_its_own_batch():
+    small = paragraph(span("a"))
+    large = paragraph(span("b" * 1000))
+    batches = list(iter_batches([small, large, small], max_bytes=200))
+    assert batches == [[small], [large], [small]]
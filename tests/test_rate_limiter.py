@@ -0,0 +1,63 @@
+# 令牌桶的测试：突发请求、按速率发放、429后减半和暂停、逐步恢复，以及多线程共享时的总速率
+import threading
+import time
+import pytest
+from rate_limiter import TokenBucket
+
+
+def elapsed(function, *args):
+    begin = time.monotonic()
+    function(*args)
+    return time.monotonic() - begin
+
+
+def test_burst_then_rate():
+    bucket = TokenBucket(rate=20, capacity=3)
+    assert elapsed(lambda: [bucket.acquire() for _ in range(3)]) < 0.03
+    # 桶空后每个令牌等待1/20秒
+    assert elapsed(lambda: [bucket.acquire() for _ in range(4)]) == pytest.approx(
+        0.2, abs=0.05
+    )
+
+
+def test_throttle_halves_rate_and_pauses():
+    bucket = TokenBucket(rate=20, capacity=3)
+    bucket.throttle(0.2)
+    assert bucket.rate == 10
+    # 暂停结束时只允许一个请求，之后按降低后的速率发放
+    assert elapsed(bucket.acquire) == pytest.approx(0.2, abs=0.05)
+    assert elapsed(bucket.acquire) == pytest.approx(0.1, abs=0.05)
+
+
+def test_rate_does_not_drop_below_min_rate():
+    bucket = TokenBucket(rate=20, min_rate=4)
+    for _ in range(5):
+        bucket.throttle()
+    assert bucket.rate == 4
+
+
+def test_recover_is_gradual_and_capped():
+    bucket = TokenBucket(rate=20)
+    bucket.throttle()
+    bucket.recover()
+    assert bucket.rate == pytest.approx(11)
+    for _ in range(20):
+        bucket.recover()
+    assert bucket.rate == 20
+
+
+def test_threads_share_the_rate():
+    bucket = TokenBucket(rate=50, capacity=5)
+
+    def worker():
+        for _ in range(10):
+            bucket.acquire()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    begin = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 40个请求中5个来自突发容量，其余35个按每秒50个发放
+    assert time.monotonic() - begin == pytest.approx(35 / 50, abs=0.1)
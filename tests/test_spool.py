@@ -0,0 +1,115 @@
+# spool的测试：构建后push到模拟Notion API，在创建页面和追加块时中断（注入不会重试的400），
+# 再次push时从断点继续，检查没有重复的页面和块
+import json
+import pytest
+from parse_cache import parse_cache
+from spool import build_spool, push_spool, read_spool
+
+API_KEY = "secret_test"
+PARAGRAPHS = 250  # 分为100、100、50三批
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, "directory", str(tmp_path / "parse_cache"))
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    long_doc = docs / "长文.md"
+    long_doc.write_text(
+        "\n\n".join(f"第{i}段" for i in range(PARAGRAPHS)) + "\n", encoding="utf-8"
+    )
+    short_doc = docs / "短文.md"
+    short_doc.write_text("# 标题\n\n正文\n", encoding="utf-8")
+    path = str(tmp_path / "pages.ndjson")
+    results = build_spool([str(long_doc), str(short_doc)], path)
+    assert set(results.values()) == {"built"}
+    return path
+
+
+def push(server, spool_path):
+    return push_spool(server.database_id, API_KEY, spool_path, workers=2)
+
+
+def results_by_title(results):
+    return {path.rsplit("/", 1)[-1][:-3]: result for path, result in results.items()}
+
+
+def page_texts(server, title):
+    """数据库中标题为title的页面，返回每个页面中各个块的文本"""
+    notion = server.notion
+    pages = [
+        page
+        for page in notion.pages.values()
+        if page["parent"]["database_id"] == server.database_id
+        and page["properties"]["title"]["title"][0]["text"]["content"] == title
+    ]
+    return [
+        [
+            notion.blocks[i][notion.blocks[i]["type"]]["rich_text"][0]["text"]["content"]
+            for i in notion.children.get(page["id"], [])
+        ]
+        for page in pages
+    ]
+
+
+def assert_complete(server):
+    assert page_texts(server, "长文") == [[f"第{i}段" for i in range(PARAGRAPHS)]]
+    assert page_texts(server, "短文") == [["标题", "正文"]]
+
+
+def chunk_states(spool_path):
+    with open(spool_path + ".status.json", encoding="utf-8") as f:
+        return sorted((s["state"], s.get("chunks")) for s in json.load(f).values())
+
+
+def test_build_writes_one_entry_per_file(spool):
+    assert len(read_spool(spool)) == 2
+
+
+def test_push_then_push_again_skips(notion_server, spool):
+    assert results_by_title(push(notion_server, spool)) == {
+        "长文": "created",
+        "短文": "created",
+    }
+    assert_complete(notion_server)
+
+    assert set(push(notion_server, spool).values()) == {"skipped"}
+    assert notion_server.stats["counts"]["pages.create 200"] == 2
+    assert_complete(notion_server)
+
+
+def test_resume_after_failed_append(notion_server, spool):
+    # 第二批追加失败，状态文件记录已完成1批
+    notion_server.inject_fault("blocks.children.append", 400)
+    results = results_by_title(push(notion_server, spool))
+    assert results == {"长文": "failed", "短文": "created"}
+    assert ("pending", 1) in chunk_states(spool)
+
+    assert results_by_title(push(notion_server, spool)) == {
+        "长文": "created",
+        "短文": "skipped",
+    }
+    assert_complete(notion_server)
+
+
+def test_resume_after_append_applied_but_not_recorded(notion_server, spool):
+    # 第二批实际已经追加，但返回了错误：状态文件仍记录1批，继续时以页面中的块数为准
+    notion_server.inject_fault("blocks.children.append", 400, applied=True)
+    assert results_by_title(push(notion_server, spool))["长文"] == "failed"
+    assert ("pending", 1) in chunk_states(spool)
+
+    assert results_by_title(push(notion_server, spool))["长文"] == "created"
+    assert_complete(notion_server)
+
+
+@pytest.mark.parametrize("applied", [False, True])
+def test_resume_after_failed_create(notion_server, spool, applied):
+    # 创建页面的请求失败时状态为creating；页面实际已经创建时应找回它，而不是再创建一个
+    for _ in range(2):
+        notion_server.inject_fault("pages.create", 400, applied=applied)
+    assert set(push(notion_server, spool).values()) == {"failed"}
+    assert chunk_states(spool) == [("creating", 0), ("creating", 0)]
+
+    assert set(push(notion_server, spool).values()) == {"created"}
+    assert notion_server.stats["counts"]["pages.create 200"] == (0 if applied else 2)
+    assert_complete(notion_server)
@@ -0,0 +1,100 @@
+# 重新生成markdown解析器测试的golden文件，在仓库根目录运行：
+#   python tests/update_golden.py                     只更新inline_changes.json（当前解析器有意改变的富文本）
+#   python tests/update_golden.py --baseline 6cc2133  先用该版本的markdown_parser.py重新生成旧解析器的输出
+# 当前解析器与旧解析器除了富文本以外有任何不同（块的数量、类型、颜色等）都会报错，不会写入
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import types
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, TESTS_DIR)
+
+from markdown_parser import parse_markdown  # noqa: E402
+from benchmark import SECTION_GENERATORS  # noqa: E402
+from test_markdown_parser import (  # noqa: E402
+    GOLDEN_DIR,
+    corpus_text,
+    load_golden,
+    parse_edge_cases,
+    parse_text,
+    rich_text_of,
+)
+
+
+def load_parser(revision):
+    """从git中读取指定版本的markdown_parser.py，作为独立的模块加载"""
+    source = subprocess.run(
+        ["git", "show", f"{revision}:markdown_parser.py"],
+        cwd=os.path.dirname(TESTS_DIR),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    module = types.ModuleType("baseline_markdown_parser")
+    exec(compile(source, f"{revision}:markdown_parser.py", "exec"), module.__dict__)
+    return module
+
+
+def write_golden(name, data):
+    with open(os.path.join(GOLDEN_DIR, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+
+
+def parse_all(tmp_dir, parse):
+    """解析所有语料和边界情况，返回 golden文件名 -> 解析结果"""
+    results = {
+        f"corpus_{kind}": parse_text(corpus_text(kind), tmp_dir, parse)
+        for kind in SECTION_GENERATORS
+    }
+    results["edge_cases"] = parse_edge_cases(tmp_dir, parse)
+    return results
+
+
+def diff_rich_text(name, baseline, current):
+    """返回 块的位置 -> 新的富文本，富文本以外的差别直接报错"""
+    keys = range(len(baseline)) if isinstance(baseline, list) else baseline
+    if len(baseline) != len(current):
+        sys.exit(f"❌{name}: 块数从{len(baseline)}变为{len(current)}")
+    changes = {}
+    for key in keys:
+        old, new = baseline[key], current[key]
+        if old == new:
+            continue
+        old_rest = dict(old, **{old["type"]: dict(old[old["type"]], rich_text=None)})
+        new_rest = dict(new, **{new["type"]: dict(new[new["type"]], rich_text=None)})
+        if old_rest != new_rest:
+            sys.exit(f"❌{name}[{key}]: 除富文本外与旧解析器不同\n  旧: {old}\n  新: {new}")
+        changes[str(key)] = rich_text_of(new)
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--baseline", help="用该git版本的解析器重新生成旧解析器的输出")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.baseline:
+            baseline = parse_all(tmp_dir, load_parser(args.baseline).parse_markdown)
+            for name, data in baseline.items():
+                write_golden(name, data)
+        current = parse_all(tmp_dir, parse_markdown)
+
+    changes = {}
+    for name, data in current.items():
+        changed = diff_rich_text(name, load_golden(name), data)
+        if changed:
+            changes[name] = changed
+    write_golden("inline_changes", changes)
+    for name, changed in changes.items():
+        print(f"{name}: {len(changed)}个块的富文本与旧解析器不同")
+
+
+if __name__ == "__main__":
+    main()
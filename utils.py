@@ -1,6 +1,6 @@
 import os
-import requests
 from datetime import datetime, timedelta
+from console import echo
 
 def find_markdown_files(directory):
     md_files = []
@@ -22,16 +22,12 @@ def get_unique_cover_url():
     cover_url = f"https://source.unsplash.com/random/?sig={timestamp}"  # 添加时间戳作为查询参数
     return cover_url
 def archive_page(api_key, page_id,title):
-    url = f"https://api.notion.com/v1/pages/{page_id}"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28",
-    }
+    from notion_http import get_client
+
     payload = {"archived": True}
-    response = requests.patch(url, headers=headers, json=payload)
+    response = get_client(api_key).patch(f"/pages/{page_id}", json=payload)
     if response.status_code == 200:
         return True
     else:
-        print(f"❌页面《{title}》归档失败: {response.text}")
+        echo(f"❌页面《{title}》归档失败: {response.text}")
         return False
@@ -0,0 +1,198 @@
+# 监视模式：在内存中保存目录树的索引，文件新建、修改或删除后只同步变化的文件
+# Linux上安装了inotify_simple时使用inotify，否则定时用os.scandir比较文件的mtime和大小
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+def is_markdown(name):
+    return name.endswith(".md")
+
+
+def scan_tree(directory):
+    """用os.scandir遍历目录，返回 ({markdown文件路径: (mtime_ns, size)}, [所有目录])"""
+    files, dirs = {}, []
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        dirs.append(current)
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif is_markdown(entry.name) and entry.is_file():
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            # 遍历过程中被删除或没有权限的目录
+            continue
+    return files, dirs
+
+
+def diff_index(old, new):
+    """比较两次扫描的结果，返回 [(事件, 路径)]，事件为created/modified/deleted"""
+    changes = [
+        ("created" if path not in old else "modified", path)
+        for path, state in new.items()
+        if old.get(path) != state
+    ]
+    changes.extend(("deleted", path) for path in old if path not in new)
+    return changes
+
+
+class PollingWatcher:
+    """定时重新扫描目录树，与内存中的索引比较"""
+
+    def __init__(self, directory, interval=2.0):
+        self.directory = directory
+        self.interval = interval
+        self.index, _ = scan_tree(directory)
+
+    def files(self):
+        return list(self.index)
+
+    def wait(self, timeout):
+        """等待最多timeout秒，返回这段时间内的变化"""
+        time.sleep(min(timeout, self.interval))
+        new_index, _ = scan_tree(self.directory)
+        changes = diff_index(self.index, new_index)
+        self.index = new_index
+        return changes
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """通过inotify接收文件变化，不需要重新扫描整个目录树"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.inotify = INotify()
+        self.mask = (
+            flags.CREATE
+            | flags.CLOSE_WRITE
+            | flags.DELETE
+            | flags.MOVED_FROM
+            | flags.MOVED_TO
+            | flags.DELETE_SELF
+        )
+        self.watches = {}  # watch descriptor -> 目录
+        self.index, dirs = scan_tree(directory)
+        for path in dirs:
+            self._add_watch(path)
+
+    def _add_watch(self, path):
+        try:
+            wd = self.inotify.add_watch(path, self.mask)
+        except OSError:
+            return
+        self.watches[wd] = path
+
+    def files(self):
+        return list(self.index)
+
+    def _stat(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _add_tree(self, path, changes):
+        # 新建或移入的目录：监视其中所有子目录，并把已有的文件记为新建
+        files, dirs = scan_tree(path)
+        for d in dirs:
+            self._add_watch(d)
+        for file, state in files.items():
+            changes.append(("created" if file not in self.index else "modified", file))
+            self.index[file] = state
+
+    def _remove_tree(self, path, changes):
+        prefix = path + os.sep
+        for file in [f for f in self.index if f.startswith(prefix)]:
+            del self.index[file]
+            changes.append(("deleted", file))
+
+    def wait(self, timeout):
+        changes = []
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            directory = self.watches.get(event.wd)
+            if directory is None:
+                continue
+            if event.mask & flags.IGNORED:
+                self.watches.pop(event.wd, None)
+                continue
+            if event.mask & flags.DELETE_SELF:
+                continue
+            path = os.path.join(directory, event.name)
+            if event.mask & flags.ISDIR:
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    self._add_tree(path, changes)
+                elif event.mask & (flags.DELETE | flags.MOVED_FROM):
+                    self._remove_tree(path, changes)
+                continue
+            if not is_markdown(event.name):
+                continue
+            if event.mask & (flags.DELETE | flags.MOVED_FROM):
+                if self.index.pop(path, None) is not None:
+                    changes.append(("deleted", path))
+                continue
+            state = self._stat(path)
+            if state is None or state == self.index.get(path):
+                continue
+            changes.append(("created" if path not in self.index else "modified", path))
+            self.index[path] = state
+        return changes
+
+    def close(self):
+        self.inotify.close()
+
+
+def create_watcher(directory, poll_interval=2.0, use_inotify=True):
+    """优先使用inotify，不可用时（未安装inotify_simple或不是Linux）改为轮询"""
+    if use_inotify and INotify is not None:
+        try:
+            return InotifyWatcher(directory)
+        except OSError as e:
+            print(f"⚠️inotify不可用，改为每{poll_interval}秒扫描一次: {e}")
+    return PollingWatcher(directory, poll_interval)
+
+
+def watch(watcher, on_changes, debounce=1.0):
+    """持续监视文件变化，同一个文件在debounce秒内没有新的变化后才处理。
+
+    on_changes({路径: 事件})，事件为created/modified/deleted。
+    编辑器保存时常见的“删除后重新创建”会合并为一次修改。
+    """
+    pending = {}  # 路径 -> (第一次的事件, 最后一次变化的时间)
+    while True:
+        timeout = debounce
+        if pending:
+            oldest = min(t for _, t in pending.values())
+            timeout = max(0.05, oldest + debounce - time.monotonic())
+        for event, path in watcher.wait(timeout):
+            first = pending.get(path, (event, 0))[0]
+            pending[path] = (first, time.monotonic())
+
+        now = time.monotonic()
+        ready = {p: e for p, (e, t) in pending.items() if now - t >= debounce}
+        if not ready:
+            continue
+        for path in ready:
+            del pending[path]
+        changes = {}
+        for path, first in ready.items():
+            # 以文件的最终状态为准
+            if not os.path.exists(path):
+                if first != "created":
+                    changes[path] = "deleted"
+            else:
+                changes[path] = "created" if first == "created" else "modified"
+        if changes:
+            on_changes(changes)